@@ -1,13 +1,33 @@
 """Run"""
 import argparse
+import ipaddress
+import os
+import sys
 
-from dns_debugger.executors import run_tests
+from dns_debugger import cache, capture, profiling, ratelimit
+from dns_debugger.batch import run_batch
+from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.loadtest import load_test, read_query_mix, synthesize_query_mix
+from dns_debugger.ptr_sweep import MAX_IN_FLIGHT as PTR_MAX_IN_FLIGHT, sweep
+from dns_debugger.executors import run_tests, TestPlan
+from dns_debugger.query import Resolver
 from dns_debugger.ui import console
+from dns_debugger.utils import read_qnames
+from dns_debugger.watch import watch
+from dns_debugger.zone_audit import audit_zone
 
 
 def run():
     """Parse args and run"""
     args, parser = parse_args()
+    cache.configure(args.cache)
+    try:
+        capture.configure(record=args.record, replay=args.replay, reproduce_latency=args.replay_latency)
+        configure_rate_limit(args)
+    except (OSError, ValueError) as err:
+        parser.error(str(err))
+    except DnsDebuggerException as err:
+        parser.error(err.message)
 
     if args.ui == "console":
         start_console(args, parser)
@@ -15,10 +35,40 @@ def run():
     elif args.ui == "server":
         start_server()
 
+    elif args.ui == "watch":
+        start_watch(args, parser)
+
+    elif args.ui == "batch":
+        start_batch(args, parser)
+
+    elif args.ui == "ptr":
+        start_ptr_sweep(args, parser)
+
+    elif args.ui == "audit":
+        start_audit(args, parser)
+
+    elif args.ui == "load":
+        start_load_test(args, parser)
+
+
+def configure_rate_limit(args):
+    """
+    Rate limits are shared by the worker processes in batch mode, each one has its own limiter.
+    In ptr mode queries in flight are bounded by the sweep concurrency by default.
+    """
+    shares = (args.workers or os.cpu_count() or 1) if args.ui == "batch" else 1
+    default_in_flight = PTR_MAX_IN_FLIGHT if args.ui == "ptr" else ratelimit.MAX_IN_FLIGHT
+    ratelimit.configure(ip_rate=args.rate_limit / shares if args.rate_limit else None,
+                        provider_rate=args.provider_rate_limit / shares if args.provider_rate_limit else None,
+                        providers=ratelimit.read_providers(args.providers) if args.providers else None,
+                        max_in_flight=args.max_in_flight or default_in_flight,
+                        provider_in_flight=args.provider_in_flight)
+
 
 def start_server():
     """Run server mode"""
-    from dns_debugger.ui.server import APP
+    from dns_debugger.ui.server import APP, start_trust_refresher
+    start_trust_refresher()
     APP.run(host="0.0.0.0")
 
 
@@ -27,17 +77,151 @@ def start_console(args, parser):
     if not args.qname:
         parser.error("domain not entered")
     qname = args.qname
-    testsuite = run_tests(qname=qname)
+    plan = get_plan(args, parser)
+    if args.profile:
+        with profiling.profile() as profiler:
+            testsuite = run_tests(qname=qname, plan=plan)
+        profiler.write(args.profile)
+    else:
+        testsuite = run_tests(qname=qname, plan=plan)
     console.display(testsuite=testsuite, display_all=args.display_all)
 
 
+def start_watch(args, parser):
+    """Run watch mode, only changes are displayed"""
+    qnames = read_qnames(args.zones) if args.zones else []
+    if args.qname:
+        qnames.append(args.qname)
+    if not qnames:
+        parser.error("domain or zones file not entered")
+    for testcase in watch(qnames=qnames):
+        console.display_testcase(testcase=testcase)
+
+
+def start_batch(args, parser):
+    """Run batch mode, zones are sharded on several processes"""
+    if not args.zones:
+        parser.error("zones file not entered")
+    results = run_batch(qnames=read_qnames(args.zones), workers=args.workers, cache_path=args.cache,
+                        plan=get_plan(args, parser))
+    if args.output is None:
+        console.display_batch(results=results, sink=sys.stdout, display_all=args.display_all)
+        return
+    with open(args.output, "w") as sink:
+        console.display_batch(results=results, sink=sink, display_all=args.display_all)
+
+
+def start_ptr_sweep(args, parser):
+    """Run forward-confirmed reverse DNS sweep of prefixes"""
+    if not args.prefixes:
+        parser.error("prefixes not entered")
+    prefixes = args.prefixes.split(",")
+    try:
+        for prefix in prefixes:
+            ipaddress.ip_network(prefix, strict=False)
+    except ValueError as err:
+        parser.error(str(err))
+    display_stream(args, testcases=sweep(prefixes=prefixes, max_in_flight=args.max_in_flight or PTR_MAX_IN_FLIGHT))
+
+
+def start_audit(args, parser):
+    """Run DNSSEC audit of a whole zone transferred by AXFR from its primary server"""
+    if not args.qname or not args.primary:
+        parser.error("domain and primary server must be entered")
+    server, _, port = args.primary.partition("#")
+    try:
+        port = int(port) if port else 53
+        ipaddress.ip_address(server)
+    except ValueError as err:
+        parser.error(str(err))
+    display_stream(args, testcases=audit_zone(zone=args.qname, server=server, port=port, workers=args.workers))
+
+
+def start_load_test(args, parser):
+    """Run load test of a resolver, a report is displayed every second then a summary"""
+    if not args.target:
+        parser.error("target resolver not entered")
+    if not args.queries and not args.qname:
+        parser.error("queries file or domain must be entered")
+    server, _, port = args.target.partition("#")
+    try:
+        resolver = Resolver(ip_addr=server, qname=server, port=int(port) if port else None)
+        if args.queries:
+            queries = read_query_mix(args.queries)
+        else:
+            queries = synthesize_query_mix(args.qname, get_plan(args, parser).rdtypes)
+        reports = load_test(resolver=resolver, queries=queries, qps=args.qps, duration=args.duration)
+    except ValueError as err:
+        parser.error(str(err))
+    except DnsDebuggerException as err:
+        parser.error(err.message)
+    if args.output is None:
+        console.display_reports(reports=reports, sink=sys.stdout)
+        return
+    with open(args.output, "w") as sink:
+        console.display_reports(reports=reports, sink=sink)
+
+
+def display_stream(args, testcases):
+    """Write streamed testcases to the output file or stdout"""
+    if args.output is None:
+        console.display_stream(testcases=testcases, sink=sys.stdout, display_all=args.display_all)
+        return
+    with open(args.output, "w") as sink:
+        console.display_stream(testcases=testcases, sink=sink, display_all=args.display_all)
+
+
+def get_plan(args, parser) -> TestPlan:
+    """Tests, record types and resolvers selected"""
+    try:
+        return TestPlan.from_strings(tests=args.tests, rdtypes=args.rdtypes, resolvers=args.resolvers)
+    except DnsDebuggerException as err:
+        parser.error(err.message)
+
+
 def parse_args():
     """Parse cmd arguments"""
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--domain", dest="qname",
                         help="FQDN of the DNS zone you want to test")
     parser.add_argument("-x", "--ui", dest="ui", default="console",
-                        help="Wanted display console|server")
+                        help="Wanted display console|server|watch|batch|ptr|audit|load")
+    parser.add_argument("--zones", dest="zones", help="File containing one zone per line (watch and batch modes)")
+    parser.add_argument("--workers", dest="workers", type=int,
+                        help="Number of worker processes in batch and audit modes (default number of CPUs)")
+    parser.add_argument("--prefixes", dest="prefixes",
+                        help="Comma separated IPv4/IPv6 prefixes to sweep in ptr mode")
+    parser.add_argument("--primary", dest="primary", metavar="IP[#PORT]",
+                        help="Server the zone is transferred from in audit mode")
+    parser.add_argument("--target", dest="target", metavar="IP[#PORT]", help="Resolver load tested in load mode")
+    parser.add_argument("--queries", dest="queries",
+                        help="File containing one 'qname type' query per line replayed in load mode "
+                             "(default the record types of the domain)")
+    parser.add_argument("--qps", dest="qps", type=float, default=1000, help="Queries per second in load mode")
+    parser.add_argument("--duration", dest="duration", type=float, default=10,
+                        help="Duration of the load test in seconds")
+    parser.add_argument("--output", dest="output",
+                        help="File where testcases or reports are written as json lines in batch, ptr, audit and "
+                             "load modes (default stdout)")
+    parser.add_argument("--cache", dest="cache", default=os.environ.get(cache.CACHE_ENV),
+                        help="Persistent cache file, shared between processes (default ${})".format(cache.CACHE_ENV))
+    parser.add_argument("--tests", dest="tests",
+                        help="Comma separated tests to run (default all): simple_query,recursive_query,"
+                             "dnssec_validation,consistency")
+    parser.add_argument("--types", dest="rdtypes", help="Comma separated record types queried by simple_query")
+    parser.add_argument("--resolvers", dest="resolvers",
+                        help="Comma separated resolvers used by simple_query: IP, tls://IP (DNS over TLS) or "
+                             "https://IP (DNS over HTTPS), followed by #PORT if needed, 'default' for the default "
+                             "resolver")
+    parser.add_argument("--record", dest="record", metavar="CAPTURE",
+                        help="Append every query and response exchanged to a capture file")
+    parser.add_argument("--replay", dest="replay", metavar="CAPTURE",
+                        help="Answer queries from a capture file instead of the network")
+    parser.add_argument("--replay-latency", dest="replay_latency", action="store_true",
+                        help="Reproduce the recorded latencies when replaying a capture")
+    add_rate_limit_arguments(parser)
+    parser.add_argument("--profile", dest="profile", metavar="PREFIX",
+                        help="Profile the check, write PREFIX.stages.json and PREFIX.collapsed (flamegraph)")
     parser.add_argument("--all", dest="display_all", help="Display all testcases", action='store_true')
     parser.add_argument("--failures", dest="display_all", help="Display only testcases in failure",
                         action='store_false')
@@ -46,5 +230,24 @@ def parse_args():
     return args, parser
 
 
+def add_rate_limit_arguments(parser):
+    """Arguments of the rate limiter"""
+    parser.add_argument("--rate-limit", dest="rate_limit", type=float, metavar="QPS",
+                        help="Maximum queries per second sent to each server IP")
+    parser.add_argument("--provider-rate-limit", dest="provider_rate_limit", type=float, metavar="QPS",
+                        help="Maximum queries per second sent to each provider, servers in the same /24 or /48 "
+                             "network are considered of the same provider unless --providers is given")
+    parser.add_argument("--providers", dest="providers", metavar="FILE",
+                        help="File containing one 'provider prefix [prefix ...]' line per provider, "
+                             "used by --provider-rate-limit")
+    parser.add_argument("--max-in-flight", dest="max_in_flight", type=int, metavar="N",
+                        help="Maximum queries in flight when rate limited, and concurrency of the ptr sweep "
+                             "(default {}, {} in ptr mode)".format(ratelimit.MAX_IN_FLIGHT, PTR_MAX_IN_FLIGHT))
+    parser.add_argument("--provider-in-flight", dest="provider_in_flight", type=int, metavar="N",
+                        default=ratelimit.PROVIDER_IN_FLIGHT,
+                        help="Maximum queries in flight to each provider when rate limited (default {})".format(
+                            ratelimit.PROVIDER_IN_FLIGHT))
+
+
 if __name__ == "__main__":
     run()
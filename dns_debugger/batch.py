@@ -0,0 +1,96 @@
+"""Batch mode, run the tests of a list of zones sharded on several processes"""
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dns_debugger import LOGGER, cache
+from dns_debugger.executors import run_tests, TestPlan
+from dns_debugger.executors.testsuite import TestSuite, TestCase
+
+WINDOW_PER_WORKER = 2
+
+
+def _run_worker(qname: str, cache_path: Optional[str], plan: Optional[TestPlan]) -> TestSuite:
+    """Run in a worker process, the persistent cache is opened once per process"""
+    if cache_path is not None and cache.get_cache() is None:
+        cache.configure(cache_path)
+    return run_tests(qname=qname, plan=plan)
+
+
+def _failed_suite(qname: str, message: str) -> TestSuite:
+    testsuite = TestSuite()
+    testsuite.add_testcase(TestCase(description="Running tests for {}".format(qname), result=message, success=False))
+    return testsuite
+
+
+def run_batch(qnames: List[str], workers: Optional[int] = None, cache_path: Optional[str] = None,
+              plan: Optional[TestPlan] = None) -> Iterator[Tuple[str, TestSuite]]:
+    """
+    Run tests for each qname on a pool of processes
+    Results are yielded in the qnames order, at most WINDOW_PER_WORKER qnames per worker are submitted ahead of the
+    one yielded, so memory does not grow with the number of qnames. If a worker crashes, the qnames which were
+    running are run again, each one in its own process to find the culprit, then the pool is restarted for the
+    remaining qnames.
+    """
+    workers = workers or os.cpu_count()
+    done: Dict[int, TestSuite] = {}
+    next_index = 0
+
+    while next_index < len(qnames):
+        suspects = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures: Dict[int, Future] = {}
+            try:
+                submitted = next_index
+                while next_index < len(qnames):
+                    while submitted < len(qnames) and len(futures) < workers * WINDOW_PER_WORKER:
+                        if submitted not in done:
+                            futures[submitted] = pool.submit(_run_worker, qnames[submitted], cache_path, plan)
+                        submitted += 1
+                    yield qnames[next_index], _take_result(qnames[next_index], next_index, futures, done)
+                    next_index += 1
+            except BrokenProcessPool:
+                LOGGER.critical("A batch worker crashed, restarting the pool")
+                suspects = _collect_after_crash(qnames, futures, done)
+        for index in suspects[:workers]:
+            done[index] = _run_isolated(qnames[index], cache_path, plan)
+
+
+def _take_result(qname: str, index: int, futures: Dict[int, Future], done: Dict[int, TestSuite]) -> TestSuite:
+    """Result of a qname, nothing keeps it once it is returned"""
+    if index in done:
+        return done.pop(index)
+    result = _get_result(qname, futures[index])
+    del futures[index]
+    return result
+
+
+def _get_result(qname: str, future) -> TestSuite:
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        raise
+    except Exception as exc:  # pylint: disable=broad-except
+        LOGGER.exception("Tests for %s failed", qname)
+        return _failed_suite(qname=qname, message="Unexpected error: {}".format(exc))
+
+
+def _collect_after_crash(qnames, futures, done) -> List[int]:
+    """Keep results already computed, return the unfinished qnames indexes"""
+    unfinished = []
+    for index, future in sorted(futures.items()):
+        if future.done() and not isinstance(future.exception(), BrokenProcessPool):
+            done[index] = _get_result(qnames[index], future)
+        else:
+            unfinished.append(index)
+    return unfinished
+
+
+def _run_isolated(qname: str, cache_path: Optional[str], plan: Optional[TestPlan]) -> TestSuite:
+    """Run tests for a qname in a dedicated process, a crash only impacts this qname"""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        try:
+            return _get_result(qname, pool.submit(_run_worker, qname, cache_path, plan))
+        except BrokenProcessPool:
+            return _failed_suite(qname=qname, message="Worker process crashed")
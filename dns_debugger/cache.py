@@ -0,0 +1,111 @@
+"""Persistent cache, shared by all processes of a host"""
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from dns_debugger import LOGGER
+
+PURGE_EVERY = 1000
+CACHE_ENV = "DNS_DEBUGGER_CACHE"
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL NOT NULL, wire BLOB NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS rrsets (zone TEXT NOT NULL, rdtype INTEGER NOT NULL, expires REAL NOT NULL, "
+    "records TEXT NOT NULL, PRIMARY KEY (zone, rdtype))",
+]
+
+
+class SqliteCache:
+    """
+    Cache backed by a SQLite database in WAL mode, it holds
+     * DNS responses, expiring with their TTL
+     * validated DNSKEY/DS RRSETs, expiring with their TTL or their RRSIG expiration
+    """
+
+    def __init__(self, path: str, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+        self._writes = 0
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            connection.execute(statement)
+
+    def _connection(self) -> sqlite3.Connection:
+        """SQLite connections cannot be shared between threads, one is opened per thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def response_key(server: str, qname: str, rdtype: int, want_dnssec: bool) -> str:
+        """Key of a response in the cache"""
+        return "{}|{}|{}|{:d}".format(server, str(qname).lower(), rdtype, want_dnssec)
+
+    def get_response(self, key: str):
+        """Get a response wire and its remaining TTL, None if missing or expired"""
+        row = self._connection().execute("SELECT expires, wire FROM responses WHERE key = ? AND expires > ?",
+                                         (key, self.clock())).fetchone()
+        if row is None:
+            return None
+        expires, wire = row
+        return bytes(wire), int(expires - self.clock())
+
+    def set_response(self, key: str, wire: bytes, ttl: int):
+        """Store a response wire for ttl seconds"""
+        if ttl <= 0:
+            return
+        self._write("INSERT OR REPLACE INTO responses (key, expires, wire) VALUES (?, ?, ?)",
+                    (key, self.clock() + ttl, wire))
+
+    def get_rrset(self, zone: str, rdtype: int) -> Optional[List[str]]:
+        """Get a validated RRSET as a list of rdata in text format, None if missing or expired"""
+        row = self._connection().execute("SELECT records FROM rrsets WHERE zone = ? AND rdtype = ? AND expires > ?",
+                                         (zone.lower(), rdtype, self.clock())).fetchone()
+        if row is None:
+            return None
+        return row[0].split("\n")
+
+    def set_rrset(self, zone: str, rdtype: int, records: List[str], expires: float):
+        """Store a validated RRSET until the expires timestamp"""
+        if expires <= self.clock():
+            return
+        self._write("INSERT OR REPLACE INTO rrsets (zone, rdtype, expires, records) VALUES (?, ?, ?, ?)",
+                    (zone.lower(), rdtype, expires, "\n".join(records)))
+
+    def _write(self, statement: str, params: tuple):
+        connection = self._connection()
+        connection.execute(statement, params)
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            self.purge()
+
+    def purge(self):
+        """Remove expired entries"""
+        now = self.clock()
+        connection = self._connection()
+        connection.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        connection.execute("DELETE FROM rrsets WHERE expires <= ?", (now,))
+
+
+_CACHE: Optional[SqliteCache] = None
+
+
+def configure(path: Optional[str]):
+    """Enable the persistent cache stored in path, disable it if path is None"""
+    global _CACHE  # pylint: disable=global-statement
+    if path is None:
+        _CACHE = None
+        return
+    LOGGER.info("Using persistent cache %s", path)
+    _CACHE = SqliteCache(path=path)
+
+
+def get_cache() -> Optional[SqliteCache]:
+    """Get the configured cache, None if disabled"""
+    return _CACHE
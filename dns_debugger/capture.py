@@ -0,0 +1,142 @@
+"""Capture of query/response traffic to a file, and deterministic replay of a capture instead of the network"""
+import collections
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import dns.exception
+import dns.flags
+import dns.message
+
+from dns_debugger import LOGGER
+from dns_debugger.exceptions import DnsDebuggerException, QueryTimeException
+
+# version 2 records the transport and port of every server
+MAGIC = b"DNSCAP2\n"
+# server, query and response lengths, then RTT in seconds
+RECORD_HEADER = struct.Struct("!HHHd")
+
+# offset of the response wire and RTT of a recorded exchange
+Exchange = Tuple[int, int, float]
+
+
+def endpoint(transport: str, resolver_ip: str, port: int) -> str:
+    """Server of an exchange, with its transport and port so that the services of an address are told apart"""
+    return "{}://{}#{:d}".format(transport, resolver_ip, port)
+
+
+def exchange_key(server: str, message) -> str:
+    """
+    Key of an exchange with a server endpoint, the query ID and EDNS buffer size are ignored so retried queries match
+    """
+    question = message.question[0]
+    return "{}|{}|{}|{:d}|{:d}".format(server, question.name.to_text().lower(), question.rdtype,
+                                       bool(message.ednsflags & dns.flags.DO), bool(message.flags & dns.flags.RD))
+
+
+class Recorder:
+    """
+    Append each exchange to a capture file, one write per exchange on a file opened in append mode
+    so that threads and batch worker processes can share the same file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size == 0:
+            os.write(self._fd, MAGIC)
+
+    def record(self, server: str, query: bytes, response: bytes, rtt: float):
+        """Append an exchange, the response is empty if the query timed out"""
+        server_wire = server.encode()
+        os.write(self._fd, RECORD_HEADER.pack(len(server_wire), len(query), len(response), rtt) +
+                 server_wire + query + response)
+
+    def close(self):
+        """Close the capture file"""
+        os.close(self._fd)
+
+
+class Replay:
+    """
+    Answer queries from a capture file mapped in memory, an index of the exchanges by key is built when it is opened.
+    Exchanges recorded several times for a key are replayed in order, then again from the first one.
+    """
+
+    def __init__(self, path: str, reproduce_latency: bool = False):
+        self.path = path
+        self.reproduce_latency = reproduce_latency
+        with open(path, "rb") as capture_file:
+            self._map = mmap.mmap(capture_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise DnsDebuggerException(message="{} is not a capture file".format(path))
+        self._index: Dict[str, List[Exchange]] = collections.defaultdict(list)
+        self._next: Dict[str, int] = collections.defaultdict(int)
+        self._lock = threading.Lock()
+        self._build_index()
+
+    def _build_index(self):
+        offset = len(MAGIC)
+        while offset + RECORD_HEADER.size <= len(self._map):
+            server_len, query_len, response_len, rtt = RECORD_HEADER.unpack_from(self._map, offset)
+            offset += RECORD_HEADER.size
+            if offset + server_len + query_len + response_len > len(self._map):
+                LOGGER.warning("Truncated exchange at the end of capture %s", self.path)
+                break
+            server = self._map[offset:offset + server_len].decode()
+            query = dns.message.from_wire(self._map[offset + server_len:offset + server_len + query_len])
+            offset += server_len + query_len
+            self._index[exchange_key(server, query)].append((offset, response_len, rtt))
+            offset += response_len
+        LOGGER.info("Capture %s indexed, %d distinct queries", self.path, len(self._index))
+
+    def exchange(self, server: str, message):
+        """Get the recorded response to a query, its ID is set to the query ID"""
+        key = exchange_key(server, message)
+        with self._lock:
+            exchanges = self._index.get(key)
+            if not exchanges:
+                raise QueryTimeException(message="No response recorded for {}".format(key))
+            offset, length, rtt = exchanges[self._next[key] % len(exchanges)]
+            self._next[key] += 1
+        if self.reproduce_latency:
+            time.sleep(rtt)
+        if not length:
+            raise QueryTimeException(message="Timeout recorded for {}".format(key))
+        wire = struct.pack("!H", message.id) + self._map[offset + 2:offset + length]
+        try:
+            return dns.message.from_wire(wire)
+        except dns.exception.DNSException as err:
+            raise DnsDebuggerException(message="Invalid response recorded for {}: {}".format(key, err))
+
+    def close(self):
+        """Unmap the capture file"""
+        self._map.close()
+
+
+_RECORDER: Optional[Recorder] = None
+_REPLAY: Optional[Replay] = None
+
+
+def configure(record: Optional[str] = None, replay: Optional[str] = None, reproduce_latency: bool = False):
+    """Record exchanges to a capture file, or replay them from one, both are disabled when paths are None"""
+    global _RECORDER, _REPLAY  # pylint: disable=global-statement
+    if record is not None and replay is not None:
+        raise DnsDebuggerException(message="A capture cannot be recorded and replayed at the same time")
+    _RECORDER = Recorder(path=record) if record is not None else None
+    _REPLAY = Replay(path=replay, reproduce_latency=reproduce_latency) if replay is not None else None
+    if record is not None:
+        LOGGER.info("Recording exchanges to %s", record)
+
+
+def get_recorder() -> Optional[Recorder]:
+    """Get the configured recorder, None if disabled"""
+    return _RECORDER
+
+
+def get_replay() -> Optional[Replay]:
+    """Get the configured replay, None if disabled"""
+    return _REPLAY
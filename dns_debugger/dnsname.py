@@ -0,0 +1,105 @@
+"""Interned DNS names, parsed once with their canonical wire form, labels and parents"""
+import functools
+import threading
+import weakref
+from typing import Optional, Tuple
+
+import dns.exception
+import dns.name
+
+from dns_debugger.exceptions import DnsDebuggerException
+
+
+@functools.total_ordering
+class DnsName:
+    """
+    Absolute DNS name in canonical form (lowercase), instances are interned so a name is parsed once whatever its
+    spelling, its parents are interned with it and kept alive by their children
+    >>> name = DnsName.from_text("WWW.dnstests.fr")
+    >>> name.text, name.wire, name.labels
+    ('www.dnstests.fr.', b'\\x03www\\x08dnstests\\x02fr\\x00', ('www', 'dnstests', 'fr'))
+    >>> name.parent is DnsName.from_text("dnstests.fr.")
+    True
+    >>> [zone.text for zone in name.lineage]
+    ['.', 'fr.', 'dnstests.fr.', 'www.dnstests.fr.']
+    >>> DnsName.from_text("z.a.fr.") < DnsName.from_text("b.fr.")
+    True
+    """
+
+    __slots__ = ("text", "wire", "labels", "parent", "_lineage", "_key", "__weakref__")
+
+    _interned: 'weakref.WeakValueDictionary[str, DnsName]' = weakref.WeakValueDictionary()
+    _lock = threading.RLock()
+
+    def __init__(self, labels: Tuple[str, ...], wire: bytes, text: str, parent: Optional['DnsName']):
+        self.labels = labels
+        self.wire = wire
+        self.text = text
+        self.parent = parent
+        self._lineage: Optional[Tuple[DnsName, ...]] = None
+        self._key: Optional[Tuple[bytes, ...]] = None
+
+    @classmethod
+    def from_text(cls, text: str) -> 'DnsName':
+        """Get the interned name of a text, relative names are taken from the root"""
+        name = cls._interned.get(text)
+        if name is not None:
+            return name
+        try:
+            parsed = dns.name.from_text(text)
+        except dns.exception.DNSException as err:
+            raise DnsDebuggerException(message="Invalid name {}: {}".format(text, err))
+        with cls._lock:
+            name = cls._intern(parsed)
+            cls._interned[text] = name
+        return name
+
+    @classmethod
+    def _intern(cls, parsed: dns.name.Name) -> 'DnsName':
+        """Interned name of a parsed name, its parents are interned first, must be called with the lock held"""
+        canonical = parsed.to_text().lower()
+        name = cls._interned.get(canonical)
+        if name is None:
+            parent = cls._intern(parsed.parent()) if len(parsed.labels) > 1 else None
+            name = cls(labels=tuple(label.decode("ascii", "backslashreplace").lower() for label in parsed.labels[:-1]),
+                       wire=parsed.to_digestable(), text=canonical, parent=parent)
+            cls._interned[canonical] = name
+        return name
+
+    @property
+    def lineage(self) -> Tuple['DnsName', ...]:
+        """Names from the root to this one"""
+        if self._lineage is None:
+            self._lineage = (self.parent.lineage if self.parent is not None else ()) + (self,)
+        return self._lineage
+
+    @property
+    def canonical_key(self) -> Tuple[bytes, ...]:
+        """Labels from the root, for the canonical order of RFC 4034 section 6.1"""
+        if self._key is None:
+            labels = []
+            offset = 0
+            while self.wire[offset]:
+                labels.append(self.wire[offset + 1:offset + 1 + self.wire[offset]])
+                offset += 1 + self.wire[offset]
+            self._key = tuple(reversed(labels))
+        return self._key
+
+    def is_subdomain(self, other: 'DnsName') -> bool:
+        """Is this name equal to or below other"""
+        return other in self.lineage
+
+    def __eq__(self, other):
+        return isinstance(other, DnsName) and self.text == other.text
+
+    def __lt__(self, other: 'DnsName'):
+        return self.canonical_key < other.canonical_key
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return "DnsName({!r})".format(self.text)
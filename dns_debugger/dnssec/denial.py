@@ -0,0 +1,176 @@
+"""Authenticated denial of existence, NSEC and NSEC3"""
+import base64
+import bisect
+import functools
+import hashlib
+from typing import Dict, List, Optional
+
+from dns_debugger import LOGGER
+from dns_debugger.dnsname import DnsName
+from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.models import ChainOfTrust
+from dns_debugger.profiling import stage
+from dns_debugger.records_models import RRSet, DataType, NSEC3, B32_TO_B32HEX
+
+NSEC3_SHA1 = 1
+NSEC3_HASH_CACHE_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=NSEC3_HASH_CACHE_SIZE)
+def nsec3_hash(qname: str, salt: bytes, iterations: int, algorithm: int = NSEC3_SHA1) -> str:
+    """
+    NSEC3 owner hash of a qname in base32hex, memoized as high iterations counts are CPU heavy
+    >>> nsec3_hash("example.", salt=bytes.fromhex("aabbccdd"), iterations=12)
+    '0P9MHAVEQVM6T7VBL5LOP2U3T2RP3TOM'
+    """
+    if algorithm != NSEC3_SHA1:
+        raise DnsDebuggerException(message="NSEC3 hash algorithm {} not supported".format(algorithm))
+    with stage("nsec3_hash"):
+        digest = hashlib.sha1(DnsName.from_text(qname).wire + salt).digest()
+        for _ in range(iterations):
+            digest = hashlib.sha1(digest + salt).digest()
+    return str(base64.b32encode(digest), 'ascii').translate(B32_TO_B32HEX)
+
+
+def covers(owner_hash: str, next_hash: str, name_hash: str) -> bool:
+    """
+    Is the hashed name between the owner hash and the next hash of a NSEC3 record
+    >>> covers("2", "5", "3"), covers("8", "2", "9"), covers("8", "2", "1"), covers("2", "5", "6")
+    (True, True, True, False)
+    """
+    if owner_hash < name_hash < next_hash:
+        return True
+    # last NSEC3 of the chain, next hash is the first one
+    return next_hash <= owner_hash and (name_hash > owner_hash or name_hash < next_hash)
+
+
+class Nsec3Chain:
+    """
+    NSEC3 records of a response for a zone and a set of hash parameters, sorted by owner hash for O(log n) matching
+    and covering lookups when many names of the zone are checked against them
+    """
+
+    def __init__(self):
+        self._hashes: List[str] = []
+        self._records: Dict[str, NSEC3] = {}
+
+    def add(self, owner_hash: str, record: NSEC3):
+        """Add a validated NSEC3 record to the chain"""
+        if owner_hash not in self._records:
+            bisect.insort(self._hashes, owner_hash)
+        self._records[owner_hash] = record
+
+    def matching(self, name_hash: str) -> Optional[NSEC3]:
+        """NSEC3 record whose owner is the hashed name"""
+        return self._records.get(name_hash)
+
+    def covering(self, name_hash: str) -> Optional[NSEC3]:
+        """
+        NSEC3 record whose owner hash and next hash surround the hashed name. Spans of a chain do not overlap, so
+        only the closest owner hash before the name can cover it, the last one when the name is before all of them.
+        """
+        if not self._hashes:
+            return None
+        owner_hash = self._hashes[bisect.bisect_right(self._hashes, name_hash) - 1]
+        record = self._records[owner_hash]
+        return record if covers(owner_hash, record.next_hash, name_hash) else None
+
+    def __len__(self):
+        return len(self._hashes)
+
+
+def validate_ds_denial(qname: str, denial: List[RRSet], chain_of_trust: ChainOfTrust) -> str:
+    """
+    Check the NSEC/NSEC3 records received with a NOERROR answer without DS prove there is no DS for qname:
+    qname must be an insecure delegation, or be covered by an opt-out NSEC3 span
+    :return: why the absence of DS record is proven
+    """
+    if not denial:
+        raise DnsDebuggerException(message="No DS record for {} and no NSEC/NSEC3 record to prove it, "
+                                           "answer may have been stripped".format(qname))
+    for rrset in denial:
+        if not rrset.is_signed():
+            raise DnsDebuggerException(message="Denial of existence for {} is not signed".format(qname))
+        if not rrset.is_valid(chain_of_trust):
+            raise DnsDebuggerException(message="Denial of existence for {} is not validated by its RRSIG".format(
+                qname))
+
+    if all(rrset.rdtype == DataType.NSEC.value for rrset in denial):
+        return _check_nsec(qname=qname, denial=denial)
+    return _check_nsec3(qname=qname, denial=[rrset for rrset in denial if rrset.rdtype == DataType.NSEC3.value])
+
+
+def _check_types(qname: str, types) -> str:
+    if DataType.DS.value in types:
+        raise DnsDebuggerException(message="Denial of existence for {} lists a DS record".format(qname))
+    if DataType.SOA.value in types:
+        raise DnsDebuggerException(message="Denial of existence for {} comes from the child zone".format(qname))
+    if DataType.NS.value not in types:
+        raise DnsDebuggerException(message="Denial of existence for {} does not list a NS record, "
+                                           "it is not a delegation".format(qname))
+    return "{} is an insecure delegation".format(qname)
+
+
+def _nonexistence(qname: str, kind: str) -> DnsDebuggerException:
+    return DnsDebuggerException(message="{} records prove {} does not exist, which contradicts the NOERROR "
+                                        "answer".format(kind, qname))
+
+
+def _check_nsec(qname: str, denial: List[RRSet]) -> str:
+    name = DnsName.from_text(qname)
+    for rrset in denial:
+        owner = rrset.owner
+        for record in rrset.records:
+            next_name = DnsName.from_text(record.next_name)
+            if owner == name:
+                return "NSEC proves " + _check_types(qname, record.types)
+            if owner < name < next_name or (next_name <= owner and (name > owner or name < next_name)):
+                raise _nonexistence(qname, "NSEC")
+    raise DnsDebuggerException(message="NSEC records do not prove there is no DS for {}".format(qname))
+
+
+def _check_nsec3(qname: str, denial: List[RRSet]) -> str:
+    zone = DnsName.from_text(denial[0].rrsig[0].signer)
+    params = denial[0].records[0]
+    chain = _response_chain(zone, params, denial)
+
+    def find(name: str, covering: bool = False) -> Optional[NSEC3]:
+        name_hash = nsec3_hash(name, salt=params.salt, iterations=params.iterations, algorithm=params.algorithm)
+        return chain.covering(name_hash) if covering else chain.matching(name_hash)
+
+    matching = find(qname)
+    if matching is not None:
+        return "NSEC3 proves " + _check_types(qname, matching.types)
+    covering = _next_closer_covering(qname, zone, find)
+    if covering is None:
+        raise DnsDebuggerException(message="NSEC3 records do not prove there is no DS for {}".format(qname))
+    if covering.is_opt_out():
+        return "NSEC3 opt-out proves {} is an insecure delegation".format(qname)
+    raise _nonexistence(qname, "NSEC3")
+
+
+def _next_closer_covering(qname: str, zone: DnsName, find) -> Optional[NSEC3]:
+    """Closest encloser proof: an ancestor of qname matches, the record covering the next closer name is returned"""
+    names = [name.text for name in DnsName.from_text(qname).lineage if name.is_subdomain(zone)]
+    for index in range(len(names) - 2, -1, -1):
+        if find(names[index]) is None:
+            continue
+        LOGGER.debug("Closest encloser of %s is %s", qname, names[index])
+        return find(names[index + 1], covering=True)
+    return None
+
+
+def _response_chain(zone: DnsName, params: NSEC3, denial: List[RRSet]) -> Nsec3Chain:
+    """
+    Chain of the NSEC3 records of the response owned by the zone with the hash parameters of the first one, only
+    the validated records of this response can prove the denial
+    """
+    chain = Nsec3Chain()
+    for rrset in denial:
+        if rrset.owner.parent != zone:
+            continue
+        owner_hash = rrset.owner.labels[0].upper()
+        for record in rrset.records:
+            if (record.algorithm, record.salt, record.iterations) == (params.algorithm, params.salt, params.iterations):
+                chain.add(owner_hash, record)
+    return chain
@@ -0,0 +1,135 @@
+"""Background refresh of the trust material, root and TLD DS/DNSKEY RRSETs are validated again before they expire"""
+import threading
+import time
+from typing import Dict, List, Optional
+
+from dns_debugger import LOGGER
+from dns_debugger.dnsname import DnsName
+from dns_debugger.dnssec.utils import VALIDATED_RRSETS, ValidatedRRSets, load_validated_rrset, validate_zone_keys
+from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.models import ChainOfTrust
+from dns_debugger.records_models import DataType
+
+PREFETCH_RATIO = 0.9
+# an RRSET received with a shorter lifetime aged in the resolver cache, it is refreshed when it expires, once the
+# resolver fetched it again, instead of prefetched from the same aged answer at shorter and shorter intervals
+MIN_PREFETCH_LIFETIME = 60
+MAX_SLEEP = 60
+RETRY_DELAY = 30
+
+
+class TrustRefresher:
+    """
+    Warm the chain of trust of the configured zones at startup, then refresh RRSETs at PREFETCH_RATIO of their
+    lifetime. RRSETs of the configured zones are always refreshed, other ones only if they were used since they
+    were stored, so that checks of popular zones never see a cold chain.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, zones: List[str], store: ValidatedRRSets = VALIDATED_RRSETS, prefetch_ratio=PREFETCH_RATIO,
+                 clock=time.time, sleep=None):
+        self.zones = list(dict.fromkeys(zone.lower() if zone.endswith(".") else zone.lower() + "."
+                                        for zone in ["."] + zones))
+        self.store = store
+        self.prefetch_ratio = prefetch_ratio
+        self.clock = clock
+        self._stop = threading.Event()
+        self.sleep = sleep or self._stop.wait
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._failed: Dict[str, float] = {}
+        self.stats = {"warmed": 0, "refreshed": 0, "failures": 0, "last_refresh": None, "last_error": None}
+
+    def refresh_zone(self, zone: str) -> bool:
+        """
+        Fetch and validate again the DS and DNSKEY RRSETs of a zone,
+        RRSETs of its parents are taken from the cache when they are still valid
+        """
+        chain_of_trust = ChainOfTrust()
+        try:
+            for subzone in (name.text for name in DnsName.from_text(zone).lineage):
+                if subzone != zone and self._load(subzone, chain_of_trust):
+                    continue
+                if not validate_zone_keys(qname=subzone, chain_of_trust=chain_of_trust, use_cache=subzone != zone):
+                    raise DnsDebuggerException(message="Zone {} is not signed".format(subzone))
+        except DnsDebuggerException as err:
+            LOGGER.warning("Cannot refresh trust material of %s: %s", zone, err.message)
+            self.stats["failures"] += 1
+            self.stats["last_error"] = "{}: {}".format(zone, err.message)
+            self._failed[zone] = self.clock() + RETRY_DELAY
+            return False
+        self._failed.pop(zone, None)
+        self.stats["last_refresh"] = self.clock()
+        return True
+
+    @staticmethod
+    def _load(zone: str, chain_of_trust: ChainOfTrust) -> bool:
+        if zone != "." and not load_validated_rrset(qname=zone, rdtype=DataType.DS, chain_of_trust=chain_of_trust):
+            return False
+        return load_validated_rrset(qname=zone, rdtype=DataType.DNSKEY, chain_of_trust=chain_of_trust)
+
+    def get_stats(self) -> Dict:
+        """Refresh activity, with the number of RRSETs kept warm"""
+        return dict(self.stats, zones=self.zones, rrsets=len(self.store.entries()), running=self.is_running())
+
+    def warm(self):
+        """Validate the chain of trust of all configured zones"""
+        for zone in self.zones:
+            if self.refresh_zone(zone):
+                self.stats["warmed"] += 1
+
+    def due(self) -> Dict[str, float]:
+        """Zones to refresh now, and when the next refresh of each other zone is due"""
+        now = self.clock()
+        next_refresh: Dict[str, float] = {}
+        for zone, _, stored, expires, hits in self.store.entries():
+            if zone not in self.zones and not hits:
+                continue
+            refresh_at = max(self._refresh_at(stored, expires), self._failed.get(zone, 0))
+            next_refresh[zone] = min(next_refresh.get(zone, refresh_at), refresh_at)
+        for zone in self.zones:
+            next_refresh.setdefault(zone, self._failed.get(zone, now))
+        return next_refresh
+
+    def _refresh_at(self, stored: float, expires: float) -> float:
+        """When an RRSET is refreshed, from its lifetime since it was stored"""
+        if expires - stored < MIN_PREFETCH_LIFETIME:
+            return expires
+        return stored + self.prefetch_ratio * (expires - stored)
+
+    def run_once(self) -> float:
+        """Refresh the zones which are due, return the delay until the next one"""
+        now = self.clock()
+        next_refresh = self.due()
+        for zone, refresh_at in sorted(next_refresh.items(), key=lambda item: len(item[0])):
+            if refresh_at <= now:
+                LOGGER.info("Refreshing trust material of %s", zone)
+                if self.refresh_zone(zone):
+                    self.stats["refreshed"] += 1
+        later = [refresh_at - now for refresh_at in self.due().values() if refresh_at > now]
+        return min(later + [MAX_SLEEP])
+
+    def run(self):
+        """Warm then refresh until stopped"""
+        self.warm()
+        while not self._stop.is_set():
+            delay = self.run_once()
+            self.sleep(max(delay, 1))
+
+    def start(self):
+        """Run in a background thread, unless it is already running"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name="trust-refresher", daemon=True)
+            self._thread.start()
+
+    def is_running(self) -> bool:
+        """Is the background thread alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -1,35 +1,88 @@
 """Utilities for dnsssec"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
 from dns_debugger import LOGGER
-from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.cache import get_cache
+from dns_debugger.dnssec.denial import validate_ds_denial
+from dns_debugger.exceptions import DnsDebuggerException, QueryNoResponseException
 from dns_debugger.models import ChainOfTrust
-from dns_debugger.query import dns_query
+from dns_debugger.profiling import stage
+from dns_debugger.query import dns_query, records_from_text, Resolver
 from dns_debugger.records_models import RRSet, DataType
 
 
-def get_and_check_parent_ds(qname, chain_of_trust):
+class ValidatedRRSets:
+    """
+    Validated DS and DNSKEY RRSETs kept in memory until they expire, in front of the persistent cache.
+    Hits are counted so that popular RRSETs can be refreshed before they expire.
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        # (zone, rdtype) => [stored, expires, hits, records]
+        self._rrsets: Dict[Tuple[str, int], List] = {}
+        self._lock = threading.Lock()
+
+    def get(self, zone: str, rdtype: int) -> Optional[List[str]]:
+        """Get a validated RRSET as a list of rdata in text format, None if missing or expired"""
+        with self._lock:
+            entry = self._rrsets.get((zone.lower(), rdtype))
+            if entry is None or entry[1] <= self.clock():
+                return None
+            entry[2] += 1
+            return entry[3]
+
+    def set(self, zone: str, rdtype: int, records: List[str], expires: float):
+        """Store a validated RRSET until the expires timestamp, its hits are reset"""
+        with self._lock:
+            self._rrsets[(zone.lower(), rdtype)] = [self.clock(), expires, 0, records]
+
+    def entries(self) -> List[Tuple[str, int, float, float, int]]:
+        """Zone, rdtype, stored and expires timestamps and hits of the RRSETs not expired yet"""
+        now = self.clock()
+        with self._lock:
+            for key in [key for key, entry in self._rrsets.items() if entry[1] <= now]:
+                del self._rrsets[key]
+            return [(zone, rdtype, stored, expires, hits)
+                    for (zone, rdtype), (stored, expires, hits, _) in self._rrsets.items()]
+
+
+VALIDATED_RRSETS = ValidatedRRSets()
+
+
+@stage("dnssec:parent_ds")
+def get_and_check_parent_ds(qname, chain_of_trust, use_cache: bool = True):
     """
     :param qname:
     :param chain_of_trust:
+    :param use_cache: False to fetch and validate the DS RRSET again even if it is cached
     :return: True if DS record else False
     """
     if qname == ".":
         return True
+    if use_cache and load_validated_rrset(qname=qname, rdtype=DataType.DS, chain_of_trust=chain_of_trust):
+        return True
     LOGGER.info("Get DS record for %s", qname)
-    ds_records = dns_query(qname=qname, rdtype=DataType.DS, want_dnssec=True)
+    ds_records = dns_query(qname=qname, rdtype=DataType.DS, want_dnssec=True, use_cache=use_cache)
     if not ds_records.is_valid(chain_of_trust):
         message = "DS records received for {} are not valid (RRSIG not verified)".format(qname)
         raise DnsDebuggerException(message=message)
 
     if ds_records.rdtype != DataType.DS.value:
         LOGGER.info("NO DS records found in parent zone, zone is not signed")
+        LOGGER.info(validate_ds_denial(qname=qname, denial=ds_records.denial, chain_of_trust=chain_of_trust))
         return False
 
     for rec in ds_records.records:
         LOGGER.debug("Adding DS record %s to the chain of trust", rec)
         chain_of_trust.add_ds(rec)
+    store_validated_rrset(ds_records)
     return True
 
 
+@stage("dnssec:dnskey_rrset")
 def verify_dnskey_rrset(rrset: RRSet, cot: ChainOfTrust, qname):
     """Verify a DNSKEY RRSET"""
     LOGGER.info("Checking if DNSKEY RRSET is valid")
@@ -43,5 +96,71 @@ def verify_dnskey_rrset(rrset: RRSet, cot: ChainOfTrust, qname):
         for dnskey in rrset.records:
             if cot.get_dnskey(dnskey.key_tag()) is None:
                 cot.add_dnskey(dnskey)
+        store_validated_rrset(rrset)
     else:
         raise DnsDebuggerException(message="RRSET not validated through RRSIG\n{}".format(rrset.rrsig))
+
+
+def validate_zone_keys(qname: str, chain_of_trust: ChainOfTrust, origin: Optional[Resolver] = None,
+                       use_cache: bool = True) -> bool:
+    """
+    Validate the DS and DNSKEY RRSETs of a zone, its parent keys must be in the chain of trust
+    :param origin: server queried for the DNSKEY RRSET, default resolver if None
+    :param use_cache: False to fetch and validate the RRSETs again even if they are cached
+    :return: False if the zone is not signed
+    """
+    LOGGER.info("Verifying chain of trust for qname %s", qname)
+
+    is_dnssec_activated = get_and_check_parent_ds(qname=qname, chain_of_trust=chain_of_trust, use_cache=use_cache)
+    if not is_dnssec_activated:
+        return is_dnssec_activated
+
+    if use_cache and load_validated_rrset(qname=qname, rdtype=DataType.DNSKEY, chain_of_trust=chain_of_trust):
+        return True
+
+    try:
+        dnskeys = dns_query(qname=qname, rdtype=DataType.DNSKEY, want_dnssec=True, resolver=origin,
+                            use_cache=use_cache)
+    except QueryNoResponseException:
+        raise DnsDebuggerException(
+            message="Zone {} is not signed, there is no DNSKEY, but we have a parent DS record. "
+                    "Please remove DS record or sign the zone".format(qname))
+    LOGGER.info("Got %d DNSKEY", len(dnskeys.records))
+    LOGGER.debug(dnskeys)
+
+    verify_dnskey_rrset(rrset=dnskeys, cot=chain_of_trust, qname=qname)
+    return True
+
+
+def load_validated_rrset(qname: str, rdtype: DataType, chain_of_trust: ChainOfTrust) -> bool:
+    """
+    Add a DS or DNSKEY RRSET validated earlier to the chain of trust, if it is in memory or in the persistent cache
+    :return: True if found in cache else False
+    """
+    texts = VALIDATED_RRSETS.get(zone=qname, rdtype=rdtype.value)
+    cache = get_cache()
+    if texts is None and cache is not None:
+        texts = cache.get_rrset(zone=qname, rdtype=rdtype.value)
+    if texts is None:
+        return False
+    LOGGER.info("Validated %s RRSET for %s found in cache", rdtype.name, qname)
+    for record in records_from_text(rdtype=rdtype.value, texts=texts):
+        if rdtype == DataType.DS:
+            chain_of_trust.add_ds(record)
+        else:
+            chain_of_trust.add_dnskey(record)
+    return True
+
+
+def store_validated_rrset(rrset: RRSet):
+    """
+    Store a validated RRSET in memory and in the persistent cache, until its TTL or its first RRSIG expiration.
+    The TTL received is used, an answer which aged in a resolver cache is not trusted longer than it was served.
+    """
+    expires = rrset.expires(time.time())
+    records = [record.to_text() for record in rrset.records]
+    VALIDATED_RRSETS.set(zone=rrset.name, rdtype=rrset.rdtype, records=records, expires=expires)
+    cache = get_cache()
+    if cache is None:
+        return
+    cache.set_rrset(zone=rrset.name, rdtype=rrset.rdtype, records=records, expires=expires)
@@ -0,0 +1,69 @@
+"""EDNS buffer size tracking, to avoid fragmented UDP responses dropped by middleboxes"""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# 1232 is the DNS flag day 2020 recommendation, 512 fits any path
+EDNS_PAYLOADS = [1232, 512]
+PROBE_TIMEOUT = 3
+# a downgraded server is probed again with the largest buffer size after this number of seconds
+DOWNGRADE_TTL = 3600
+
+
+class EdnsCapabilities:
+    """
+    Working EDNS buffer size of each server. Servers start with the largest one and are downgraded on timeouts until
+    a response confirms the buffer size, downgrades expire so that the largest one is probed again.
+    """
+
+    def __init__(self, downgrade_ttl: float = DOWNGRADE_TTL, clock=time.time):
+        self.downgrade_ttl = downgrade_ttl
+        self.clock = clock
+        # server => downgraded buffer size, expires timestamp
+        self._downgrades: Dict[str, Tuple[int, float]] = {}
+        # server => buffer size of the last response
+        self._confirmed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, server: str) -> int:
+        """Buffer size to advertise to server"""
+        with self._lock:
+            return self._get(server)
+
+    def _get(self, server: str) -> int:
+        """Buffer size of a server, an expired downgrade is removed, must be called with the lock held"""
+        payload, expires = self._downgrades.get(server, (EDNS_PAYLOADS[0], None))
+        if expires is not None and expires <= self.clock():
+            del self._downgrades[server]
+            return EDNS_PAYLOADS[0]
+        return payload
+
+    def timeout(self, server: str, default_timeout: float) -> float:
+        """While the buffer size is not confirmed and can be downgraded, timeouts are short"""
+        with self._lock:
+            payload = self._get(server)
+            if self._confirmed.get(server) == payload or payload == EDNS_PAYLOADS[-1]:
+                return default_timeout
+        return min(PROBE_TIMEOUT, default_timeout)
+
+    def downgrade(self, server: str, payload: int) -> Optional[int]:
+        """
+        A query with this payload timed out, get the next buffer size to try for downgrade_ttl seconds. None if there
+        is none, or if the server answered with this payload before: the timeout is not caused by the buffer size.
+        """
+        smaller = [size for size in EDNS_PAYLOADS if size < payload]
+        with self._lock:
+            if not smaller or self._confirmed.get(server) == payload:
+                return None
+            downgraded = min(self._get(server), smaller[0])
+            self._downgrades[server] = (downgraded, self.clock() + self.downgrade_ttl)
+            return downgraded
+
+    def confirm(self, server: str, payload: int):
+        """A response was received with this payload"""
+        with self._lock:
+            if self._get(server) == payload:
+                self._confirmed[server] = payload
+
+
+EDNS_CAPABILITIES = EdnsCapabilities()
@@ -22,6 +22,14 @@ class QueryErrException(DnsDebuggerException):
     pass
 
 
+class QueryRcodeException(QueryErrException):
+    """Exception for a response with an error status, the response is kept"""
+
+    def __init__(self, message, response):
+        QueryErrException.__init__(self, message=message)
+        self.response = response
+
+
 class QueryNoResponseException(DnsDebuggerException):
     """Exception for dns query no response"""
     pass
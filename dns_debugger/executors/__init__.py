@@ -1,16 +1,20 @@
 """Test executor to check the zone"""
+import importlib
+from typing import Iterable, Optional
 
-from dns_debugger.executors.testsuite import TestSuite
+from dns_debugger.executors.testsuite import TestSuite, StreamingTestSuite  # pylint: disable=unused-import
+from dns_debugger.executors.scheduler import TestPlan, run_plan  # pylint: disable=unused-import
 
+EXECUTOR_NAMES = ("simple_query", "recursive_query", "dnssec_validation", "consistency")
 
-def run_tests(qname):
-    """Running tests"""
+
+def get_executors(names: Iterable[str]):
+    """Executors modules, only selected ones are imported as some of them make queries at import"""
+    return [importlib.import_module("dns_debugger.executors.{}".format(name)) for name in names]
+
+
+def run_tests(qname, plan: Optional[TestPlan] = None, testsuite: Optional[TestSuite] = None):
+    """Running tests, testcases are added to testsuite if given"""
     if not qname.endswith("."):
         qname += "."
-
-    from dns_debugger.executors import simple_query, recursive_query, dnssec_validation
-    testsuite = TestSuite()
-    testsuite.add_testcases(simple_query.run_tests(qname=qname))
-    testsuite.add_testcases(recursive_query.run_tests(qname=qname))
-    testsuite.add_testcases(dnssec_validation.run_tests(qname=qname))
-    return testsuite
+    return run_plan(qname=qname, plan=plan or TestPlan(), testsuite=testsuite)
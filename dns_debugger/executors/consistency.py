@@ -0,0 +1,95 @@
+"""Query all nameservers of the zone in parallel and check they are consistent"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from typing import Dict, List, Union
+
+from dns_debugger.exceptions import DnsDebuggerException, QueryNoResponseException
+from dns_debugger.executors.testsuite import TestCase
+from dns_debugger.profiling import propagate
+from dns_debugger.query import dns_query, get_addresses, Resolver
+from dns_debugger.records_models import DataType, RRSet
+
+CHECKED_TYPES = [DataType.SOA, DataType.NS, DataType.DNSKEY]
+MAX_WORKERS = 32
+
+TEST_DESCRIPTION = "Checking {dtype} consistency between all nameservers of {qname}"
+
+
+REQUIRES = ("zone_nameservers",)
+
+
+def run_tests(context):
+    """Run the test"""
+    qname = context.qname
+    try:
+        ns_records = context.get("zone_nameservers")
+    except DnsDebuggerException as err:
+        return [TestCase(description="Getting nameservers of {}".format(qname), result=err.message, success=False)]
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        targets = sorted(ns.target for ns in ns_records.records)
+        addresses = pool.map(propagate(lambda target: _addresses(target, ns_records.glue)), targets)
+        servers = [Resolver(ip_addr=ip_addr, qname=target)
+                   for target, ip_addrs in zip(targets, addresses) for ip_addr in ip_addrs]
+        queries = list(product(CHECKED_TYPES, servers))
+        answers = list(pool.map(propagate(lambda query: _query(qname, *query)), queries))
+
+    testcases = []
+    for dtype in CHECKED_TYPES:
+        by_server = {server: answer for (query_type, server), answer in zip(queries, answers) if query_type == dtype}
+        testcases.append(_compare(qname=qname, dtype=dtype, answers=by_server))
+    return testcases
+
+
+def _addresses(target: str, glue: Dict[str, List[str]]) -> List[str]:
+    """Addresses of a nameserver from the glue, address types missing from the glue are looked up"""
+    known = glue.get(target.lower(), [])
+    families = {DataType.AAAA if ":" in ip_addr else DataType.A for ip_addr in known}
+    missing = [rdtype for rdtype in (DataType.A, DataType.AAAA) if rdtype not in families]
+    return known + (get_addresses(target, rdtypes=missing) if missing else [])
+
+
+def _query(qname: str, dtype: DataType, server: Resolver) -> Union[RRSet, str]:
+    """Query a nameserver, the error message is returned if the query failed"""
+    try:
+        try:
+            return dns_query(qname=qname, rdtype=dtype, want_dnssec=True, resolver=server)
+        except QueryNoResponseException:
+            return dns_query(qname=qname, rdtype=dtype, resolver=server)
+    except DnsDebuggerException as err:
+        return err.message
+
+
+def _fingerprint(dtype: DataType, answer: RRSet) -> str:
+    """What must be identical on all nameservers: serial for SOA, records and signatures for others"""
+    if answer.rdtype != dtype.value:
+        return "no {} records".format(dtype.name)
+    if dtype == DataType.SOA:
+        return "serial {}".format(answer.records[0].serial)
+    records = "[{}]".format(", ".join(sorted(record.to_text() for record in answer.records)))
+    if not answer.rrsig:
+        return records
+    signatures = ", ".join(sorted("{} {}-{}".format(rrsig.key_tag, rrsig.inception, rrsig.expiration)
+                                  for rrsig in answer.rrsig))
+    return "{} signed by [{}]".format(records, signatures)
+
+
+def _compare(qname: str, dtype: DataType, answers: Dict[Resolver, Union[RRSet, str]]) -> TestCase:
+    description = TEST_DESCRIPTION.format(dtype=dtype.name, qname=qname)
+    if not answers:
+        return TestCase(description=description, result="No nameserver address found", success=False)
+
+    errors = {server: answer for server, answer in answers.items() if isinstance(answer, str)}
+    variants: Dict[str, List[Resolver]] = {}
+    for server, answer in answers.items():
+        if server not in errors:
+            variants.setdefault(_fingerprint(dtype, answer), []).append(server)
+
+    if not errors and len(variants) == 1:
+        return TestCase(description=description,
+                        result="{} on all {} nameservers".format(next(iter(variants)), len(answers)), success=True)
+
+    lines = ["{} => {}".format(", ".join(map(str, servers)), fingerprint) for fingerprint, servers in variants.items()]
+    lines += ["{} => {}".format(server, error) for server, error in errors.items()]
+    return TestCase(description=description, result="Nameservers are not consistent\n{}".format("\n".join(lines)),
+                    success=False)
@@ -1,61 +1,43 @@
 """Make dnssec valirdation"""
-import random
-
 from dns_debugger import LOGGER
-from dns_debugger.dnssec.utils import verify_dnskey_rrset, get_and_check_parent_ds
-from dns_debugger.exceptions import DnsDebuggerException, QueryNoResponseException
+from dns_debugger.dnssec.utils import validate_zone_keys
+from dns_debugger.exceptions import DnsDebuggerException
 from dns_debugger.executors.testsuite import TestCase
 from dns_debugger.models import ChainOfTrust
-from dns_debugger.query import dns_query, Resolver
+from dns_debugger.query import dns_query
 from dns_debugger.records_models import DataType
-from dns_debugger.utils import split_qname
 
 TEST_DESCRIPTION = "Checking DNSSEC recursively for {}"
 
 
-def run_tests(qname: str):
+REQUIRES = ("resolution",)
+
+
+def run_tests(context):
     """Run the test"""
+    qname = context.qname
     LOGGER.info("Verifying DNSSEC for qname %s", qname)
-    chain_of_trust = ChainOfTrust()
-    valid = True
-    result = 'DNSSEC validation is OK'
-    resolver = Resolver()
-
+    resolution = context.get("resolution")
+    if resolution.error is not None:
+        return [TestCase(description=TEST_DESCRIPTION.format(qname),
+                         result="Cannot get delegation chain: {}".format(resolution.error), success=False)]
     try:
-        for subqname in split_qname(qname=qname):
-            LOGGER.info("Checking DNSSEC for %s", subqname)
-
-            ns_records = dns_query(qname=subqname, rdtype=DataType.NS, resolver=resolver)
-            resolver = Resolver(qname=random.choice(ns_records.records).target)
-
-            if not _check_qname(qname=subqname, chain_of_trust=chain_of_trust, origin=resolver):
-                result = "There is no DNSSEC for this zone {}".format(subqname)
-                break
-
-            if subqname == 'qname':
-                arecords = dns_query(qname=qname, rdtype=DataType.A, want_dnssec=True)
-                arecords.is_valid(cot=chain_of_trust)
+        result = _validate(qname, resolution.cuts)
     except DnsDebuggerException as exc:
-        valid = False
-        result = exc.message
-    return [TestCase(description=TEST_DESCRIPTION.format(qname), result=result, success=valid)]
-
+        return [TestCase(description=TEST_DESCRIPTION.format(qname), result=exc.message, success=False)]
+    return [TestCase(description=TEST_DESCRIPTION.format(qname), result=result, success=True)]
 
-def _check_qname(qname: str, chain_of_trust, origin):
-    LOGGER.info("Verifying chain of trust for qname %s", qname)
 
-    is_dnssec_activated = get_and_check_parent_ds(qname=qname, chain_of_trust=chain_of_trust)
-    if not is_dnssec_activated:
-        return is_dnssec_activated
-
-    try:
-        dnskeys = dns_query(qname=qname, rdtype=DataType.DNSKEY, want_dnssec=True, resolver=origin)
-    except QueryNoResponseException:
-        raise DnsDebuggerException(
-            message="Zone {} is not signed, there is no DNSKEY, but we have a parent DS record. "
-                    "Please remove DS record or sign the zone".format(qname))
-    LOGGER.info("Got %d DNSKEY", len(dnskeys.records))
-    LOGGER.debug(dnskeys)
-
-    verify_dnskey_rrset(rrset=dnskeys, cot=chain_of_trust, qname=qname)
-    return True
+def _validate(qname: str, cuts) -> str:
+    """Validate the keys of every zone cut down to the zone of qname, then the A RRSET of qname with them"""
+    chain_of_trust = ChainOfTrust()
+    for subqname, servers in cuts:
+        LOGGER.info("Checking DNSSEC for %s", subqname)
+        if not validate_zone_keys(qname=subqname, chain_of_trust=chain_of_trust, origin=servers[0]):
+            return "There is no DNSSEC for this zone {}".format(subqname)
+
+    arecords = dns_query(qname=qname, rdtype=DataType.A, want_dnssec=True)
+    if not arecords.is_signed() or not arecords.is_valid(cot=chain_of_trust):
+        raise DnsDebuggerException(message="{} RRSET of {} is not validated by its RRSIG".format(
+            DataType(arecords.rdtype).name, qname))
+    return 'DNSSEC validation is OK'
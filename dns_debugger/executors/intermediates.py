@@ -0,0 +1,35 @@
+"""Intermediates shared by executors, computed once per run"""
+import typing
+from typing import List, Optional
+
+from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.executors.testsuite import TestCase
+from dns_debugger.query import Cut, IterativeResolver, dns_query
+from dns_debugger.records_models import DataType, RRSet
+
+ITERATIVE_RESOLVER = IterativeResolver()
+
+Resolution = typing.NamedTuple("Resolution", [("trace", List[TestCase]),
+                                              ("cuts", List[Cut]),
+                                              ("error", Optional[str])])
+
+
+def resolution(context) -> Resolution:
+    """Resolution of the qname NS from the root servers, with the delegation chain"""
+    trace = []
+    try:
+        cuts = ITERATIVE_RESOLVER.delegation(qname=context.qname, trace=trace)
+    except DnsDebuggerException as err:
+        return Resolution(trace=trace, cuts=[], error=err.message)
+    return Resolution(trace=trace, cuts=cuts, error=None)
+
+
+def zone_nameservers(context) -> RRSet:
+    """NS records of the zone, from the default resolver"""
+    return dns_query(qname=context.qname, rdtype=DataType.NS)
+
+
+INTERMEDIATES = {
+    "resolution": resolution,
+    "zone_nameservers": zone_nameservers,
+}
@@ -1,33 +1,13 @@
 """Test to target domain recursively"""
-import random
-
-from dns_debugger.exceptions import DnsDebuggerException
 from dns_debugger.executors.testsuite import TestCase
-from dns_debugger.query import dns_query, Resolver
-from dns_debugger.records_models import DataType
-from dns_debugger.utils import split_qname
-
-
-def run_tests(qname: str):
-    """Run the test"""
-    return [_recursive_query(qname=qname)]
-
 
-def _recursive_query(qname: str) -> TestCase:
-    """Make recursive queries"""
-    resolver = Resolver()
-    result = ''
-    success = True
-    for subqname in split_qname(qname):
-        result += 'Getting NS record for {} from {}'.format(subqname, resolver)
-        try:
+REQUIRES = ("resolution",)
 
-            ns_records = dns_query(qname=subqname, rdtype=DataType.NS, resolver=resolver)
-            result += ' => {}\n'.format(', '.join([ns.target for ns in ns_records.records]))
-            resolver = Resolver(qname=random.choice(ns_records.records).target)
-        except DnsDebuggerException as err:
-            result += ' => {}'.format(err.message)
-            success = False
-            break
 
-    return TestCase(description='Getting NS records recursively for {}'.format(qname), result=result, success=success)
+def run_tests(context):
+    """Run the test, each query made resolving NS records from the root servers is a testcase"""
+    resolution = context.get("resolution")
+    if resolution.error is None:
+        return resolution.trace
+    return resolution.trace + [TestCase(description='Getting NS records recursively for {}'.format(context.qname),
+                                        result=resolution.error, success=False)]
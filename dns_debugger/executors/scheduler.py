@@ -0,0 +1,97 @@
+"""Schedule executors, each one declares the intermediates it requires and they are computed once"""
+import threading
+import typing
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from dns_debugger import LOGGER
+from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.executors.testsuite import TestCase, TestSuite
+from dns_debugger.profiling import propagate, stage
+from dns_debugger.records_models import DataType
+
+MAX_WORKERS = 8
+
+
+class TestPlan(typing.NamedTuple):
+    """Executors, record types and resolvers to use, None means all of them"""
+    tests: Optional[List[str]] = None
+    rdtypes: Optional[List[DataType]] = None
+    resolvers: Optional[List['Resolver']] = None
+
+    @classmethod
+    def from_strings(cls, tests: Optional[str] = None, rdtypes: Optional[str] = None,
+                     resolvers: Optional[str] = None) -> 'TestPlan':
+        """Create a test plan from comma separated lists, as received from the CLI or the server"""
+        from dns_debugger.executors import EXECUTOR_NAMES
+        from dns_debugger.query import Resolver
+        tests_list = _split(tests)
+        for test in tests_list or []:
+            if test not in EXECUTOR_NAMES:
+                raise DnsDebuggerException(message="Unknown test {}, available tests are {}".format(
+                    test, ", ".join(EXECUTOR_NAMES)))
+        try:
+            rdtypes_list = [DataType[rdtype.upper()] for rdtype in _split(rdtypes) or []] or None
+        except KeyError as err:
+            raise DnsDebuggerException(message="Unknown record type {}".format(err))
+        resolvers_list = [Resolver.from_string(resolver) for resolver in _split(resolvers) or []] or None
+        return cls(tests=tests_list, rdtypes=rdtypes_list, resolvers=resolvers_list)
+
+
+def _split(value: Optional[str]) -> Optional[List[str]]:
+    if not value:
+        return None
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class Context:
+    """Qname and plan of a run, with the intermediates shared by executors"""
+
+    def __init__(self, qname: str, plan: TestPlan):
+        self.qname = qname
+        self.plan = plan
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str):
+        """Get an intermediate, the first caller computes it while the others wait for the result"""
+        from dns_debugger.executors.intermediates import INTERMEDIATES
+        with self._lock:
+            future = self._futures.get(name)
+            owner = future is None
+            if owner:
+                future = self._futures[name] = Future()
+        if owner:
+            LOGGER.info("Computing intermediate %s for %s", name, self.qname)
+            try:
+                with stage("intermediate:{}".format(name)):
+                    future.set_result(INTERMEDIATES[name](self))
+            except Exception as exc:  # pylint: disable=broad-except
+                future.set_exception(exc)
+        return future.result()
+
+
+def run_plan(qname: str, plan: TestPlan, testsuite: Optional[TestSuite] = None) -> TestSuite:
+    """Run selected executors concurrently, testcases are added in the executors order"""
+    from dns_debugger.executors import get_executors, EXECUTOR_NAMES
+    context = Context(qname=qname, plan=plan)
+    executors = get_executors(name for name in EXECUTOR_NAMES if plan.tests is None or name in plan.tests)
+    required = {name for executor in executors for name in executor.REQUIRES}
+
+    testsuite = testsuite if testsuite is not None else TestSuite()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for name in required:
+            pool.submit(propagate(context.get), name)
+        futures = [pool.submit(propagate(_run_executor), executor, context) for executor in executors]
+        for executor, future in zip(executors, futures):
+            try:
+                testsuite.add_testcases(future.result())
+            except DnsDebuggerException as err:
+                testsuite.add_testcase(TestCase(description="Running {}".format(executor.__name__),
+                                                result=err.message, success=False))
+    return testsuite
+
+
+def _run_executor(executor, context: Context) -> List[TestCase]:
+    with stage("executor:{}".format(executor.__name__.rsplit(".", 1)[-1])):
+        return executor.run_tests(context)
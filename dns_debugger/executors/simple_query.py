@@ -1,6 +1,10 @@
 """Just make simple basic query"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
 from dns_debugger.exceptions import DnsDebuggerException
 from dns_debugger.executors.testsuite import TestCase
+from dns_debugger.profiling import propagate
 
 from dns_debugger.query import dns_query, Resolver
 from dns_debugger.records_models import DataType
@@ -8,13 +12,17 @@ from dns_debugger.records_models import DataType
 RESOLVERS = [Resolver(), Resolver(ip_addr='8.8.8.8'), Resolver(ip_addr='9.9.9.9'), Resolver(ip_addr='1.1.1.1')]
 
 
-def run_tests(qname: str):
+DATATYPES = [DataType.SOA, DataType.NS, DataType.A, DataType.AAAA, DataType.MX, DataType.TXT]
+MAX_WORKERS = 16
+
+REQUIRES = ()
+
+
+def run_tests(context):
     """Run the test"""
-    suites = []
-    for datatype in [DataType.SOA, DataType.NS, DataType.A, DataType.AAAA, DataType.MX, DataType.TXT]:
-        for resolver in RESOLVERS:
-            suites.append(_query(qname=qname, dtype=datatype, resolver=resolver))
-    return suites
+    queries = product(context.plan.rdtypes or DATATYPES, context.plan.resolvers or RESOLVERS)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        return list(pool.map(propagate(lambda query: _query(context.qname, *query)), queries))
 
 
 def _query(qname: str, dtype: DataType, resolver) -> TestCase:
@@ -1,11 +1,24 @@
 """Testsuite and testcase"""
 import json
 import typing
-from typing import List
+from typing import Iterable, Iterator, List, TextIO
 
 TestCase = typing.NamedTuple("TestCase", [("description", str), ("result", str), ("success", bool)])
 
 
+def testcase_json(testcase: TestCase) -> str:
+    """A testcase as a json object on a single line"""
+    return json.dumps(testcase._asdict())
+
+
+def _json_items(testcases: Iterable[TestCase], newline: str) -> Iterator[str]:
+    """Items of a json list of testcases, each one starting on a new line unless newline is empty"""
+    separator = newline
+    for testcase in testcases:
+        yield separator + testcase_json(testcase)
+        separator = "," + (newline or " ")
+
+
 class TestSuite:
     """A testsuite is a list of testcase"""
     testcases: List[TestCase]
@@ -38,13 +51,56 @@ class TestSuite:
         """Get testcases in success"""
         return [t for t in self.testcases if t.success]
 
+    def iter_json(self, display_all=True, multiline=True, **fields) -> Iterator[str]:
+        """
+        self to json piece by piece, testcases are serialized one at a time like the lines of StreamingTestSuite,
+        each one on its own line if multiline. fields are added to the document before the counters.
+        """
+        newline = "\n" if multiline else ""
+        counters = json.dumps(dict(fields, success=self.success, failures=self.failures))
+        yield counters[:-1] + ', "testcases": {"failures": ['
+        yield from _json_items((t for t in self.testcases if not t.success), newline)
+        if display_all:
+            yield '], "success": ['
+            yield from _json_items((t for t in self.testcases if t.success), newline)
+        yield "]}}"
+
     def to_json(self, display_all=True):
         """self to json"""
-        to_serialize = {'success': self.success, "failures": self.failures,
-                        "testcases": {"failures": self.get_failures()}}
-        if display_all:
-            to_serialize["testcases"]["success"] = self.get_success()
-        return json.dumps(to_serialize, default=lambda o: o.__dict__, indent=2)
+        return "".join(self.iter_json(display_all=display_all))
 
     def __str__(self):
         return "\n".join(map('{}\n'.format, self.testcases))
+
+
+class StreamingTestSuite(TestSuite):
+    """
+    A testsuite for huge scans, memory is bounded: each testcase is written to the sink as a json line
+    as soon as it is added, only counters and optionally failures are kept
+    """
+
+    def __init__(self, sink: TextIO, only_failures=False, keep_failures=False):
+        super(StreamingTestSuite, self).__init__()
+        self.sink = sink
+        self.only_failures = only_failures
+        self.keep_failures = keep_failures
+
+    def add_testcase(self, testcase: TestCase):
+        """Count the testcase and write it to the sink"""
+        if testcase.success:
+            self.success += 1
+            if self.only_failures:
+                return
+        else:
+            self.failures += 1
+            if self.keep_failures:
+                self.testcases.append(testcase)
+        self.sink.write(testcase_json(testcase))
+        self.sink.write("\n")
+        self.sink.flush()
+
+    def to_json(self, display_all=True):
+        """Counters, and failures if they are kept, testcases were already written to the sink"""
+        if self.keep_failures:
+            return "".join(self.iter_json(display_all=False, multiline=False))
+        return json.dumps({'success': self.success, "failures": self.failures})
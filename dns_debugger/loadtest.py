@@ -0,0 +1,268 @@
+"""Load test of a resolver, queries are sent at a target rate and latency percentiles are reported"""
+import collections
+import math
+import selectors
+import socket
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import dns.rcode
+
+from dns_debugger.edns import EDNS_PAYLOADS
+from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.query import Resolver, make_query
+from dns_debugger.records_models import DataType
+from dns_debugger.transports import UDP
+
+MIX_DATATYPES = [DataType.SOA, DataType.NS, DataType.A, DataType.AAAA, DataType.MX, DataType.TXT]
+LOAD_TIMEOUT = 2.0
+REPORT_INTERVAL = 1.0
+SOCKETS = 8
+# query IDs of a socket, an ID still in flight when it is reused is counted as a timeout
+QUERY_IDS = 65536
+PERCENTILES = (50, 95, 99)
+# latency buckets grow by LATENCY_PRECISION from MIN_LATENCY seconds, percentiles are accurate to 1%
+MIN_LATENCY = 1e-5
+LATENCY_PRECISION = 0.01
+# NXDOMAIN is a valid answer for a query mix, other rcodes are errors
+VALID_RCODES = (dns.rcode.NOERROR, dns.rcode.NXDOMAIN)
+
+Query = Tuple[str, DataType]
+
+
+def read_query_mix(path: str) -> List[Query]:
+    """Read a file containing one 'qname type' query per line, empty lines and comments are skipped"""
+    queries = []
+    with open(path) as queries_file:
+        for line in queries_file:
+            if not line.strip() or line.startswith("#"):
+                continue
+            qname, _, rdtype = line.strip().partition(" ")
+            try:
+                queries.append((qname, DataType[rdtype.strip().upper() or "A"]))
+            except KeyError:
+                raise DnsDebuggerException(message="Unknown record type {} in {}".format(rdtype, path))
+    return queries
+
+
+def synthesize_query_mix(qname: str, rdtypes: Optional[List[DataType]] = None) -> List[Query]:
+    """Query mix made of the record types of a zone"""
+    return [(qname, rdtype) for rdtype in rdtypes or MIX_DATATYPES]
+
+
+class LatencyHistogram:
+    """
+    Latencies counted in fixed buckets with geometrically growing bounds, the memory used does not grow with the
+    number of responses. Latencies above max_latency are counted in the last bucket.
+    """
+
+    def __init__(self, max_latency: float):
+        self.counts = [0] * (self._bucket(max_latency) + 1)
+        self.count = 0
+
+    @staticmethod
+    def _bucket(latency: float) -> int:
+        if latency <= MIN_LATENCY:
+            return 0
+        return math.ceil(math.log(latency / MIN_LATENCY) / math.log1p(LATENCY_PRECISION))
+
+    def add(self, latency: float):
+        """Count a latency in seconds"""
+        self.counts[min(self._bucket(latency), len(self.counts) - 1)] += 1
+        self.count += 1
+
+    def percentile(self, percent: int) -> Optional[float]:
+        """
+        Nearest-rank percentile, the upper bound of the bucket of the latency of this rank
+        >>> histogram = LatencyHistogram(max_latency=1.0)
+        >>> for latency in (0.001, 0.002, 0.003, 0.004, 0.5):
+        ...     histogram.add(latency)
+        >>> round(histogram.percentile(50), 3), round(histogram.percentile(99), 2)
+        (0.003, 0.5)
+        """
+        if not self.count:
+            return None
+        rank = max(math.ceil(percent * self.count / 100), 1)
+        for bucket, count in enumerate(self.counts):
+            rank -= count
+            if rank <= 0:
+                return MIN_LATENCY * (1 + LATENCY_PRECISION) ** bucket
+        return None
+
+
+class Counters:
+    """Counters of an interval or of the whole run"""
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.timeouts = 0
+        self.rcodes: Dict[str, int] = collections.Counter()
+
+    def add(self, other: 'Counters'):
+        """Add counters of an interval"""
+        self.sent += other.sent
+        self.received += other.received
+        self.timeouts += other.timeouts
+        self.rcodes.update(other.rcodes)
+
+    def errors(self) -> int:
+        """Responses with an error rcode"""
+        valid = {dns.rcode.to_text(rcode) for rcode in VALID_RCODES}
+        return sum(count for rcode, count in self.rcodes.items() if rcode not in valid)
+
+
+class LoadTest:
+    """
+    Open-loop load generator, queries are sent at the target rate whatever the response times are.
+    Query wires are built once and only their ID is changed, queries are spread on several UDP sockets
+    so that each one has its own ID space, and responses are matched by a receiver thread.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, resolver: Resolver, queries: List[Query], qps: float, duration: float,
+                 timeout: float = LOAD_TIMEOUT):
+        if resolver.transport != UDP:
+            raise DnsDebuggerException(message="Load tests are only supported over UDP")
+        if not queries:
+            raise DnsDebuggerException(message="Query mix is empty")
+        if qps <= 0 or duration <= 0:
+            raise DnsDebuggerException(message="QPS and duration must be positive")
+        self.resolver = resolver
+        self.qps = qps
+        self.duration = duration
+        self.timeout = timeout
+        self.templates = [make_query(dict(qname=qname, rdtype=rdtype.value, want_dnssec=False,
+                                          recursion_desired=True), payload=EDNS_PAYLOADS[0]).to_wire()
+                          for qname, rdtype in queries]
+        # responses are matched until queries in flight are expired by the next report
+        self.latencies = LatencyHistogram(max_latency=timeout + REPORT_INTERVAL)
+        self.total = Counters()
+        self._interval = Counters()
+        self._in_flight: Dict[Tuple[int, int], float] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._sockets = []
+        self._last_received = 0.0
+
+    def run(self) -> Iterator[Dict]:
+        """Run the load test, a report is yielded every interval then a summary at the end"""
+        for _ in range(SOCKETS):
+            sock = socket.socket(socket.AF_INET6 if ":" in self.resolver.ip_addr else socket.AF_INET,
+                                 socket.SOCK_DGRAM)
+            sock.connect((self.resolver.ip_addr, self.resolver.port))
+            sock.setblocking(False)
+            self._sockets.append(sock)
+        receiver = threading.Thread(target=self._receive, daemon=True)
+        sender = threading.Thread(target=self._send, daemon=True)
+        start = time.perf_counter()
+        receiver.start()
+        sender.start()
+        try:
+            index = 0
+            while sender.is_alive() or self._in_flight:
+                index += 1
+                time.sleep(max(start + index * REPORT_INTERVAL - time.perf_counter(), 0))
+                yield self._report(index, time.perf_counter())
+                if not sender.is_alive() and time.perf_counter() - start > self.duration + self.timeout:
+                    break
+        finally:
+            self._done.set()
+            sender.join()
+            receiver.join()
+            for sock in self._sockets:
+                sock.close()
+        with self._lock:
+            self.total.timeouts += len(self._in_flight)
+            self._in_flight.clear()
+        yield self.summary(max(self._last_received - start, self.duration))
+
+    def _send(self):
+        """Send queries at the target rate, late queries are sent at once to catch up"""
+        start = time.perf_counter()
+        count = int(self.qps * self.duration)
+        for index in range(count):
+            if self._done.is_set():
+                return
+            delay = start + index / self.qps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sock_index, query_id = index % SOCKETS, (index // SOCKETS) % QUERY_IDS
+            wire = struct.pack("!H", query_id) + self.templates[index % len(self.templates)][2:]
+            with self._lock:
+                if self._in_flight.pop((sock_index, query_id), None) is not None:
+                    self._interval.timeouts += 1
+                self._in_flight[(sock_index, query_id)] = time.perf_counter()
+                self._interval.sent += 1
+            try:
+                self._sockets[sock_index].send(wire)
+            except OSError:
+                pass  # counted as a timeout, like a query dropped on the path
+
+    def _receive(self):
+        """Match responses with queries in flight by socket and ID, only the header is parsed"""
+        selector = selectors.DefaultSelector()
+        for sock_index, sock in enumerate(self._sockets):
+            selector.register(sock, selectors.EVENT_READ, sock_index)
+        while not self._done.is_set():
+            for key, _ in selector.select(timeout=0.1):
+                while True:
+                    try:
+                        wire = key.fileobj.recv(65535)
+                    except (BlockingIOError, ConnectionRefusedError):
+                        break
+                    received = time.perf_counter()
+                    if len(wire) < 4:
+                        continue
+                    query_id, flags = struct.unpack("!HH", wire[:4])
+                    with self._lock:
+                        sent = self._in_flight.pop((key.data, query_id), None)
+                        if sent is None:
+                            continue
+                        self._interval.received += 1
+                        self._interval.rcodes[dns.rcode.to_text(flags & 0xF)] += 1
+                        self.latencies.add(received - sent)
+                        self._last_received = received
+        selector.close()
+
+    def _report(self, index: int, now: float) -> Dict:
+        """Queries in flight for longer than the timeout are expired, then counters of the interval are reset"""
+        with self._lock:
+            while self._in_flight:
+                key, sent = next(iter(self._in_flight.items()))
+                if now - sent < self.timeout:
+                    break
+                del self._in_flight[key]
+                self._interval.timeouts += 1
+            interval, self._interval = self._interval, Counters()
+            in_flight = len(self._in_flight)
+        self.total.add(interval)
+        return {"interval": index, "sent": interval.sent, "received": interval.received,
+                "qps": round(interval.received / REPORT_INTERVAL, 1), "timeouts": interval.timeouts,
+                "errors": interval.errors(), "in_flight": in_flight}
+
+    def summary(self, elapsed: float) -> Dict:
+        """Latency percentiles in milliseconds, timeout and error rates, and throughput achieved during elapsed"""
+        with self._lock:
+            self.total.add(self._interval)
+            self._interval = Counters()
+        sent = self.total.sent or 1
+        return {"summary": {
+            "target": str(self.resolver), "target_qps": self.qps, "sent": self.total.sent,
+            "received": self.total.received, "qps": round(self.total.received / elapsed, 1),
+            "latency_ms": {"p{}".format(percent): _to_ms(self.latencies.percentile(percent))
+                           for percent in PERCENTILES},
+            "timeout_rate": round(self.total.timeouts / sent, 4),
+            "error_rate": round(self.total.errors() / sent, 4),
+            "rcodes": dict(self.total.rcodes)}}
+
+
+def _to_ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def load_test(resolver: Resolver, queries: List[Query], qps: float, duration: float) -> Iterator[Dict]:
+    """Run a load test against a resolver"""
+    return LoadTest(resolver=resolver, queries=queries, qps=qps, duration=duration).run()
@@ -0,0 +1,188 @@
+"""Profiling of a check: time spent in each stage, and sampled stacks for flamegraphs"""
+import collections
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+SAMPLING_INTERVAL = 0.001
+
+
+class _Sampler:
+    """Sample the stacks of the attached threads in the background"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Dict[str, int] = collections.Counter()
+        # thread id => number of nested contexts of the thread attached to the profiler
+        self._threads: Dict[int, int] = collections.Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        """Start sampling"""
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling"""
+        self._stop.set()
+        self._thread.join()
+
+    def attach(self, thread_id: int):
+        """Sample the stacks of a thread, until it is detached as many times as it was attached"""
+        with self._lock:
+            self._threads[thread_id] += 1
+
+    def detach(self, thread_id: int):
+        """The thread does not run profiled code anymore"""
+        with self._lock:
+            self._threads[thread_id] -= 1
+            if not self._threads[thread_id]:
+                del self._threads[thread_id]
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self._threads)
+            frames_by_thread = sys._current_frames()  # pylint: disable=protected-access
+            for frame in (frames_by_thread[thread_id] for thread_id in thread_ids if thread_id in frames_by_thread):
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(frames))] += 1
+
+
+class Profiler:
+    """
+    Stage times are measured where stages are explicitly marked with stage(), stacks of the threads running the
+    profiled code are sampled in the background and collapsed for flamegraphs
+    """
+
+    def __init__(self, interval: float = SAMPLING_INTERVAL):
+        self.inclusive: Dict[str, float] = collections.defaultdict(float)
+        self.exclusive: Dict[str, float] = collections.defaultdict(float)
+        self.calls: Dict[str, int] = collections.defaultdict(int)
+        self.elapsed = 0.0
+        self.sampler = _Sampler(interval)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started = 0.0
+
+    @property
+    def stacks(self) -> Dict[str, int]:
+        """Number of samples by collapsed stack"""
+        return self.sampler.stacks
+
+    def start(self):
+        """Start sampling"""
+        self._started = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self):
+        """Stop sampling"""
+        self.sampler.stop()
+        self.elapsed = time.perf_counter() - self._started
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Measure a stage, time spent in nested stages is excluded from its exclusive time"""
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                self.inclusive[name] += elapsed
+                self.exclusive[name] += elapsed - children
+                self.calls[name] += 1
+
+    def breakdown(self) -> Dict:
+        """Time spent per stage, sorted by exclusive time"""
+        stages = sorted(self.calls, key=lambda name: self.exclusive[name], reverse=True)
+        return {"elapsed": round(self.elapsed, 6),
+                "stages": [{"stage": name, "calls": self.calls[name], "inclusive": round(self.inclusive[name], 6),
+                            "exclusive": round(self.exclusive[name], 6)} for name in stages]}
+
+    def collapsed(self) -> str:
+        """Sampled stacks in collapsed format, as read by flamegraph.pl or speedscope"""
+        return "".join("{} {}\n".format(stack, count) for stack, count in sorted(self.stacks.items()))
+
+    def write(self, prefix: str):
+        """Write <prefix>.stages.json and <prefix>.collapsed"""
+        with open("{}.stages.json".format(prefix), "w") as stages_file:
+            json.dump(self.breakdown(), stages_file, indent=2)
+        with open("{}.collapsed".format(prefix), "w") as collapsed_file:
+            collapsed_file.write(self.collapsed())
+
+
+# profiler of the run executed by the thread, functions submitted to pools get it with propagate()
+_LOCAL = threading.local()
+
+
+def current() -> Optional[Profiler]:
+    """Profiler of the run executed by this thread, None if it is not profiled"""
+    return getattr(_LOCAL, "profiler", None)
+
+
+@contextlib.contextmanager
+def _attached(profiler: Profiler):
+    """Run the context of this thread with the profiler"""
+    previous = current()
+    _LOCAL.profiler = profiler
+    profiler.sampler.attach(threading.get_ident())
+    try:
+        yield
+    finally:
+        profiler.sampler.detach(threading.get_ident())
+        _LOCAL.profiler = previous
+
+
+def propagate(func: Callable) -> Callable:
+    """Wrap a function submitted to a pool, so that it runs with the profiler of the thread submitting it"""
+    profiler = current()
+    if profiler is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _attached(profiler):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Mark a stage, it is measured only while the run is profiled"""
+    profiler = current()
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
+
+
+@contextlib.contextmanager
+def profile():
+    """
+    Profile the code run in this context by this thread, and by functions it submits to pools with propagate().
+    Other threads are not profiled, so concurrent runs do not show up in the profile.
+    """
+    profiler = Profiler()
+    profiler.start()
+    try:
+        with _attached(profiler):
+            yield profiler
+    finally:
+        profiler.stop()
@@ -0,0 +1,76 @@
+"""Forward-confirmed reverse DNS sweep of IP prefixes"""
+import ipaddress
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional
+
+import dns.reversename
+
+from dns_debugger.exceptions import DnsDebuggerException, QueryErrException
+from dns_debugger.executors.testsuite import TestCase
+from dns_debugger.query import dns_query, Resolver
+from dns_debugger.records_models import DataType, RRSet
+
+MAX_IN_FLIGHT = 256
+# CNAME chain length followed, PTR records of classless delegations (RFC 2317) are behind a CNAME
+MAX_CNAMES = 8
+
+TEST_DESCRIPTION = "Checking forward-confirmed reverse DNS for {}"
+
+
+def iter_addresses(prefixes: Iterable[str]) -> Iterator[str]:
+    """
+    Addresses of the prefixes, generated lazily
+    >>> list(iter_addresses(["192.0.2.0/31", "2001:db8::1"]))
+    ['192.0.2.0', '192.0.2.1', '2001:db8::1']
+    """
+    for prefix in prefixes:
+        for address in ipaddress.ip_network(prefix, strict=False):
+            yield str(address)
+
+
+def check_address(ip_addr: str, resolver: Optional[Resolver] = None) -> TestCase:
+    """Check the PTR of the address, and that one of its targets resolves back to the address"""
+    description = TEST_DESCRIPTION.format(ip_addr)
+    address = ipaddress.ip_address(ip_addr)
+    rdtype = DataType.A if address.version == 4 else DataType.AAAA
+    try:
+        ptr_records = _query(qname=dns.reversename.from_address(ip_addr).to_text(), rdtype=DataType.PTR,
+                             resolver=resolver)
+        if ptr_records.rdtype != DataType.PTR.value:
+            return TestCase(description=description, result="No PTR record", success=False)
+        targets = [record.target for record in ptr_records.records]
+        for target in targets:
+            forward = _query(qname=target, rdtype=rdtype, resolver=resolver)
+            if forward.rdtype == rdtype.value and \
+                    any(ipaddress.ip_address(record.address) == address for record in forward.records):
+                return TestCase(description=description, result="{} => {}".format(target, forward), success=True)
+    except DnsDebuggerException as err:
+        return TestCase(description=description, result=err.message, success=False)
+    return TestCase(description=description,
+                    result="No {} record of {} points back to {}".format(rdtype.name, ", ".join(targets), ip_addr),
+                    success=False)
+
+
+def _query(qname: str, rdtype: DataType, resolver: Optional[Resolver]) -> RRSet:
+    """Records of the type, following CNAME records"""
+    for _ in range(MAX_CNAMES + 1):
+        rrset = dns_query(qname=qname, rdtype=rdtype, resolver=resolver)
+        if rrset.rdtype != DataType.CNAME.value:
+            return rrset
+        qname = rrset.records[0].target
+    raise QueryErrException(message="Too many CNAME records resolving {} {}".format(qname, rdtype.name))
+
+
+def sweep(prefixes: Iterable[str], resolver: Optional[Resolver] = None,
+          max_in_flight: int = MAX_IN_FLIGHT) -> Iterator[TestCase]:
+    """Check all addresses of the prefixes with bounded concurrency, testcases are yielded in addresses order"""
+    resolver = resolver or Resolver()
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for ip_addr in iter_addresses(prefixes):
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().result()
+            in_flight.append(pool.submit(check_address, ip_addr, resolver))
+        while in_flight:
+            yield in_flight.popleft().result()
@@ -1,18 +1,67 @@
 """All methods related to DNS query"""
+import contextlib
+import ipaddress
 import random
+import socket
+import threading
+import time
 import typing
-from typing import Optional, Dict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Optional, Dict, List, Sequence, Tuple
 
 import dns
+import dns.flags
 from dns import resolver as dnsresolver
-from dns.rcode import NOERROR, _by_value
+from dns.rcode import NOERROR, NXDOMAIN, REFUSED, SERVFAIL, _by_value
 
 from dns_debugger import LOGGER
+from dns_debugger.cache import get_cache
+from dns_debugger.capture import endpoint, get_recorder, get_replay
+from dns_debugger.dnsname import DnsName
+from dns_debugger.edns import EDNS_CAPABILITIES, EDNS_PAYLOADS
 from dns_debugger.exceptions import QueryTimeException, QueryErrException, DnsDebuggerException, \
-    QueryNoResponseException
-from dns_debugger.records_models import RRSet, DataType, A, TXT, NS, Soa, AAAA, MX, DnsKey, RRSig, DS, PTR, Record
+    QueryNoResponseException, QueryRcodeException
+from dns_debugger.executors.testsuite import TestCase
+from dns_debugger.profiling import propagate, stage
+from dns_debugger.ratelimit import get_limiter
+from dns_debugger.records_models import RRSet, DataType, A, TXT, NS, Soa, AAAA, MX, DnsKey, RRSig, DS, PTR, Record, \
+    NSEC, NSEC3, CNAME
+from dns_debugger.transports import TRANSPORTS, UDP, HTTPS, DEFAULT_PORTS, TcpConnection
 
 DEFAULT_TIMEOUT = 10
+DNS_PORT = 53
+
+ROOT_HINTS = [
+    ("a.root-servers.net.", "198.41.0.4"),
+    ("b.root-servers.net.", "170.247.170.2"),
+    ("c.root-servers.net.", "192.33.4.12"),
+    ("d.root-servers.net.", "199.7.91.13"),
+    ("e.root-servers.net.", "192.203.230.10"),
+    ("f.root-servers.net.", "192.5.5.241"),
+    ("g.root-servers.net.", "192.112.36.4"),
+    ("h.root-servers.net.", "198.97.190.53"),
+    ("i.root-servers.net.", "192.36.148.17"),
+    ("j.root-servers.net.", "192.58.128.30"),
+    ("k.root-servers.net.", "193.0.14.129"),
+    ("l.root-servers.net.", "199.7.83.42"),
+    ("m.root-servers.net.", "202.12.27.33"),
+]
+MAX_REFERRALS = 30
+MAX_DEPTH = 8
+RACE_WIDTH = 2
+ITERATIVE_WORKERS = 16
+# error status of a nameserver on which the next nameserver of the zone is queried
+FAILOVER_RCODES = (SERVFAIL, REFUSED)
+
+# queries raced by the iterative resolvers, its tasks do not wait for other tasks so that it can be shared
+ITERATIVE_POOL = ThreadPoolExecutor(max_workers=ITERATIVE_WORKERS)
+
+# identical queries sent concurrently, by checks of zones sharing parents, share one exchange
+_IN_FLIGHT: Dict[Tuple, Future] = {}
+_IN_FLIGHT_LOCK = threading.Lock()
+
+_TTL_OBSERVERS: List['TtlObserver'] = []
+_TTL_OBSERVERS_LOCK = threading.Lock()
 
 MODELS_MAP: Dict[int, Record] = {
     DataType.A.value: A,
@@ -24,14 +73,19 @@ MODELS_MAP: Dict[int, Record] = {
     DataType.DNSKEY.value: DnsKey,
     DataType.RRSIG.value: RRSig,
     DataType.DS.value: DS,
-    DataType.PTR.value: PTR
+    DataType.PTR.value: PTR,
+    DataType.NSEC.value: NSEC,
+    DataType.NSEC3.value: NSEC3,
+    DataType.CNAME.value: CNAME
 }
 
 
-class Resolver(typing.NamedTuple("Resolver", [("ip_addr", str), ("qname", str)])):
-    """Resolver"""
+class Resolver(typing.NamedTuple("Resolver", [("ip_addr", str), ("qname", str), ("transport", str),
+                                               ("port", int)])):
+    """Resolver, queried over UDP, DNS over TLS or DNS over HTTPS"""
 
-    def __new__(cls, ip_addr: Optional[str] = None, qname: Optional[str] = None):
+    def __new__(cls, ip_addr: Optional[str] = None, qname: Optional[str] = None, transport: str = UDP,
+                port: Optional[int] = None):
 
         if ip_addr is None and qname is None:
             ip_addr = dnsresolver.Resolver().nameservers[0]
@@ -45,20 +99,63 @@ class Resolver(typing.NamedTuple("Resolver", [("ip_addr", str), ("qname", str)])
             arpa_qname = dns.reversename.from_address(ip_addr)
             qname = dns_query(qname=arpa_qname, rdtype=DataType.PTR).records[0].target
 
-        return super(Resolver, cls).__new__(cls, ip_addr, qname)
+        return super(Resolver, cls).__new__(cls, ip_addr, qname, transport, port or DEFAULT_PORTS[transport])
+
+    @classmethod
+    def from_string(cls, resolver: str) -> 'Resolver':
+        """
+        Create a resolver from 'default', IP, tls://IP or https://IP, followed by #PORT if not the default one
+        """
+        if resolver == "default":
+            return cls()
+        transport, _, address = resolver.rpartition("://")
+        transport = transport or UDP
+        if transport not in DEFAULT_PORTS:
+            raise DnsDebuggerException(message="Unknown transport {}, available transports are {}".format(
+                transport, ", ".join(DEFAULT_PORTS)))
+        ip_addr, _, port = address.partition("#")
+        try:
+            ipaddress.ip_address(ip_addr)
+            port = int(port) if port else None
+        except ValueError as err:
+            raise DnsDebuggerException(message="Invalid resolver {}: {}".format(resolver, err))
+        return cls(ip_addr=ip_addr, transport=transport, port=port)
 
     def __str__(self):
-        return '[{} | {}]'.format(self.qname, self.ip_addr)
+        if self.transport == UDP:
+            return '[{} | {}]'.format(self.qname, self.ip_addr)
+        return '[{} | {}://{}]'.format(self.qname, self.transport, self.ip_addr)
+
 
+# a zone cut with its nameservers
+Cut = Tuple[str, List[Resolver]]
 
-def dns_query(qname: str, rdtype: DataType, want_dnssec: bool = False, resolver: Optional['Resolver'] = None) -> RRSet:
-    """Make a DNS query"""
+
+def get_addresses(qname: str, resolver: Optional['Resolver'] = None,
+                  rdtypes: Sequence[DataType] = (DataType.A, DataType.AAAA)) -> List[str]:
+    """Get IPv4 and IPv6 addresses of a qname, or only the address types of rdtypes"""
+    addresses = []
+    for rdtype in rdtypes:
+        try:
+            rrset = dns_query(qname=qname, rdtype=rdtype, resolver=resolver)
+        except DnsDebuggerException as err:
+            LOGGER.warning("Cannot get %s records for %s: %s", rdtype.name, qname, err.message)
+            continue
+        if rrset.rdtype == rdtype.value:
+            addresses.extend(record.address for record in rrset.records)
+    return addresses
+
+
+def dns_query(qname: str, rdtype: DataType, want_dnssec: bool = False, resolver: Optional['Resolver'] = None,
+              use_cache: bool = True) -> RRSet:
+    """Make a DNS query, use_cache=False gets a fresh response even if one is in the persistent cache"""
     if resolver is None:
         resolver = Resolver()
 
     LOGGER.debug("Querying %s for type %s, origin %s", qname, rdtype.name, resolver)
 
-    response = run_query(resolver.ip_addr, qname, rdtype, want_dnssec)
+    response = run_query(resolver.ip_addr, qname, rdtype, want_dnssec, port=resolver.port,
+                         transport=resolver.transport, use_cache=use_cache)
 
     answer = response.answer or response.authority
     if not answer:
@@ -69,49 +166,466 @@ def dns_query(qname: str, rdtype: DataType, want_dnssec: bool = False, resolver:
         raise QueryNoResponseException(message="DNSSEC not supported")
 
     mapped_answers = map_answers(answer, want_dnssec)
+    if want_dnssec:
+        denial_types = (DataType.NSEC.value, DataType.NSEC3.value, DataType.RRSIG.value)
+        mapped_answers.denial = map_section([rrset for rrset in response.authority if rrset.rdtype in denial_types],
+                                            want_dnssec)
+    mapped_answers.glue = map_glue(response.additional)
     LOGGER.debug("Response is %s", mapped_answers)
     return mapped_answers
 
 
+def map_glue(additional) -> Dict[str, List[str]]:
+    """Addresses received in the additional section by lowercase name, IPv4 addresses first"""
+    glue: Dict[str, List[str]] = {}
+    for rdtype in (DataType.A.value, DataType.AAAA.value):
+        for rrset in additional:
+            if rrset.rdtype == rdtype:
+                glue.setdefault(rrset.name.to_text().lower(), []).extend(item.address for item in rrset.items)
+    return glue
+
+
 def map_answers(answer, want_dnssec):
     """
     Map answers from dnspython to own object
     :param answer: Answer received from dnspython
     :param want_dnssec: DNSSEC wanted or not, will set rrsig if wanted
-    :return:
+    :return: the first RRSET of the answer
     """
-    received_rrset = answer[0]
-    records = list(map(_map_pythondns_record, received_rrset.items))
-    rrset = RRSet(rdata=received_rrset, name=received_rrset.name.to_text(), records=records,
-                  rdtype=received_rrset.rdtype, rdclass=received_rrset.rdclass, ttl=received_rrset.ttl)
-    if want_dnssec:
-        rrset.rrsig = [_map_pythondns_record(r) for r in answer[1]]
-    return rrset
+    rrsets = map_section(answer, want_dnssec)
+    if not rrsets:
+        raise QueryErrException(message="No answer received")
+    return rrsets[0]
 
 
-def run_query(resolver_ip: str, qname: str, rdtype: DataType, want_dnssec: bool):
+def map_section(section, want_dnssec) -> List[RRSet]:
+    """
+    Map all RRSETs of a response section from dnspython to own object
+    :param section: Section received from dnspython
+    :param want_dnssec: DNSSEC wanted or not, will set rrsig of each RRSET if wanted
+    :return: RRSETs of the section, RRSIG RRSETs are attached to the RRSET they cover
+    """
+    with stage("parse"), stage("map_answers"):
+        signatures = {(rrset.name, rrset.covers): rrset for rrset in section
+                      if rrset.rdtype == DataType.RRSIG.value}
+        rrsets = []
+        for received_rrset in section:
+            if received_rrset.rdtype == DataType.RRSIG.value:
+                continue
+            records = list(map(_map_pythondns_record, received_rrset.items))
+            rrset = RRSet(rdata=received_rrset, name=received_rrset.name.to_text(), records=records,
+                          rdtype=received_rrset.rdtype, rdclass=received_rrset.rdclass, ttl=received_rrset.ttl)
+            if want_dnssec:
+                rrset.rrsig = [_map_pythondns_record(r)
+                               for r in signatures.get((received_rrset.name, received_rrset.rdtype), [])]
+            rrsets.append(rrset)
+        return rrsets
+
+
+def run_query(resolver_ip: str, qname: str, rdtype: DataType, want_dnssec: bool,  # pylint: disable=too-many-arguments
+              port: int = DNS_PORT, recursion_desired: bool = True, transport: str = UDP,
+              use_cache: bool = True):
     """
     Make a DNS query
     :param resolver_ip: IP of wanted resolver
     :param qname: qname to target
     :param rdtype: type to record to target
     :param want_dnssec: Want DNSSEC or not
+    :param port: port of the resolver
+    :param recursion_desired: RD flag, unset it to query authoritative servers iteratively
+    :param transport: udp, tls or https, queries over UDP are retried over TCP when truncated
+    :param use_cache: look for the response in the persistent cache, a fresh response is stored anyway
     :return:
     """
-    message = dns.message.make_query(qname, rdtype.value, use_edns=0, payload=4096, want_dnssec=want_dnssec)
+    server = resolver_ip if port == DNS_PORT else "{}#{}".format(resolver_ip, port)
+    if transport != UDP:
+        server = "{}://{}".format(transport, server)
+    cache = get_cache()
+    cache_key = cache.response_key(server, qname, rdtype.value, want_dnssec) if cache is not None else None
+    response = _cached_response(cache, cache_key) if use_cache else None
+    if response is None:
+        query = dict(qname=qname, rdtype=rdtype.value, want_dnssec=want_dnssec, recursion_desired=recursion_desired)
+        in_flight_key = (server, str(qname).lower(), rdtype.value, want_dnssec, recursion_desired)
+        response, received = _deduplicated(in_flight_key,
+                                           lambda: _network_query(server, resolver_ip, port, transport, query))
+        if received and cache is not None:
+            cache.set_response(cache_key, response.to_wire(), ttl=_min_ttl(response))
+    _observe_ttl(qname, response)
+    return response
+
+
+def _cached_response(cache, cache_key):
+    """Response from the persistent cache, None if there is no cache or the response is not in it"""
+    cached = cache.get_response(cache_key) if cache is not None else None
+    if cached is None:
+        return None
+    LOGGER.debug("Response found in cache for %s", cache_key)
+    with stage("parse"):
+        return _from_cached_wire(*cached)
+
+
+def _deduplicated(in_flight_key: Tuple, exchange: Callable):
+    """
+    Run the exchange, or wait for the response of the identical query in flight
+    :return: the response, and True if it was received by this exchange
+    """
+    with _IN_FLIGHT_LOCK:
+        future = _IN_FLIGHT.get(in_flight_key)
+        owner = future is None
+        if owner:
+            future = _IN_FLIGHT[in_flight_key] = Future()
+    if not owner:
+        LOGGER.debug("Identical query in flight, waiting for its response %s", in_flight_key)
+        return future.result(), False
     try:
-        response = dns.query.udp(message, resolver_ip, timeout=DEFAULT_TIMEOUT)
-    except dns.exception.Timeout:
-        raise QueryTimeException(message="Timeout during dns query "
-                                         "(origin={}, dest={}, type={})".format(resolver_ip, qname, rdtype.name))
+        future.set_result(exchange())
+    except Exception as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        with _IN_FLIGHT_LOCK:
+            del _IN_FLIGHT[in_flight_key]
+    return future.result(), True
+
+
+class TtlObserver:
+    """Minimum TTL of the responses received for a qname and its subdomains, None until a response is received"""
+
+    def __init__(self, qname: str):
+        self.qname = DnsName.from_text(str(qname))
+        self.min_ttl: Optional[int] = None
+
+
+@contextlib.contextmanager
+def observe_ttls(qname: str):
+    """Observe the TTLs of the responses received for qname and its subdomains while in the context"""
+    observer = TtlObserver(qname)
+    with _TTL_OBSERVERS_LOCK:
+        _TTL_OBSERVERS.append(observer)
+    try:
+        yield observer
+    finally:
+        with _TTL_OBSERVERS_LOCK:
+            _TTL_OBSERVERS.remove(observer)
+
+
+def _observe_ttl(qname: str, response):
+    if not _TTL_OBSERVERS:
+        return
+    ttl = _min_ttl(response)
+    if ttl <= 0:
+        return
+    name = DnsName.from_text(str(qname))
+    with _TTL_OBSERVERS_LOCK:
+        for observer in _TTL_OBSERVERS:
+            if name.is_subdomain(observer.qname):
+                observer.min_ttl = ttl if observer.min_ttl is None else min(observer.min_ttl, ttl)
+
+
+def _network_query(server: str, resolver_ip: str, port: int, transport: str, query: Dict):
+    """Exchange the query with the server, or with the replayed capture, and record it if asked"""
+    recorder, captured = get_recorder(), endpoint(transport, resolver_ip, port)
+    with _rate_limit(resolver_ip if get_replay() is None else None), stage("network"):
+        started = time.perf_counter()
+        try:
+            message, response = _exchange_over(server, resolver_ip, port, transport, query)
+        except QueryTimeException:
+            if recorder is not None:
+                recorder.record(captured, make_query(query, payload=EDNS_PAYLOADS[0]).to_wire(), b"",
+                                rtt=time.perf_counter() - started)
+            raise
+    if recorder is not None:
+        recorder.record(captured, message.to_wire(), response.to_wire(), rtt=time.perf_counter() - started)
     if response.rcode() != NOERROR:
-        raise QueryErrException(message="Error during DNS query, status is {}".format(_by_value.get(response.rcode())))
+        raise QueryRcodeException(message="Error during DNS query, status is {}".format(
+            _by_value.get(response.rcode())), response=response)
     return response
 
 
+def _exchange_over(server: str, resolver_ip: str, port: int, transport: str, query: Dict):
+    """Exchange the query over the transport, or with the replayed capture"""
+    replay = get_replay()
+    if replay is not None:
+        message = make_query(query, payload=EDNS_PAYLOADS[0])
+        return message, replay.exchange(endpoint(transport, resolver_ip, port), message)
+    if transport == UDP:
+        return _exchange(server, resolver_ip, port, query)
+    return _exchange_encrypted(transport, resolver_ip, port, query)
+
+
+@contextlib.contextmanager
+def _rate_limit(resolver_ip: Optional[str]):
+    """Wait for the rate limiter, if configured, before sending a query to resolver_ip"""
+    limiter = get_limiter()
+    if limiter is None or resolver_ip is None:
+        yield
+        return
+    with limiter.limit(resolver_ip):
+        yield
+
+
+def _exchange(server: str, resolver_ip: str, port: int, query: Dict):
+    """
+    Send the query over UDP with the EDNS buffer size known to work for this server.
+    On timeout the buffer size is downgraded and the query sent again, truncated responses are retried over TCP.
+    The query message which got the response is returned with it.
+    """
+    payload = EDNS_CAPABILITIES.get(server)
+    deadline = time.time() + DEFAULT_TIMEOUT
+    while True:
+        message = make_query(query, payload)
+        try:
+            timeout = EDNS_CAPABILITIES.timeout(server, max(deadline - time.time(), 0))
+            response = _exchange_udp(message, resolver_ip, port, timeout)
+        except dns.exception.Timeout:
+            payload = EDNS_CAPABILITIES.downgrade(server, payload)
+            if payload is None:
+                raise QueryTimeException(message="Timeout during dns query (origin={}, dest={}, type={})".format(
+                    server, query["qname"], DataType(query["rdtype"]).name))
+            LOGGER.info("Timeout from %s, retrying with EDNS buffer size %d", server, payload)
+            continue
+        EDNS_CAPABILITIES.confirm(server, payload)
+        if response.flags & dns.flags.TC:
+            LOGGER.debug("Truncated response from %s, retrying over TCP", server)
+            response = _exchange_tcp(message, resolver_ip, port)
+        return message, response
+
+
+def make_query(query: Dict, payload: int):
+    """Build a query message from qname, rdtype, want_dnssec and recursion_desired"""
+    message = dns.message.make_query(query["qname"], query["rdtype"], use_edns=0, payload=payload,
+                                     want_dnssec=query["want_dnssec"])
+    if not query["recursion_desired"]:
+        message.flags &= ~dns.flags.RD
+    return message
+
+
+def _exchange_encrypted(transport: str, resolver_ip: str, port: int, query: Dict):
+    """Send the query over a pooled DoT or DoH connection, there is no fragmentation so no EDNS fallback"""
+    message = make_query(query, payload=EDNS_PAYLOADS[0])
+    if transport == HTTPS:
+        message.id = 0  # RFC 8484 recommends ID 0 for HTTP caches
+    wire = TRANSPORTS.exchange(transport, (resolver_ip, port), message.to_wire(), timeout=DEFAULT_TIMEOUT)
+    return message, _parse_response(message, wire, "{}://{}".format(transport, resolver_ip))
+
+
+def _exchange_udp(message, resolver_ip: str, port: int, timeout: float):
+    """Send the query from a connected socket, so that only the server can answer it, the response is parsed apart"""
+    try:
+        with socket.socket(socket.AF_INET6 if ":" in resolver_ip else socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect((resolver_ip, port))
+            sock.send(message.to_wire())
+            wire = sock.recv(65535)
+    except socket.timeout:
+        raise dns.exception.Timeout
+    except OSError as err:
+        # network unreachable, on a host without IPv6 for instance, no buffer size would help
+        raise QueryTimeException(message="UDP query to {} failed: {}".format(resolver_ip, err))
+    return _parse_response(message, wire, resolver_ip)
+
+
+def _exchange_tcp(message, resolver_ip: str, port: int):
+    try:
+        with contextlib.closing(TcpConnection((resolver_ip, port), timeout=DEFAULT_TIMEOUT)) as connection:
+            wire = connection.exchange(message.to_wire())
+    except (OSError, EOFError) as err:
+        raise QueryTimeException(message="TCP query to {} failed: {}".format(resolver_ip, err))
+    return _parse_response(message, wire, resolver_ip)
+
+
+def _parse_response(message, wire: bytes, server: str):
+    """Parse a response received from the network, it must answer the query"""
+    with stage("parse"):
+        try:
+            response = dns.message.from_wire(wire)
+        except dns.exception.DNSException as err:
+            raise QueryErrException(message="Invalid response from {}: {}".format(server, err))
+    if not message.is_response(response):
+        raise QueryErrException(message="Response from {} does not match the query".format(server))
+    return response
+
+
+def _min_ttl(response) -> int:
+    """Minimum TTL of all RRSETs in the response, the response must not be cached longer"""
+    rrsets = response.answer + response.authority + response.additional
+    return min((rrset.ttl for rrset in rrsets), default=0)
+
+
+def _from_cached_wire(wire: bytes, remaining_ttl: int):
+    """Rebuild a response from the cache, TTLs are decreased by the time spent in the cache"""
+    response = dns.message.from_wire(wire)
+    for rrset in response.answer + response.authority + response.additional:
+        rrset.ttl = min(rrset.ttl, remaining_ttl)
+    return response
+
+
+def records_from_text(rdtype: int, texts: List[str]) -> List[Record]:
+    """Create records from their rdata in text format"""
+    return [_map_pythondns_record(dns.rdata.from_text(dns.rdataclass.IN, rdtype, text)) for text in texts]
+
+
 def _map_pythondns_record(record):
     """Get a record form pythondns and map it to our format"""
     record_cls = MODELS_MAP.get(record.rdtype)
     if record_cls is None:
         raise DnsDebuggerException("Unknown record type %s" % record.rdtype)
     return record_cls.create_from_rdata(rdata=record)
+
+
+def _first_rrset(rrsets, rdtype: DataType):
+    return next((rrset for rrset in rrsets if rrset.rdtype == rdtype.value), None)
+
+
+def _final_answer(response, rdtype: DataType, want_dnssec: bool) -> Optional[Tuple[RRSet, str]]:
+    """Records of the type, else a CNAME, else the SOA of a negative answer, with their trace; None for a referral"""
+    answer = map_section(response.answer, want_dnssec)
+    rrset = _first_rrset(answer, rdtype)
+    if rrset is not None:
+        return rrset, str(rrset)
+    rrset = _first_rrset(answer, DataType.CNAME)
+    if rrset is not None:
+        return rrset, "CNAME {}".format(rrset)
+    if _first_rrset(response.authority, DataType.NS) is not None:
+        return None
+    soa = map_answers(response.authority, want_dnssec)
+    return soa, "No records, {}".format(soa)
+
+
+def _is_final(response) -> bool:
+    """
+    Is an error status final, the other nameservers of the zone would give the same: an authoritative NXDOMAIN, or
+    any error but SERVFAIL and REFUSED which are specific to a broken or lame server
+    """
+    if response.rcode() == NXDOMAIN:
+        return bool(response.flags & dns.flags.AA)
+    return response.rcode() not in FAILOVER_RCODES
+
+
+class IterativeResolver:
+    """
+    Resolve qnames from the root servers by following referrals, like a recursive resolver would.
+    NS and addresses of the zone cuts are kept in an infrastructure cache until their TTL expires.
+    """
+
+    def __init__(self, hints: Optional[List[Tuple[str, str]]] = None, port: int = DNS_PORT):
+        self.port = port
+        self.hints = [Resolver(ip_addr=ip_addr, qname=name) for name, ip_addr in (hints or ROOT_HINTS)]
+        # zone cut => expiry, nameservers and parent zone cut
+        self._zones: Dict[str, Tuple[float, List[Resolver], str]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, qname: str, rdtype: DataType, want_dnssec: bool = False,
+                trace: Optional[List[TestCase]] = None, depth: int = 0) -> RRSet:
+        """
+        Resolve a qname, each query made is appended to trace
+        :return: the answer, or the SOA RRSET if there is no record of this type
+        """
+        return self._resolve(qname, rdtype, want_dnssec, trace if trace is not None else [], depth)[0]
+
+    def delegation(self, qname: str, trace: Optional[List[TestCase]] = None) -> List[Cut]:
+        """
+        Resolve the NS of a qname, each query made is appended to trace
+        :return: the zone cuts from the root to the zone of qname with their nameservers, each one was followed by
+        this resolution or is still in the infrastructure cache with all its parents
+        """
+        return self._resolve(qname, DataType.NS, False, trace if trace is not None else [], 0)[1]
+
+    def _resolve(self, qname: str, rdtype: DataType, want_dnssec: bool,  # pylint: disable=too-many-arguments
+                 trace: List[TestCase], depth: int) -> Tuple[RRSet, List[Cut]]:
+        if depth > MAX_DEPTH:
+            raise QueryErrException(message="Too many CNAME or glueless delegations resolving {}".format(qname))
+        cuts = self._closest_cuts(qname)
+
+        for _ in range(MAX_REFERRALS):
+            server, response = self._query_servers(cuts[-1][1], qname, rdtype, want_dnssec)
+            description = "Querying {} for {} records of {}".format(server, rdtype.name, qname)
+            final = _final_answer(response, rdtype, want_dnssec)
+            if final is not None:
+                rrset, result = final
+                trace.append(TestCase(description=description, result=result, success=True))
+                if rrset.rdtype == DataType.CNAME.value and rdtype != DataType.CNAME:
+                    return self._resolve(rrset.records[0].target, rdtype, want_dnssec, trace, depth + 1)
+                return rrset, cuts
+            referral = _first_rrset(response.authority, DataType.NS)
+            cuts.append(self._follow_referral(cuts[-1][0], qname, referral, response.additional, depth))
+            trace.append(TestCase(description=description, result="Referral to {} => {}".format(
+                cuts[-1][0], ", ".join(sorted({str(server.qname) for server in cuts[-1][1]}))), success=True))
+        raise QueryErrException(message="Too many referrals resolving {}".format(qname))
+
+    def _closest_cuts(self, qname: str) -> List[Cut]:
+        """
+        Zone cuts from the root to the deepest zone cut of qname in the infrastructure cache, a cut is only used if
+        none of its parents expired, so that the chain from the root has no hole
+        """
+        now = time.time()
+        with self._lock:
+            for zone in reversed(DnsName.from_text(qname).lineage[1:]):
+                cuts = []
+                name = zone.text
+                while name in self._zones and self._zones[name][0] > now:
+                    _, servers, parent = self._zones[name]
+                    cuts.insert(0, (name, servers))
+                    name = parent
+                if cuts and name == ".":
+                    return [(".", self.hints)] + cuts
+        return [(".", self.hints)]
+
+    def _query_servers(self, servers: List[Resolver], qname: str, rdtype: DataType, want_dnssec: bool):
+        """Query servers RACE_WIDTH at a time, first response wins"""
+        errors = []
+        for offset in range(0, len(servers), RACE_WIDTH):
+            futures = {ITERATIVE_POOL.submit(propagate(run_query), server.ip_addr, qname, rdtype, want_dnssec,
+                                         port=self.port, recursion_desired=False): server
+                       for server in servers[offset:offset + RACE_WIDTH]}
+            for future in as_completed(futures):
+                try:
+                    return futures[future], future.result()
+                except QueryRcodeException as err:
+                    if _is_final(err.response):
+                        raise QueryErrException(message="{} answered {} for {}".format(
+                            futures[future], _by_value.get(err.response.rcode()), qname))
+                    LOGGER.warning("Query to %s failed: %s", futures[future], err.message)
+                    errors.append("{} => {}".format(futures[future], err.message))
+                except DnsDebuggerException as err:
+                    LOGGER.warning("Query to %s failed: %s", futures[future], err.message)
+                    errors.append("{} => {}".format(futures[future], err.message))
+        raise QueryErrException(message="No nameserver answered for {}\n{}".format(qname, "\n".join(errors)))
+
+    def _follow_referral(self, zone: str, qname: str, ns_rrset, additional,  # pylint: disable=too-many-arguments
+                         depth: int) -> Tuple[str, List[Resolver]]:
+        """Get the nameservers of the child zone from glue, glueless nameservers are resolved in parallel"""
+        child = DnsName.from_text(ns_rrset.name.to_text())
+        if child == DnsName.from_text(zone) or not child.is_subdomain(DnsName.from_text(zone)) \
+                or not DnsName.from_text(qname).is_subdomain(child):
+            raise QueryErrException(message="Invalid referral from {} to {} for {}".format(zone, child, qname))
+
+        glue = map_glue(additional)
+        targets = sorted(item.target.to_text() for item in ns_rrset.items)
+        servers = [Resolver(ip_addr=ip_addr, qname=target) for target in targets
+                   for ip_addr in glue.get(target.lower(), [])]
+        if not servers:
+            with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+                addresses = pool.map(propagate(lambda target: self._resolve_address(target, depth)), targets)
+                servers = [Resolver(ip_addr=ip_addr, qname=target)
+                           for target, ip_addrs in zip(targets, addresses) for ip_addr in ip_addrs]
+        if not servers:
+            raise QueryErrException(message="No address found for nameservers of {}".format(child))
+
+        servers.sort(key=lambda server: ':' in server.ip_addr)
+        with self._lock:
+            self._zones[child.text] = (time.time() + ns_rrset.ttl, servers, zone)
+        return child.text, servers
+
+    def _resolve_address(self, target: str, depth: int) -> List[str]:
+        """IPv4 and IPv6 addresses of a glueless nameserver"""
+        addresses = []
+        for rdtype in (DataType.A, DataType.AAAA):
+            try:
+                rrset = self.resolve(target, rdtype, depth=depth + 1)
+            except DnsDebuggerException as err:
+                LOGGER.warning("Cannot resolve %s of nameserver %s: %s", rdtype.name, target, err.message)
+                continue
+            if rrset.rdtype == rdtype.value:
+                addresses.extend(record.address for record in rrset.records)
+        return addresses
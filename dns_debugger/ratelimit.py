@@ -0,0 +1,238 @@
+"""Rate limiting of the queries sent to each destination IP and each provider, to avoid being throttled by RRL"""
+import collections
+import contextlib
+import ipaddress
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+from dns_debugger import LOGGER
+from dns_debugger.exceptions import DnsDebuggerException
+
+MAX_IN_FLIGHT = 64
+PROVIDER_IN_FLIGHT = 16
+# idle buckets are looked for at most once per this number of seconds
+EVICTION_INTERVAL = 60
+# providers not configured are approximated by the network of their servers
+DEFAULT_PREFIXLEN = {4: 24, 6: 48}
+
+
+class TokenBucket:
+    """Token bucket of rate tokens per second, holding at most burst tokens"""
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds to wait until a token is available, 0 if there is one"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Take a token, wait_time() must have returned 0"""
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        """Is the bucket refilled, as a new bucket would be"""
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class TokenBuckets:
+    """Token buckets of a rate by key, buckets idle long enough to be full again are dropped"""
+
+    def __init__(self, rate: Optional[float]):
+        self.rate = rate
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._evicted = None
+
+    def wait_time(self, key: str, now: float) -> float:
+        """Seconds to wait until a token of the key bucket is available, 0 if there is one or no rate"""
+        if self.rate is None:
+            return 0.0
+        if self._evicted is None or now - self._evicted >= EVICTION_INTERVAL:
+            self._evicted = now
+            self._buckets = {key: bucket for key, bucket in self._buckets.items() if not bucket.is_full(now)}
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate=self.rate, burst=max(self.rate, 1), now=now)
+        return bucket.wait_time(now)
+
+    def take(self, key: str):
+        """Take a token of the key bucket, wait_time() must have returned 0"""
+        if self.rate is not None:
+            self._buckets[key].take()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Ticket:
+    """A query waiting to be sent"""
+
+    def __init__(self, ip_addr: str, provider: str):
+        self.ip_addr = ip_addr
+        self.provider = provider
+        self.granted = False
+        self.event = threading.Event()
+
+
+def read_providers(path: str) -> Dict[str, List[str]]:
+    """Read a file containing one 'provider prefix [prefix ...]' line per provider, comments are skipped"""
+    providers = {}
+    with open(path) as providers_file:
+        for line in providers_file:
+            if not line.strip() or line.startswith("#"):
+                continue
+            name, *prefixes = line.split()
+            providers[name] = prefixes
+    return providers
+
+
+def _provider_networks(providers: Dict[str, List[str]]) -> List[Tuple[ipaddress.ip_network, str]]:
+    try:
+        return [(ipaddress.ip_network(prefix, strict=False), name)
+                for name, prefixes in providers.items() for prefix in prefixes]
+    except ValueError as err:
+        raise DnsDebuggerException(message="Invalid provider prefix: {}".format(err))
+
+
+class RateLimiter:
+    """
+    Queries wait for a token of their destination IP bucket and of their provider bucket.
+    Waiting queries are queued per provider and granted round robin across providers, the first query of a provider
+    whose IP has a token is granted so that a throttled IP does not block the other IPs of its provider. Each provider
+    has a bounded number of queries in flight, so a slow or throttled provider does not starve the others.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, ip_rate: Optional[float] = None, provider_rate: Optional[float] = None,
+                 providers: Optional[Dict[str, List[str]]] = None, max_in_flight: int = MAX_IN_FLIGHT,
+                 provider_in_flight: int = PROVIDER_IN_FLIGHT, clock=time.monotonic):
+        for rate in (ip_rate, provider_rate):
+            if rate is not None and rate <= 0:
+                raise DnsDebuggerException(message="Rate limits must be positive")
+        if max_in_flight < 1 or provider_in_flight < 1:
+            raise DnsDebuggerException(message="Limits of queries in flight must be positive")
+        self.ip_buckets = TokenBuckets(rate=ip_rate)
+        self.provider_buckets = TokenBuckets(rate=provider_rate)
+        self.max_in_flight = max_in_flight
+        self.provider_in_flight = provider_in_flight
+        self.clock = clock
+        self.networks = _provider_networks(providers or {})
+        self._waiting: Dict[str, Deque[Ticket]] = {}
+        self._order: List[str] = []
+        self._in_flight: Dict[str, int] = collections.Counter()
+        self._lock = threading.Lock()
+
+    def provider(self, ip_addr: str) -> str:
+        """Provider of a server, from the configured prefixes or the network of the server"""
+        address = ipaddress.ip_address(ip_addr)
+        for network, name in self.networks:
+            if address in network:
+                return name
+        return str(ipaddress.ip_network("{}/{}".format(ip_addr, DEFAULT_PREFIXLEN[address.version]), strict=False))
+
+    @contextlib.contextmanager
+    def limit(self, ip_addr: str):
+        """Wait until a query can be sent to ip_addr, the query is in flight while in the context"""
+        ticket = self._acquire(ip_addr)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[ticket.provider] -= 1
+                if not self._in_flight[ticket.provider]:
+                    del self._in_flight[ticket.provider]
+                self._dispatch(self.clock())
+
+    def _acquire(self, ip_addr: str) -> Ticket:
+        ticket = Ticket(ip_addr=ip_addr, provider=self.provider(ip_addr))
+        with self._lock:
+            self._waiting.setdefault(ticket.provider, collections.deque()).append(ticket)
+            if ticket.provider not in self._order:
+                self._order.append(ticket.provider)
+        while True:
+            with self._lock:
+                wait = self._dispatch(self.clock())
+                if ticket.granted:
+                    return ticket
+            ticket.event.wait(timeout=wait)
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """
+        Grant queries round robin across providers, must be called with the lock held.
+        Return the delay until a token is available for a blocked query, None if they wait for queries in flight.
+        """
+        wait = None
+        granted = True
+        while granted and sum(self._in_flight.values()) < self.max_in_flight:
+            granted = False
+            for provider in list(self._order):
+                if sum(self._in_flight.values()) >= self.max_in_flight:
+                    break
+                if self._in_flight[provider] >= self.provider_in_flight:
+                    continue
+                ticket, delay = self._ready_ticket(provider, now)
+                if ticket is None:
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+                self.ip_buckets.take(ticket.ip_addr)
+                self.provider_buckets.take(provider)
+                self._grant(ticket)
+                granted = True
+        return wait
+
+    def _ready_ticket(self, provider: str, now: float) -> Tuple[Optional[Ticket], float]:
+        """First waiting ticket of the provider which has its tokens, else the delay until one has"""
+        delay = self.provider_buckets.wait_time(provider, now)
+        if delay > 0:
+            return None, delay
+        blocked = {}
+        for ticket in self._waiting[provider]:
+            if ticket.ip_addr not in blocked:
+                blocked[ticket.ip_addr] = self.ip_buckets.wait_time(ticket.ip_addr, now)
+                if not blocked[ticket.ip_addr]:
+                    return ticket, 0.0
+        return None, min(blocked.values())
+
+    def _grant(self, ticket: Ticket):
+        queue = self._waiting[ticket.provider]
+        queue.remove(ticket)
+        self._order.remove(ticket.provider)
+        if queue:
+            self._order.append(ticket.provider)
+        else:
+            del self._waiting[ticket.provider]
+        self._in_flight[ticket.provider] += 1
+        ticket.granted = True
+        ticket.event.set()
+
+
+_LIMITER: Optional[RateLimiter] = None
+
+
+def configure(ip_rate: Optional[float] = None, provider_rate: Optional[float] = None,
+              providers: Optional[Dict[str, List[str]]] = None, max_in_flight: int = MAX_IN_FLIGHT,
+              provider_in_flight: int = PROVIDER_IN_FLIGHT):
+    """
+    Enable rate limiting, it is disabled if no rate is given
+    :param max_in_flight: queries in flight at most, concurrent queries above it wait
+    :param provider_in_flight: queries in flight to a provider at most
+    """
+    global _LIMITER  # pylint: disable=global-statement
+    if ip_rate is None and provider_rate is None:
+        _LIMITER = None
+        return
+    LOGGER.info("Rate limiting queries to %s qps per IP and %s qps per provider, with at most %d queries in flight "
+                "and %d per provider", ip_rate, provider_rate, max_in_flight, provider_in_flight)
+    _LIMITER = RateLimiter(ip_rate=ip_rate, provider_rate=provider_rate, providers=providers,
+                           max_in_flight=max_in_flight, provider_in_flight=provider_in_flight)
+
+
+def get_limiter() -> Optional[RateLimiter]:
+    """Get the configured rate limiter, None if disabled"""
+    return _LIMITER
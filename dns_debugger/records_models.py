@@ -12,7 +12,10 @@ from enum import Enum
 from dns_debugger import LOGGER
 from dns_debugger.dnssec.crypto import is_rsa_valid, is_ec_valid
 from dns_debugger.exceptions import DnsDebuggerException
-from dns_debugger.utils import qname_to_wire
+from dns_debugger.profiling import stage
+from dns_debugger.dnsname import DnsName
+
+B32_TO_B32HEX = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', '0123456789ABCDEFGHIJKLMNOPQRSTUV')
 
 
 class DataType(Enum):
@@ -97,15 +100,19 @@ class Record:
     def __init__(self, rdata):
         self._rdata = rdata
 
-    def to_wire(self, name, dtype, dclass, ttl):
+    def to_wire(self, name: DnsName, dtype, dclass, ttl):
         """Wire a record"""
-        name_wire = qname_to_wire(name)
+        name_wire = name.wire
         rdata_wire = self._rdata.to_digestable()
         rdata_len = len(rdata_wire)
 
         stuff = struct.pack("!HHIH", dtype, dclass, ttl, rdata_len)
         return name_wire + stuff + rdata_wire
 
+    def to_text(self):
+        """Rdata in text format"""
+        return self._rdata.to_text()
+
     @classmethod
     def create_from_rdata(cls, rdata):
         """Create Record from dnspython rdata"""
@@ -250,7 +257,7 @@ class RRSig(Record):
     type_covered: int
     original_ttl: int
     labels: int
-    signer_wire: bytes
+    signer_name: DnsName
 
     # pylint: disable=too-many-arguments
     def __init__(self, rdata, algorithm: int, expiration: int, inception: int, key_tag: int, signature: bytes,
@@ -263,6 +270,7 @@ class RRSig(Record):
         self.key_tag = key_tag
         self.signature = signature
         self.signer = signer
+        self.signer_name = DnsName.from_text(signer)
         self.type_covered = type_covered
         self.original_ttl = original_ttl
         self.labels = labels
@@ -284,8 +292,7 @@ class RRSig(Record):
                                  self.algorithm, self.labels,
                                  self.original_ttl, self.expiration,
                                  self.inception, self.key_tag)
-        signer_wire = qname_to_wire(self.signer)
-        return rdata_wire + signer_wire
+        return rdata_wire + self.signer_name.wire
 
     def __str__(self):
         return '{type} {algo} {label} {ttl} {expiration} {inception} ' \
@@ -312,6 +319,22 @@ class PTR(Record):  # pylint: disable=invalid-name, too-few-public-methods
         return '{target}'.format(target=self.target)
 
 
+class CNAME(Record):  # pylint: disable=too-few-public-methods
+    """CNAME record"""
+    target: str
+
+    def __init__(self, rdata, target: str):
+        super(CNAME, self).__init__(rdata=rdata)
+        self.target = target
+
+    @classmethod
+    def create_from_rdata(cls, rdata):
+        return cls(rdata=rdata, target=rdata.target.to_text())
+
+    def __str__(self):
+        return '{target}'.format(target=self.target)
+
+
 class DS(Record):
     """DS record"""
     key_tag: int
@@ -343,6 +366,87 @@ class DS(Record):
                                                                 digest=self.digest_str)
 
 
+def windows_to_types(windows) -> typing.Set[int]:
+    """
+    Decode NSEC/NSEC3 type bitmaps
+    >>> sorted(windows_to_types([(0, bytes.fromhex('000600000003'))]))
+    [13, 14, 46, 47]
+    """
+    types = set()
+    for window, bitmap in windows:
+        for index, octet in enumerate(bitmap):
+            for bit in range(8):
+                if octet & (0x80 >> bit):
+                    types.add(window * 256 + index * 8 + bit)
+    return types
+
+
+def types_to_text(types: typing.Set[int]) -> str:
+    """Types of a bitmap in text format"""
+    names = []
+    for dtype in sorted(types):
+        try:
+            names.append(DataType(dtype).name)
+        except ValueError:
+            names.append('TYPE{}'.format(dtype))
+    return ' '.join(names)
+
+
+class NSEC(Record):
+    """NSEC record"""
+    next_name: str
+    types: typing.Set[int]
+
+    def __init__(self, rdata, next_name: str, types: typing.Set[int]):
+        super(NSEC, self).__init__(rdata=rdata)
+        self.next_name = next_name
+        self.types = types
+
+    @classmethod
+    def create_from_rdata(cls, rdata):
+        return cls(rdata=rdata, next_name=rdata.next.to_text(), types=windows_to_types(rdata.windows))
+
+    def __str__(self):
+        return '{next_name} {types}'.format(next_name=self.next_name, types=types_to_text(self.types))
+
+
+class NSEC3(Record):
+    """NSEC3 record"""
+    algorithm: int
+    flags: int
+    iterations: int
+    salt: bytes
+    next_hash: str
+    types: typing.Set[int]
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, rdata, algorithm: int, flags: int, iterations: int, salt: bytes, next_hash: str,
+                 types: typing.Set[int]):
+        super(NSEC3, self).__init__(rdata=rdata)
+        self.algorithm = algorithm
+        self.flags = flags
+        self.iterations = iterations
+        self.salt = salt
+        self.next_hash = next_hash
+        self.types = types
+
+    @classmethod
+    def create_from_rdata(cls, rdata):
+        next_hash = str(base64.b32encode(rdata.next), 'ascii').translate(B32_TO_B32HEX)
+        return cls(rdata=rdata, algorithm=rdata.algorithm, flags=rdata.flags, iterations=rdata.iterations,
+                   salt=rdata.salt, next_hash=next_hash, types=windows_to_types(rdata.windows))
+
+    def is_opt_out(self):
+        """Opt-out flag, unsigned delegations may be covered by this NSEC3"""
+        return bool(self.flags & 1)
+
+    def __str__(self):
+        return '{algo} {flags} {iterations} {salt} {next_hash} {types}'.format(
+            algo=self.algorithm, flags=self.flags, iterations=self.iterations,
+            salt=str(binascii.hexlify(self.salt), 'ascii') or '-', next_hash=self.next_hash,
+            types=types_to_text(self.types))
+
+
 class DnsKey(Record):
     """DNSKEY record"""
     flags: int
@@ -379,7 +483,8 @@ class DnsKey(Record):
             LOGGER.debug("DNSKEY %s not verified by DS record", key_tag)
             return
         for cot_record in cot_records:
-            sig = self.compute_sig(qname=name, digest_type=cot_record.digest_type)
+            with stage("ds_digest"):
+                sig = self.compute_sig(qname=name, digest_type=cot_record.digest_type)
             LOGGER.debug("Computed signature for DNSKEY %s is %s", key_tag, sig)
             if sig.upper() != cot_record.digest_str.upper():
                 LOGGER.critical("Invalid DNSKEY record (computed=%s, parent=%s), exiting", sig,
@@ -415,13 +520,7 @@ class DnsKey(Record):
 
     def compute_sig(self, qname, digest_type):
         """Compute signature"""
-        signature = bytes()
-
-        if qname == ".":
-            qname = qname[:-1]
-        for i in qname.split('.'):
-            signature += struct.pack('B', len(i)) + i.encode()
-
+        signature = DnsName.from_text(qname).wire
         signature += struct.pack('!HBB', int(self.flags), int(self.protocol), int(self.algo))
         signature += self.public_key
 
@@ -442,10 +541,13 @@ class RRSet(Record):
 
     records: typing.List[Record]
     name: str
+    owner: DnsName
     rdtype: int
     rdclass: int
     ttl: int
     rrsig: typing.List[RRSig]
+    denial: typing.List['RRSet']
+    glue: typing.Dict[str, typing.List[str]]
 
     # pylint: disable=too-many-arguments
     def __init__(self, rdata, records: typing.List[Record], name: str, rdtype: int, rdclass: int, ttl: int,
@@ -453,10 +555,13 @@ class RRSet(Record):
         super(RRSet, self).__init__(rdata=rdata)
         self.records = records
         self.name = name
+        self.owner = DnsName.from_text(name)
         self.rdtype = rdtype
         self.rdclass = rdclass
         self.ttl = ttl
         self.rrsig = rrsig or []
+        self.denial = []
+        self.glue = {}
 
     @classmethod
     def create_from_rdata(cls, rdata):
@@ -475,34 +580,37 @@ class RRSet(Record):
                 LOGGER.warning("RRSIG key_tag %s is not in the chain of trust", rrsig.key_tag)
                 raise DnsDebuggerException("RRSIG key_tag {} is not in the chain of trust".format(rrsig.key_tag))
         msg = self.compute_msg(rrsig=rrsig)
-        if rrsig.algorithm in (5, 7, 8, 10):
-            return is_rsa_valid(key=signing_key.public_key, msg=msg, signature=rrsig.signature, alg=signing_key.algo)
-        elif rrsig.algorithm in (13, 14):
-            return is_ec_valid(key=signing_key.public_key, msg=msg, signature=rrsig.signature,
-                               alg=signing_key.algo)
+        with stage("crypto_verification"):
+            if rrsig.algorithm in (5, 7, 8, 10):
+                return is_rsa_valid(key=signing_key.public_key, msg=msg, signature=rrsig.signature,
+                                    alg=signing_key.algo)
+            elif rrsig.algorithm in (13, 14):
+                return is_ec_valid(key=signing_key.public_key, msg=msg, signature=rrsig.signature,
+                                   alg=signing_key.algo)
         raise DnsDebuggerException("RRSIG algorithm {} not yet supported".format(rrsig.algorithm))
 
     def is_signed(self) -> bool:
         """Is RRSET signed"""
         return bool(self.rrsig)
 
+    def expires(self, now: float) -> float:
+        """Timestamp when the RRSET expires, at the end of its TTL or at its first RRSIG expiration"""
+        return min([now + self.ttl] + [rrsig.expiration for rrsig in self.rrsig])
+
     def canonicalized_wire_rrset(self, original_ttl):
         """return wire"""
-        wired = b''
-        for record in sorted(self.records):
-            wired += record.to_wire(name=self.name, dtype=self.rdtype, dclass=self.rdclass, ttl=original_ttl)
-        return wired
+        return b''.join(record.to_wire(name=self.owner, dtype=self.rdtype, dclass=self.rdclass, ttl=original_ttl)
+                        for record in sorted(self.records))
 
     def is_valid(self, cot):
         """Check if RRSet is valid through RRSig"""
         LOGGER.info("Checking if RRSET is validated by RRSIG %s", self)
-        for rrsig in self.rrsig:
-            self.check_from_rrsig(cot=cot, rrsig=rrsig)
-        return True
+        return all(self.check_from_rrsig(cot=cot, rrsig=rrsig) for rrsig in self.rrsig)
 
     def compute_msg(self, rrsig):
         """Compute msg"""
-        return rrsig.canonicalized_wire() + self.canonicalized_wire_rrset(original_ttl=rrsig.original_ttl)
+        with stage("canonicalization"):
+            return rrsig.canonicalized_wire() + self.canonicalized_wire_rrset(original_ttl=rrsig.original_ttl)
 
     def __str__(self):
         values = ", ".join(map(str, self.records))
@@ -0,0 +1,161 @@
+"""Encrypted transports, DNS over TLS (RFC 7858) and DNS over HTTPS (RFC 8484), with pooled connections"""
+import http.client
+import socket
+import ssl
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dns_debugger import LOGGER
+from dns_debugger.exceptions import QueryErrException, QueryTimeException
+
+UDP = "udp"
+TLS = "tls"
+HTTPS = "https"
+DEFAULT_PORTS = {UDP: 53, TLS: 853, HTTPS: 443}
+DOH_PATH = "/dns-query"
+MAX_IDLE = 4
+
+Server = Tuple[str, int]
+
+
+class TcpConnection:
+    """DNS over TCP connection, messages are prefixed with their length"""
+
+    def __init__(self, server: Server, timeout: float):
+        self.sock = socket.create_connection(server, timeout=timeout)
+
+    def exchange(self, wire: bytes) -> bytes:
+        """Send a query and read its response"""
+        self.sock.sendall(struct.pack("!H", len(wire)) + wire)
+        (length,) = struct.unpack("!H", self._read(2))
+        return self._read(length)
+
+    def _read(self, length: int) -> bytes:
+        data = b""
+        while len(data) < length:
+            chunk = self.sock.recv(length - len(data))
+            if not chunk:
+                raise EOFError("Connection closed by the server")
+            data += chunk
+        return data
+
+    def close(self):
+        """Close the connection"""
+        self.sock.close()
+
+
+class TlsConnection(TcpConnection):
+    """DNS over TLS connection, messages are prefixed with their length like over TCP"""
+
+    def __init__(self, server: Server, wrap: Callable, timeout: float):
+        super(TlsConnection, self).__init__(server, timeout)
+        self.sock = wrap(self.sock, server)
+
+
+class HttpsConnection(http.client.HTTPSConnection):
+    """DNS over HTTPS connection, kept alive between queries and resuming TLS sessions when reconnecting"""
+
+    def __init__(self, server: Server, wrap: Callable, timeout: float):
+        super(HttpsConnection, self).__init__(server[0], server[1], timeout=timeout)
+        self.server = server
+        self.wrap = wrap
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        self.sock = self.wrap(self.sock, self.server)
+
+    def exchange(self, wire: bytes) -> bytes:
+        """POST a query and read its response"""
+        self.request("POST", DOH_PATH, body=wire, headers={"Content-Type": "application/dns-message",
+                                                           "Accept": "application/dns-message"})
+        response = self.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise QueryErrException(message="DNS over HTTPS query to {} failed, HTTP status is {}".format(
+                self.server[0], response.status))
+        return body
+
+
+class Transports:
+    """
+    Connections to DoT and DoH servers are kept open once a query is done and reused by the next query to the
+    same server, TLS sessions are kept to resume them when a new connection is needed
+    """
+
+    def __init__(self, context: Optional[ssl.SSLContext] = None, max_idle: int = MAX_IDLE):
+        self.context = context
+        self.max_idle = max_idle
+        self._idle: Dict[Tuple[str, Server], List] = {}
+        self._sessions: Dict[Server, ssl.SSLSession] = {}
+        self._lock = threading.Lock()
+
+    def _wrap(self, sock: socket.socket, server: Server) -> ssl.SSLSocket:
+        """Start TLS on a connected socket, resuming the last session with this server"""
+        if self.context is None:
+            self.context = ssl.create_default_context()
+        with self._lock:
+            session = self._sessions.get(server)
+        tls_sock = self.context.wrap_socket(sock, server_hostname=server[0], session=session)
+        LOGGER.debug("TLS connection to %s, session reused: %s", server, tls_sock.session_reused)
+        return tls_sock
+
+    def _keep_session(self, sock: ssl.SSLSocket, server: Server):
+        """TLS 1.3 tickets are received after the handshake, the session is kept once a response is read"""
+        if sock is not None and sock.session is not None:
+            with self._lock:
+                self._sessions[server] = sock.session
+
+    def exchange(self, transport: str, server: Server, wire: bytes, timeout: float) -> bytes:
+        """
+        Send a query in wire format and get the response in wire format.
+        An idle connection may have been closed by the server, the query is then sent on a new one.
+        """
+        with self._lock:
+            idle = self._idle.get((transport, server))
+            connection = idle.pop() if idle else None
+        if connection is not None:
+            try:
+                return self._exchange_on(connection, transport, server, wire)
+            except socket.timeout:
+                raise _timeout(transport, server)
+            except (OSError, EOFError, http.client.HTTPException):
+                LOGGER.debug("Idle %s connection to %s was closed, reconnecting", transport, server)
+        try:
+            connection_cls = TlsConnection if transport == TLS else HttpsConnection
+            return self._exchange_on(connection_cls(server, self._wrap, timeout), transport, server, wire)
+        except socket.timeout:
+            raise _timeout(transport, server)
+        except (OSError, EOFError, http.client.HTTPException) as err:
+            raise QueryTimeException(message="{} query to {} failed: {}".format(transport.upper(), server[0], err))
+
+    def _exchange_on(self, connection, transport: str, server: Server, wire: bytes) -> bytes:
+        """Exchange on a connection, it is kept for the next queries unless it failed or enough are idle"""
+        try:
+            response = connection.exchange(wire)
+        except Exception:
+            connection.close()
+            raise
+        self._keep_session(connection.sock, server)
+        with self._lock:
+            idle = self._idle.setdefault((transport, server), [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return response
+        connection.close()
+        return response
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            connections = [connection for idle in self._idle.values() for connection in idle]
+            self._idle.clear()
+        for connection in connections:
+            connection.close()
+
+
+def _timeout(transport: str, server: Server) -> QueryTimeException:
+    return QueryTimeException(message="Timeout during {} query to {}".format(transport.upper(), server[0]))
+
+
+TRANSPORTS = Transports()
@@ -1,7 +1,47 @@
 """Simple console ui"""
+import json
+import sys
+from typing import Dict, Iterator, TextIO, Tuple
+
 from dns_debugger.executors import TestSuite
+from dns_debugger.executors.testsuite import TestCase, StreamingTestSuite, testcase_json
 
 
 def display(testsuite: TestSuite, display_all=True):
     """Simple console ui, just print the testsuite as json"""
-    print(testsuite.to_json(display_all=display_all))
+    sys.stdout.writelines(testsuite.iter_json(display_all=display_all))
+    print()
+
+
+def display_testcase(testcase: TestCase):
+    """Print a single testcase as a json line"""
+    print(testcase_json(testcase), flush=True)
+
+
+def display_batch(results: Iterator[Tuple[str, TestSuite]], sink: TextIO, display_all=True):
+    """
+    Write each testcase as a json line to the sink as soon as its zone is done, nothing is kept in memory,
+    then print a summary of the whole batch
+    """
+    zones = 0
+    streaming = StreamingTestSuite(sink=sink, only_failures=not display_all)
+    for _, testsuite in results:
+        zones += 1
+        streaming.add_testcases(testsuite.testcases)
+        del testsuite  # released before the next zone is waited for
+    print(json.dumps({"summary": {"zones": zones, "success": streaming.success, "failures": streaming.failures}}),
+          flush=True)
+
+
+def display_stream(testcases: Iterator[TestCase], sink: TextIO, display_all=True):
+    """Write each testcase as a json line to the sink as soon as it is available, then print a summary"""
+    streaming = StreamingTestSuite(sink=sink, only_failures=not display_all)
+    streaming.add_testcases(testcases)
+    print(json.dumps({"summary": {"success": streaming.success, "failures": streaming.failures}}), flush=True)
+
+
+def display_reports(reports: Iterator[Dict], sink: TextIO):
+    """Write each report as a json line to the sink as soon as it is available"""
+    for report in reports:
+        sink.write(json.dumps(report) + "\n")
+        sink.flush()
@@ -0,0 +1,55 @@
+"""Cache of complete check results served by the server, with their ETag"""
+import collections
+import hashlib
+import threading
+import time
+import typing
+from typing import Dict, Optional, Tuple
+
+MAX_ENTRIES = 1024
+MAX_TTL = 300
+
+CachedResult = typing.NamedTuple("CachedResult", [("body", str), ("etag", str), ("expires", float)])
+
+
+class ResultCache:
+    """
+    Results by qname and test plan, kept until the minimum TTL of the RRSETs queried by the check expires,
+    at most max_ttl seconds. Least recently used results are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_ttl: int = MAX_TTL, clock=time.time):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.clock = clock
+        self._results: Dict[Tuple, CachedResult] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[CachedResult]:
+        """Get a result, None if missing or expired"""
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                return None
+            if result.expires <= self.clock():
+                del self._results[key]
+                return None
+            self._results.move_to_end(key)
+            return result
+
+    def set(self, key: Tuple, body: str, ttl: Optional[int]) -> CachedResult:
+        """Store a result for ttl seconds, bounded by max_ttl, it is not stored if ttl is None or 0"""
+        etag = hashlib.sha1(body.encode()).hexdigest()
+        result = CachedResult(body=body, etag=etag, expires=self.clock() + min(ttl or 0, self.max_ttl))
+        if not ttl:
+            return result
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return result
+
+    def max_age(self, result: CachedResult) -> int:
+        """Seconds the result can still be cached by clients"""
+        return max(int(result.expires - self.clock()), 0)
@@ -1,10 +1,56 @@
 """Create a small flask APP"""
-from flask import Flask, Response, jsonify
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, Optional, Tuple
 
-from dns_debugger.executors import run_tests
+from flask import Flask, Response, jsonify, request, stream_with_context
+
+from dns_debugger import cache, profiling
+from dns_debugger.dnsname import DnsName
+from dns_debugger.dnssec.refresher import TrustRefresher
+from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.executors import run_tests, TestPlan, TestSuite
+from dns_debugger.query import observe_ttls
+from dns_debugger.ui.result_cache import ResultCache
 
 APP = Flask(__name__)
 
+if os.environ.get(cache.CACHE_ENV):
+    cache.configure(os.environ[cache.CACHE_ENV])
+
+# profiling is expensive, it must be explicitly allowed
+APP.config["ALLOW_PROFILING"] = os.environ.get("DNS_DEBUGGER_ALLOW_PROFILING") == "1"
+
+# limits of a POST /batch request
+APP.config["BATCH_MAX_ZONES"] = int(os.environ.get("DNS_DEBUGGER_BATCH_MAX_ZONES", "500"))
+APP.config["BATCH_TIMEOUT"] = float(os.environ.get("DNS_DEBUGGER_BATCH_TIMEOUT", "300"))
+BATCH_WORKERS = 16
+# shared by all batches, so that concurrent batches do not multiply threads
+BATCH_POOL = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+
+# root trust material is always kept warm, with these comma separated zones, TLDs for instance
+APP.config["PREFETCH_ZONES"] = [zone.strip() for zone in os.environ.get("DNS_DEBUGGER_PREFETCH_ZONES", "").split(",")
+                                if zone.strip()]
+TRUST_REFRESHER = TrustRefresher(zones=APP.config["PREFETCH_ZONES"])
+
+
+# results of /<qname> are cached until the minimum TTL of the RRSETs queried, at most this number of seconds
+RESULT_CACHE = ResultCache(max_ttl=int(os.environ.get("DNS_DEBUGGER_RESULT_MAX_TTL", "300")))
+# results with failures, which may be transient, are cached at most this number of seconds, 0 to never cache them
+APP.config["RESULT_FAILURE_TTL"] = int(os.environ.get("DNS_DEBUGGER_RESULT_FAILURE_TTL", "10"))
+
+
+@APP.before_request
+def start_trust_refresher():
+    """
+    Warm the trust material then refresh it in the background. It is started by the first request when the APP is
+    imported by a WSGI server instead of being run by start_server.
+    """
+    TRUST_REFRESHER.start()
+
 
 @APP.route('/monitoring/ping')
 def ping():
@@ -12,8 +58,142 @@ def ping():
     return jsonify("pong")
 
 
+@APP.route('/monitoring/stats')
+def stats():
+    """Background activity of the server"""
+    return jsonify({"trust_refresher": TRUST_REFRESHER.get_stats()})
+
+
 @APP.route('/<qname>')
 def check_qname(qname):
-    """Check qname"""
-    testsuite = run_tests(qname=qname)
-    return Response(testsuite.to_json(), status=200, mimetype='application/json')
+    """
+    Check qname, tests, types and resolvers query parameters select what is run.
+    Results are cached and served with an ETag, refresh=1 runs the check again.
+    """
+    if request.args.get("profile") == "1":
+        return _profile_qname(qname)
+    key = (qname.lower().rstrip(".") + ".",) + tuple(request.args.get(name) for name in ("tests", "types", "resolvers"))
+    result = RESULT_CACHE.get(key) if request.args.get("refresh") != "1" else None
+    if result is None:
+        try:
+            plan = _request_plan()
+            name = DnsName.from_text(qname)
+        except DnsDebuggerException as err:
+            return jsonify(err.message), 400
+        with observe_ttls(name.text) as observer:
+            testsuite = run_tests(qname=qname, plan=plan)
+        ttl = observer.min_ttl if not testsuite.failures else min(observer.min_ttl or 0,
+                                                                  APP.config["RESULT_FAILURE_TTL"])
+        result = RESULT_CACHE.set(key, testsuite.to_json(), ttl=ttl)
+    headers = {"ETag": '"{}"'.format(result.etag), "Cache-Control": "max-age={}".format(RESULT_CACHE.max_age(result))}
+    if request.if_none_match.contains(result.etag):
+        return Response(status=304, headers=headers)
+    return Response(result.body, status=200, mimetype='application/json', headers=headers)
+
+
+def _profile_qname(qname):
+    """Check qname with the profiler, the time spent per stage and the collapsed stacks are returned, not cached"""
+    if not APP.config["ALLOW_PROFILING"]:
+        return jsonify("Profiling is not allowed"), 403
+    try:
+        plan = _request_plan()
+    except DnsDebuggerException as err:
+        return jsonify(err.message), 400
+    with profiling.profile() as profiler:
+        run_tests(qname=qname, plan=plan)
+    return jsonify({"breakdown": profiler.breakdown(), "collapsed": profiler.collapsed()})
+
+
+def _request_plan() -> TestPlan:
+    """Test plan from the tests, types and resolvers query parameters"""
+    return TestPlan.from_strings(tests=request.args.get("tests"), rdtypes=request.args.get("types"),
+                                 resolvers=request.args.get("resolvers"))
+
+
+@APP.route('/batch', methods=["POST"])
+def check_batch():
+    """
+    Check a list of qnames posted as {"qnames": [...], "tests": ..., "types": ..., "resolvers": ...}.
+    Zones are checked concurrently, sharing caches and identical queries in flight, each result is streamed
+    as a json line as soon as its zone is done. Zones not done before the batch timeout are reported as such.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("qnames"), list) or not body["qnames"] or \
+            not all(isinstance(qname, str) for qname in body["qnames"]):
+        return jsonify("Body must be a json object with a non empty list of qnames"), 400
+    qnames = list(dict.fromkeys(body["qnames"]))
+    if len(qnames) > APP.config["BATCH_MAX_ZONES"]:
+        return jsonify("Too many qnames, at most {} are allowed".format(APP.config["BATCH_MAX_ZONES"])), 413
+    try:
+        plan = _batch_plan(body)
+    except DnsDebuggerException as err:
+        return jsonify(err.message), 400
+    display_all = body.get("display_all", True)
+    return Response(stream_with_context(_run_batch(qnames, plan, display_all)), status=200,
+                    mimetype='application/x-ndjson')
+
+
+def _batch_plan(body: Dict) -> TestPlan:
+    """Test plan of a batch, tests, types and resolvers are lists or comma separated strings"""
+    selection = {name: body.get(name) for name in ("tests", "types", "resolvers")}
+    for name, value in selection.items():
+        if isinstance(value, list) and all(isinstance(item, str) for item in value):
+            selection[name] = ",".join(value)
+        elif value is not None and not isinstance(value, str):
+            raise DnsDebuggerException(message="{} must be a list or a comma separated string".format(name))
+    return TestPlan.from_strings(tests=selection["tests"], rdtypes=selection["types"],
+                                 resolvers=selection["resolvers"])
+
+
+def _run_batch(qnames, plan: TestPlan, display_all: bool):
+    deadline = time.time() + APP.config["BATCH_TIMEOUT"]
+    done = 0
+    for qname, future in _check_zones(qnames, plan, deadline):
+        if future is None:
+            yield json.dumps({"qname": qname, "error": "Batch timeout reached"}) + "\n"
+            continue
+        done += 1
+        yield _batch_line(qname, future, display_all)
+    yield json.dumps({"summary": {"zones": len(qnames), "done": done}}) + "\n"
+
+
+def _check_zones(qnames, plan: TestPlan, deadline: float) -> Iterator[Tuple[str, Optional[Future]]]:
+    """
+    Check the zones on the shared pool, at most BATCH_WORKERS of them queued or running at a time. Zones are
+    yielded with their future as they are done, then zones not done before the deadline are yielded with None.
+    """
+    pending = deque(qnames)
+    futures: Dict[Future, str] = {}
+    try:
+        while pending or futures:
+            while pending and len(futures) < BATCH_WORKERS and time.time() < deadline:
+                qname = pending.popleft()
+                futures[BATCH_POOL.submit(_check_zone, qname, plan, deadline)] = qname
+            finished, _ = wait(futures, timeout=max(deadline - time.time(), 0), return_when=FIRST_COMPLETED)
+            if not finished:
+                break
+            for future in finished:
+                yield futures.pop(future), future
+    finally:
+        # zones queued are dropped if the timeout is reached or the client went away
+        for future in futures:
+            future.cancel()
+    for qname in list(futures.values()) + list(pending):
+        yield qname, None
+
+
+def _check_zone(qname: str, plan: TestPlan, deadline: float) -> TestSuite:
+    """Check a zone from the shared pool, unless the deadline of its batch passed while it was queued"""
+    if time.time() >= deadline:
+        raise DnsDebuggerException(message="Batch timeout reached")
+    return run_tests(qname=qname, plan=plan)
+
+
+def _batch_line(qname: str, future, display_all: bool) -> str:
+    try:
+        testsuite: TestSuite = future.result()
+    except DnsDebuggerException as err:
+        return json.dumps({"qname": qname, "error": err.message}) + "\n"
+    except Exception as exc:  # pylint: disable=broad-except
+        return json.dumps({"qname": qname, "error": "Unexpected error: {}".format(exc)}) + "\n"
+    return "".join(testsuite.iter_json(display_all=display_all, multiline=False, qname=qname)) + "\n"
@@ -1,5 +1,5 @@
 """Some utilities method"""
-import dns.name
+from dns_debugger.dnsname import DnsName
 
 
 def split_qname(qname):
@@ -7,16 +7,7 @@ def split_qname(qname):
     >>> split_qname("dnstests.fr.")
     ['.', 'fr.', 'dnstests.fr.']
     """
-    splitted_qname = qname.split(".")[::-1]
-    out = []
-    current = ''
-    for entry in splitted_qname:
-        if entry == "":
-            out.append(".")
-        else:
-            current = "%s.%s" % (entry, current)
-            out.append(current)
-    return out
+    return [name.text for name in DnsName.from_text(qname).lineage]
 
 
 def qname_to_wire(qname):
@@ -25,4 +16,10 @@ def qname_to_wire(qname):
     >>> wired == b'\x08dnstests\x02fr'
     True
     """
-    return dns.name.Name(dns.name.from_text(qname)).to_wire()
+    return DnsName.from_text(qname).wire
+
+
+def read_qnames(path):
+    """Read a file containing one qname per line, empty lines and comments are skipped"""
+    with open(path) as qnames_file:
+        return [line.strip() for line in qnames_file if line.strip() and not line.startswith("#")]
@@ -0,0 +1,156 @@
+"""Watch mode, continuously re-check a set of zones when their records expire"""
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Set, Tuple
+
+from dns_debugger import LOGGER
+from dns_debugger.exceptions import DnsDebuggerException, QueryNoResponseException
+from dns_debugger.executors.testsuite import TestCase
+from dns_debugger.query import dns_query, Resolver
+from dns_debugger.records_models import DataType, RRSet
+
+WATCHED_TYPES = [DataType.SOA, DataType.NS, DataType.DNSKEY]
+
+MIN_INTERVAL = 30
+MAX_INTERVAL = 24 * 3600
+RETRY_INTERVAL = 60
+SIGNATURE_WARNING = 3 * 24 * 3600
+WATCH_WORKERS = 16
+
+
+class WatchEntry:
+    """A watched RRSET, with the last known state"""
+    qname: str
+    rdtype: DataType
+    success: Optional[bool]
+    result: str
+    serial: Optional[int]
+    warned_signatures: Set[Tuple[int, int]]
+
+    def __init__(self, qname: str, rdtype: DataType):
+        self.qname = qname
+        self.rdtype = rdtype
+        self.success = None
+        self.result = ''
+        self.serial = None
+        self.warned_signatures = set()
+
+    @property
+    def description(self):
+        """Description used for the reported testcases"""
+        return "Watching {} records for {}".format(self.rdtype.name, self.qname)
+
+
+class Watcher:
+    """Re-query each watched RRSET only when its TTL or its RRSIG expiration is due"""
+
+    def __init__(self, qnames: List[str], resolver: Optional[Resolver] = None, clock=time.time, sleep=time.sleep):
+        self.resolver = resolver or Resolver()
+        self.clock = clock
+        self.sleep = sleep
+        self._queue = []
+        self._counter = 0
+        for qname in qnames:
+            if not qname.endswith("."):
+                qname += "."
+            for rdtype in WATCHED_TYPES:
+                self._schedule(WatchEntry(qname=qname, rdtype=rdtype), due=self.clock())
+
+    def _schedule(self, entry: WatchEntry, due: float):
+        self._counter += 1
+        heapq.heappush(self._queue, (due, self._counter, entry))
+
+    def _pop_due(self) -> List[WatchEntry]:
+        """Wait for the next due entry, and return all entries due at that time"""
+        due = self._queue[0][0]
+        delay = due - self.clock()
+        if delay > 0:
+            self.sleep(delay)
+        now = self.clock()
+        entries = []
+        while self._queue and self._queue[0][0] <= now:
+            entries.append(heapq.heappop(self._queue)[2])
+        return entries
+
+    def run(self, iterations: Optional[int] = None) -> Iterator[TestCase]:
+        """Run the watch loop, yield only testcases describing a change"""
+        with ThreadPoolExecutor(max_workers=WATCH_WORKERS) as pool:
+            while self._queue and iterations != 0:
+                entries = self._pop_due()
+                for entry, (diffs, interval) in zip(entries, pool.map(self.check, entries)):
+                    self._schedule(entry, due=self.clock() + interval)
+                    yield from diffs
+                if iterations is not None:
+                    iterations -= 1
+
+    def check(self, entry: WatchEntry):
+        """Query the entry, return the differences with the previous state and the delay before next check"""
+        LOGGER.info("Watch: checking %s %s", entry.qname, entry.rdtype.name)
+        try:
+            rrset = self._query(entry)
+        except DnsDebuggerException as exc:
+            return self._update_state(entry, success=False, result=exc.message), RETRY_INTERVAL
+
+        diffs = self._update_state(entry, success=True, result=str(rrset))
+        if entry.rdtype == DataType.SOA:
+            diffs.extend(self._check_serial(entry, rrset))
+        diffs.extend(self._check_signatures(entry, rrset))
+        return diffs, self._next_interval(rrset)
+
+    def _query(self, entry: WatchEntry) -> RRSet:
+        try:
+            return dns_query(qname=entry.qname, rdtype=entry.rdtype, want_dnssec=True, resolver=self.resolver)
+        except QueryNoResponseException:
+            return dns_query(qname=entry.qname, rdtype=entry.rdtype, resolver=self.resolver)
+
+    @staticmethod
+    def _update_state(entry: WatchEntry, success: bool, result: str) -> List[TestCase]:
+        """Report new failures and recoveries"""
+        diffs = []
+        if success and entry.success is False:
+            diffs.append(TestCase(description=entry.description, result="Recovered: {}".format(result),
+                                  success=True))
+        elif not success and entry.success is not False:
+            diffs.append(TestCase(description=entry.description, result=result, success=False))
+        entry.success = success
+        entry.result = result
+        return diffs
+
+    @staticmethod
+    def _check_serial(entry: WatchEntry, rrset: RRSet) -> List[TestCase]:
+        serial = rrset.records[0].serial
+        previous, entry.serial = entry.serial, serial
+        if previous is None or previous == serial:
+            return []
+        return [TestCase(description=entry.description,
+                         result="SOA serial changed from {} to {}".format(previous, serial), success=True)]
+
+    def _check_signatures(self, entry: WatchEntry, rrset: RRSet) -> List[TestCase]:
+        diffs = []
+        now = self.clock()
+        for rrsig in rrset.rrsig:
+            signature = (rrsig.key_tag, rrsig.expiration)
+            if rrsig.expiration - now > SIGNATURE_WARNING or signature in entry.warned_signatures:
+                continue
+            entry.warned_signatures.add(signature)
+            diffs.append(TestCase(description=entry.description,
+                                  result="RRSIG {} expires in {} seconds".format(rrsig.key_tag,
+                                                                                  int(rrsig.expiration - now)),
+                                  success=False))
+        return diffs
+
+    def _next_interval(self, rrset: RRSet) -> float:
+        """Next check is due when the TTL expires, or when the closest RRSIG enters the warning window"""
+        interval = rrset.ttl
+        now = self.clock()
+        for rrsig in rrset.rrsig:
+            until_warning = rrsig.expiration - SIGNATURE_WARNING - now
+            if until_warning > 0:
+                interval = min(interval, until_warning)
+        return max(MIN_INTERVAL, min(interval, MAX_INTERVAL))
+
+
+def watch(qnames: List[str], resolver: Optional[Resolver] = None) -> Iterator[TestCase]:
+    """Watch a list of zones, yield testcases when something changed"""
+    return Watcher(qnames=qnames, resolver=resolver).run()
@@ -0,0 +1,256 @@
+"""Full zone DNSSEC audit, the zone is transferred by AXFR and the RRSIG of every RRSET are verified"""
+import os
+import time
+import typing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+import dns.exception
+import dns.name
+import dns.query
+import dns.rdatatype
+
+from dns_debugger import LOGGER
+from dns_debugger.dnsname import DnsName
+from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.executors.testsuite import TestCase
+from dns_debugger.models import ChainOfTrust
+from dns_debugger.query import run_query, map_section, records_from_text, DNS_PORT
+from dns_debugger.records_models import DataType, RRSet
+
+BATCH_SIZE = 500
+XFR_TIMEOUT = 30
+XFR_LIFETIME = 3600
+EXPIRATION_WARNING = 7 * 24 * 3600
+
+# RRSET as sent to the workers: only text, to be cheap to pickle
+RRSetData = typing.NamedTuple("RRSetData", [("name", str), ("rdtype", int), ("ttl", int), ("records", List[str]),
+                                            ("rrsig", List[str])])
+
+
+# owner name which is not after all the owner names already transferred in canonical order, it may be split
+SplitOwner = typing.NamedTuple("SplitOwner", [("name", str)])
+
+
+def stream_rrsets(server: str, zone: str, port: int = DNS_PORT) -> Iterator[Union[RRSetData, SplitOwner]]:
+    """
+    Transfer the zone and group records into RRSETs incrementally, owner name by owner name,
+    only the RRSETs of the current owner name are kept in memory
+    """
+    grouping = _OwnerGrouping()
+    soa_count = 0
+    for message in dns.query.xfr(server, zone, port=port, timeout=XFR_TIMEOUT,
+                                   lifetime=XFR_LIFETIME, relativize=False):
+        for rrset in message.answer:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                soa_count += 1
+                if soa_count > 1:  # the final SOA closes the transfer
+                    yield from grouping.flush()
+                    return
+            yield from grouping.add(rrset)
+    yield from grouping.flush()
+
+
+class _OwnerGrouping:
+    """
+    RRSETs of the current owner name of the transfer. AXFR does not require records of a name to be contiguous, but
+    signed zones are transferred in canonical order, so a name seen again is not after the greatest name transferred.
+    Such a name is reported and its records are dropped, they would be verified as partial RRSETs. Only the greatest
+    name is kept, whatever the size of the zone.
+    """
+
+    def __init__(self):
+        self.owner: Optional[dns.name.Name] = None
+        self.greatest: Optional[dns.name.Name] = None
+        self.out_of_order = False
+        self.rrsets: Dict[Tuple[int, int], Tuple[int, Set[str]]] = {}
+
+    def add(self, rrset) -> Iterator[Union[RRSetData, SplitOwner]]:
+        """Add the records of a RRSET, RRSETs of the previous owner name are yielded when the owner name changes"""
+        if rrset.name != self.owner:
+            yield from self.flush()
+            self.owner = rrset.name
+            # dnspython names compare in DNSSEC canonical order
+            self.out_of_order = self.greatest is not None and self.owner <= self.greatest
+            if self.out_of_order:
+                yield SplitOwner(name=self.owner.to_text())
+            else:
+                self.greatest = self.owner
+        if self.out_of_order:
+            return
+        _, texts = self.rrsets.setdefault((rrset.rdtype, rrset.covers), (rrset.ttl, set()))
+        texts.update(rdata.to_text() for rdata in rrset)
+
+    def flush(self) -> Iterator[RRSetData]:
+        """Yield the RRSETs of the current owner name"""
+        rrsets, self.rrsets = self.rrsets, {}
+        for (rdtype, _), (ttl, texts) in rrsets.items():
+            if rdtype == dns.rdatatype.RRSIG:
+                continue
+            rrsig = rrsets.get((dns.rdatatype.RRSIG, rdtype), (0, set()))[1]
+            yield RRSetData(name=self.owner.to_text(), rdtype=rdtype, ttl=ttl, records=sorted(texts),
+                            rrsig=sorted(rrsig))
+
+
+def get_zone_keys(server: str, zone: str, port: int = DNS_PORT) -> RRSet:
+    """Get the DNSKEY RRSET of the zone from the server, it must be signed by one of its keys"""
+    response = run_query(server, zone, DataType.DNSKEY, want_dnssec=True, port=port)
+    dnskeys = [rrset for rrset in map_section(response.answer, want_dnssec=True)
+               if rrset.rdtype == DataType.DNSKEY.value]
+    if not dnskeys or not dnskeys[0].is_signed():
+        raise DnsDebuggerException(message="Zone {} has no signed DNSKEY RRSET".format(zone))
+    chain_of_trust = ChainOfTrust()
+    if not all(dnskeys[0].check_from_rrsig(cot=chain_of_trust, rrsig=rrsig) for rrsig in dnskeys[0].rrsig):
+        raise DnsDebuggerException(message="DNSKEY RRSET of {} is not validated by its RRSIG".format(zone))
+    return dnskeys[0]
+
+
+_CHAINS_OF_TRUST: Dict[Tuple[str, ...], ChainOfTrust] = {}
+
+
+def _get_chain_of_trust(dnskeys: Tuple[str, ...]) -> ChainOfTrust:
+    """Chain of trust holding the zone keys, built once per worker process"""
+    if dnskeys not in _CHAINS_OF_TRUST:
+        chain_of_trust = ChainOfTrust()
+        for dnskey in records_from_text(rdtype=DataType.DNSKEY.value, texts=list(dnskeys)):
+            chain_of_trust.add_dnskey(dnskey)
+        _CHAINS_OF_TRUST[dnskeys] = chain_of_trust
+    return _CHAINS_OF_TRUST[dnskeys]
+
+
+def verify_batch(dnskeys: Tuple[str, ...], batch: List[RRSetData], now: float) -> Tuple[int, List[TestCase]]:
+    """Verify RRSIG of a batch of RRSETs in a worker process, only problems are reported"""
+    chain_of_trust = _get_chain_of_trust(dnskeys)
+    problems = []
+    for data in batch:
+        description = "Checking RRSIG of {} {}".format(data.name, dns.rdatatype.to_text(data.rdtype))
+        try:
+            problems.extend(_verify_rrset(data, chain_of_trust, now, description))
+        except DnsDebuggerException as err:
+            problems.append(TestCase(description=description, result=err.message, success=False))
+        except dns.exception.DNSException as err:
+            problems.append(TestCase(description=description, result="Invalid RRSET: {}".format(err), success=False))
+    return len(batch), problems
+
+
+def _verify_rrset(data: RRSetData, chain_of_trust: ChainOfTrust, now: float, description: str) -> List[TestCase]:
+    rrset = RRSet(rdata=None, records=records_from_text(data.rdtype, data.records), name=data.name,
+                  rdtype=data.rdtype, rdclass=1, ttl=data.ttl,
+                  rrsig=records_from_text(DataType.RRSIG.value, data.rrsig))
+    problems = []
+    for rrsig in rrset.rrsig:
+        if not rrsig.inception <= now <= rrsig.expiration:
+            problems.append(TestCase(description=description, result="RRSIG {} is not in its validity period".format(
+                rrsig.key_tag), success=False))
+        elif rrsig.expiration - now < EXPIRATION_WARNING:
+            problems.append(TestCase(description=description, result="RRSIG {} expires in {} hours".format(
+                rrsig.key_tag, int((rrsig.expiration - now) // 3600)), success=False))
+        if not rrset.check_from_rrsig(cot=chain_of_trust, rrsig=rrsig):
+            problems.append(TestCase(description=description, result="RRSIG {} is not valid".format(rrsig.key_tag),
+                                     success=False))
+    return problems
+
+
+class _Delegations:
+    """Delegation points seen in the zone, NS and glue below them are not signed"""
+
+    def __init__(self, zone: str):
+        self.zone = DnsName.from_text(zone)
+        self.names: Set[DnsName] = set()
+
+    def is_unsigned(self, data: RRSetData) -> bool:
+        """Is the RRSET a delegation NS or glue, which are not signed, DS and NSEC at delegation points are signed"""
+        owner = name = DnsName.from_text(data.name)
+        if data.rdtype == DataType.NS.value and name != self.zone:
+            self.names.add(name)
+            return True
+        while name != self.zone and len(name.labels) > len(self.zone.labels):
+            if name in self.names:
+                return name != owner or data.rdtype not in (DataType.DS.value, DataType.NSEC.value)
+            name = name.parent
+        return False
+
+
+class _Audit:
+    """Verification of streamed RRSETs in batches on a pool of processes, with a bounded number of batches in flight"""
+
+    def __init__(self, dnskeys: Tuple[str, ...], workers: int):
+        self.dnskeys = dnskeys
+        self.workers = workers
+        self.now = time.time()
+        self.verified = 0
+        self.problems = 0
+        self._batch: List[RRSetData] = []
+        self._in_flight = deque()
+
+    def run(self, rrsets: Iterator[Union[RRSetData, SplitOwner]], delegations: _Delegations) -> Iterator[TestCase]:
+        """Verify the RRSETs, problems are yielded as they are found"""
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for data in rrsets:
+                if isinstance(data, RRSetData) and delegations.is_unsigned(data):
+                    continue
+                problem = self._check(data)
+                if problem is not None:
+                    self.problems += 1
+                    yield problem
+                    continue
+                self._batch.append(data)
+                if len(self._batch) >= BATCH_SIZE:
+                    self._submit(pool)
+                if len(self._in_flight) >= self.workers * 2:
+                    yield from self._collect(self._in_flight.popleft())
+            yield from self._drain(pool)
+
+    def _submit(self, pool: ProcessPoolExecutor):
+        self._in_flight.append(pool.submit(verify_batch, self.dnskeys, self._batch, self.now))
+        self._batch = []
+
+    def _drain(self, pool: ProcessPoolExecutor) -> Iterator[TestCase]:
+        """Submit the last batch, then collect all batches in flight"""
+        if self._batch:
+            self._submit(pool)
+        while self._in_flight:
+            yield from self._collect(self._in_flight.popleft())
+
+    @staticmethod
+    def _check(data: Union[RRSetData, SplitOwner]) -> Optional[TestCase]:
+        """Problem found without verifying signatures: records of a name split in the transfer, or no RRSIG"""
+        if isinstance(data, SplitOwner):
+            return TestCase(description="Checking RRSETs of {}".format(data.name),
+                            result="Owner name is not in canonical order in the AXFR, its records may be split "
+                                   "and are not checked", success=False)
+        if data.rrsig:
+            return None
+        return TestCase(description="Checking RRSIG of {} {}".format(data.name, dns.rdatatype.to_text(data.rdtype)),
+                        result="RRSET is not signed", success=False)
+
+    def _collect(self, future) -> List[TestCase]:
+        verified, problems = future.result()
+        self.verified += verified
+        self.problems += len(problems)
+        return problems
+
+
+def audit_zone(zone: str, server: str, port: int = DNS_PORT, workers: Optional[int] = None) -> Iterator[TestCase]:
+    """
+    Transfer the zone and verify every RRSET against the zone DNSKEYs on a pool of processes.
+    Only problems are yielded as they are found, followed by a summary testcase.
+    """
+    description = "Auditing DNSSEC of every RRSET of {}".format(zone)
+    try:
+        dnskeys = tuple(record.to_text() for record in get_zone_keys(server=server, zone=zone, port=port).records)
+    except DnsDebuggerException as err:
+        yield TestCase(description=description, result=err.message, success=False)
+        return
+
+    audit = _Audit(dnskeys=dnskeys, workers=workers or os.cpu_count())
+    try:
+        yield from audit.run(stream_rrsets(server=server, zone=zone, port=port), _Delegations(zone))
+    except (dns.exception.DNSException, OSError) as err:
+        LOGGER.critical("AXFR of %s from %s failed: %s", zone, server, err)
+        yield TestCase(description=description, result="AXFR failed: {}".format(err), success=False)
+        return
+    yield TestCase(description=description,
+                   result="{} RRSETs checked, {} problems".format(audit.verified, audit.problems),
+                   success=audit.problems == 0)
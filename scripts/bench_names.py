@@ -0,0 +1,159 @@
+"""
+Benchmark of the name handling of a DNSSEC check, on a synthetic chain of trust so that no network is needed.
+For each zone of the qname, DS and DNSKEY RRSETs are canonicalized for their RRSIG and DS digests are computed,
+then the answer RRSETs are canonicalized, like a full check does. The dnspython name objects allocated by the
+check are counted, each one comes with its labels and is encoded again when its wire is needed.
+With --baseline, the same check is also run with the name handling it had before DnsName, names being parsed
+again by dnspython each time their wire is needed, so that both can be compared.
+
+    $ python scripts/bench_names.py [--baseline] [ITERATIONS]
+"""
+import argparse
+import hashlib
+import struct
+import time
+import types
+
+import dns.name
+
+from dns_debugger.dnssec.denial import nsec3_hash
+from dns_debugger.query import records_from_text
+from dns_debugger.records_models import DataType, RRSet
+from dns_debugger.utils import split_qname
+
+QNAME = "www.Sub.Example.com."
+KEY = "mdsswUyr3DPW132mOi8V9xESWE8jTo0dxCjjnopKl+GqJxpVXckHAeF+KkxLbxILfDLUT0rAK9iUzy1L53eKGQ=="
+SIGNATURE = "oJB1W6WNGv+ldvQ3WDG0MQkg5IEhjRip8WTrPYGv07h108dUKGMeDPKijVCHX3DDKdfb+v6oB9wfuh3DTJXUAfI/M0zmO/zz8bW0" \
+            "Rznl8O3tGNazPwQKkRN20XPXV6nwwfoXmJQbsLNrLfkGJ5D6fwFm8nN+6pBzeDQfsS3Ap3o="
+ANSWERS = {DataType.A: ["192.0.2.{}".format(index) for index in range(1, 5)],
+           DataType.AAAA: ["2001:db8::{}".format(index) for index in range(1, 5)],
+           DataType.NS: ["ns{}.Example.com.".format(index) for index in range(1, 5)],
+           DataType.MX: ["10 mx1.Example.com.", "20 mx2.Example.com."]}
+ITERATIONS = 200
+
+
+def _rrset(name, rdtype, texts, signer):
+    rrset = RRSet(rdata=None, records=records_from_text(rdtype.value, texts), name=name, rdtype=rdtype.value,
+                  rdclass=1, ttl=3600)
+    labels = len(name.rstrip(".").split(".")) if name != "." else 0
+    rrset.rrsig = records_from_text(DataType.RRSIG.value, [
+        "{} 13 {} 3600 20300101000000 20200101000000 12345 {} {}".format(rdtype.name, labels, signer, SIGNATURE)])
+    return rrset
+
+
+def build_check():
+    """RRSETs validated by a check of QNAME, with the zone of each one"""
+    zones = split_qname(QNAME)[:-1]
+    trust = []
+    for parent, zone in zip([None] + zones, zones):
+        if parent is not None:
+            trust.append((zone, _rrset(zone, DataType.DS, ["12345 13 2 " + "ab" * 32], parent)))
+        trust.append((zone, _rrset(zone, DataType.DNSKEY, ["257 3 13 " + KEY, "256 3 13 " + KEY], zone)))
+    answers = [_rrset(QNAME, rdtype, texts, zones[-1]) for rdtype, texts in ANSWERS.items()]
+    return trust, answers
+
+
+def check(trust, answers):
+    """Name handling of a full check"""
+    for zone in split_qname(QNAME.lower()):
+        nsec3_hash(zone, salt=b"\xaa\xbb", iterations=0)
+    for zone, rrset in trust:
+        for rrsig in rrset.rrsig:
+            rrset.compute_msg(rrsig=rrsig)
+        if rrset.rdtype == DataType.DNSKEY.value:
+            for key in rrset.records:
+                key.compute_sig(qname=zone, digest_type=2)
+    for rrset in answers:
+        for rrsig in rrset.rrsig:
+            rrset.compute_msg(rrsig=rrsig)
+
+
+def legacy_name(qname):
+    """Name with the wire it had before DnsName, parsed on each use"""
+    return types.SimpleNamespace(wire=dns.name.Name(dns.name.from_text(qname)).to_wire())
+
+
+def legacy_split_qname(qname):
+    """Zones of a name, split as strings as before DnsName"""
+    out = []
+    current = ''
+    for entry in qname.split(".")[::-1]:
+        if entry == "":
+            out.append(".")
+        else:
+            current = "%s.%s" % (entry, current)
+            out.append(current)
+    return out
+
+
+def legacy_msg(rrset, rrsig):
+    """Signed data of an RRSET, the signer and the owner of each record being parsed again"""
+    wired = struct.pack(b'!HBBIIIH', rrsig.type_covered, rrsig.algorithm, rrsig.labels, rrsig.original_ttl,
+                        rrsig.expiration, rrsig.inception, rrsig.key_tag) + legacy_name(rrsig.signer).wire
+    for record in sorted(rrset.records):
+        wired += record.to_wire(name=legacy_name(rrset.name), dtype=rrset.rdtype, dclass=rrset.rdclass,
+                                ttl=rrsig.original_ttl)
+    return wired
+
+
+def legacy_sig(key, qname):
+    """DS digest of a key, its owner being encoded by hand"""
+    signature = bytes()
+    for label in (qname[:-1] if qname == "." else qname).split('.'):
+        signature += struct.pack('B', len(label)) + label.encode()
+    signature += struct.pack('!HBB', int(key.flags), int(key.protocol), int(key.algo)) + key.public_key
+    return hashlib.sha256(signature).hexdigest().upper()
+
+
+def legacy_check(trust, answers):
+    """Name handling of a full check before DnsName"""
+    for zone in legacy_split_qname(QNAME.lower()):
+        hashlib.sha1(legacy_name(zone.lower()).wire + b"\xaa\xbb").digest()
+    for zone, rrset in trust:
+        for rrsig in rrset.rrsig:
+            legacy_msg(rrset, rrsig)
+        if rrset.rdtype == DataType.DNSKEY.value:
+            for key in rrset.records:
+                legacy_sig(key, zone)
+    for rrset in answers:
+        for rrsig in rrset.rrsig:
+            legacy_msg(rrset, rrsig)
+
+
+def measure(name, run, iterations, allocated):
+    """Print the name objects allocated by one run and the time per run"""
+    run()
+    allocated[0] = 0
+    nsec3_hash.cache_clear()
+    run()
+    print("{}: name objects allocated per check: {}".format(name, allocated[0]))
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        nsec3_hash.cache_clear()
+        run()
+    print("{}: time per check: {:.1f} us".format(name, (time.perf_counter() - started) / iterations * 1e6))
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark of the name handling of a DNSSEC check")
+    parser.add_argument("iterations", nargs="?", type=int, default=ITERATIONS)
+    parser.add_argument("--baseline", action="store_true", help="also run the name handling before DnsName")
+    args = parser.parse_args()
+    allocated = [0]
+    name_init = dns.name.Name.__init__
+
+    def counting_init(self, labels):
+        allocated[0] += 1
+        name_init(self, labels)
+
+    dns.name.Name.__init__ = counting_init
+    trust, answers = build_check()
+    if args.baseline:
+        measure("baseline", lambda: legacy_check(trust, answers), args.iterations, allocated)
+    measure("dnsname", lambda: check(trust, answers), args.iterations, allocated)
+
+
+if __name__ == "__main__":
+    main()
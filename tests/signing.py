@@ -0,0 +1,52 @@
+"""Zones signed with a generated ECDSA P-256 key (algorithm 13), so that stand-in servers serve valid RRSIG"""
+import base64
+import datetime
+import hashlib
+from typing import Dict, Iterable, List, Tuple
+
+from M2Crypto import EC
+
+from dns_debugger.query import records_from_text
+from dns_debugger.records_models import DataType, RRSet
+from tests.standin import TTL
+
+INCEPTION = datetime.datetime(2020, 1, 1)
+EXPIRATION = datetime.datetime(2030, 1, 1)
+
+
+class ZoneSigner:
+    """Key of a zone, its DNSKEY record and the RRSIG of the RRSETs it signs"""
+
+    def __init__(self, zone: str):
+        self.zone = zone
+        self._key = EC.gen_params(EC.NID_X9_62_prime256v1)
+        self._key.gen_key()
+        # the DER public key ends with the uncompressed point, 0x04 then X and Y
+        self.dnskey = "257 3 13 " + base64.b64encode(self._key.pub().get_der()[-64:]).decode()
+        self.key_tag = records_from_text(DataType.DNSKEY.value, [self.dnskey])[0].key_tag()
+
+    def sign(self, name: str, rdtype: str, texts: List[str], expiration: datetime.datetime = EXPIRATION) -> str:
+        """RRSIG of an RRSET in text format"""
+        labels = len(name.rstrip(".").split(".")) if name != "." else 0
+        template = "{} 13 {} {} {:%Y%m%d%H%M%S} {:%Y%m%d%H%M%S} {} {} {{}}".format(
+            rdtype, labels, TTL, expiration, INCEPTION, self.key_tag, self.zone)
+        rrsig = records_from_text(DataType.RRSIG.value, [template.format("AAAA")])[0]
+        rrset = RRSet(rdata=None, records=records_from_text(DataType[rdtype].value, texts), name=name,
+                      rdtype=DataType[rdtype].value, rdclass=1, ttl=TTL)
+        r_mpi, s_mpi = self._key.sign_dsa(hashlib.sha256(rrset.compute_msg(rrsig=rrsig)).digest())
+        # M2Crypto returns MPIs, a 4 bytes length then the big endian integer
+        signature = b"".join(int.from_bytes(mpi[4:], "big").to_bytes(32, "big") for mpi in (r_mpi, s_mpi))
+        return template.format(base64.b64encode(signature).decode())
+
+    def sign_answers(self, answers: Dict[Tuple[str, str], List[str]],
+                     unsigned: Iterable[Tuple[str, str]] = ()) -> Dict[Tuple[str, str], List[str]]:
+        """Answers of a stand-in zone with the RRSIG of each RRSET but the unsigned ones, after the RRSETs of a name"""
+        signed: Dict[Tuple[str, str], List[str]] = {}
+        for (name, rdtype), texts in answers.items():
+            rrsigs = signed.pop((name, "RRSIG"), [])
+            signed[(name, rdtype)] = texts
+            if (name, rdtype) not in unsigned:
+                rrsigs.append(self.sign(name, rdtype, texts))
+            if rrsigs:
+                signed[(name, "RRSIG")] = rrsigs
+        return signed
@@ -0,0 +1,347 @@
+"""Stand-in authoritative servers on loopback addresses, so that resolution is tested without network access"""
+import http.server
+import socket
+import ssl
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import dns.flags
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+from M2Crypto import ASN1, EVP, RSA, X509
+
+TTL = 300
+# RRSETs per message of a zone transfer
+AXFR_CHUNK = 3
+
+
+class Clock:
+    """Clock moved by the test, to be injected where time.time or time.monotonic is used"""
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class Zone:
+    """
+    Data served by a stand-in server: answers by (qname, type), referrals to child zones with their nameservers
+    and optional glue address, and an rcode forced for every query if the server is broken. RRSIG answers are
+    added to the answers of the type they cover when DNSSEC records are asked, and the zone is transferred by AXFR
+    in the order of the answers.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, origin: str, answers: Optional[Dict[Tuple[str, str], List[str]]] = None,
+                 referrals: Optional[Dict[str, List[Tuple[str, Optional[str]]]]] = None,
+                 referral_ttl: int = TTL, rcode: Optional[int] = None):
+        self.origin = origin
+        self.answers = answers or {}
+        self.referrals = referrals or {}
+        self.referral_ttl = referral_ttl
+        self.rcode = rcode
+
+    def respond(self, query):
+        """Response to a query"""
+        response = dns.message.make_response(query)
+        response.flags &= ~dns.flags.RA
+        if self.rcode is not None:
+            response.set_rcode(self.rcode)
+            return response
+        response.flags |= dns.flags.AA
+        qname = query.question[0].name.to_text().lower()
+        rdtype = dns.rdatatype.to_text(query.question[0].rdtype)
+        if not self._refer(response, qname) and not self._answer(query, response, qname, rdtype):
+            if not any(name == qname for name, _ in self.answers):
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            response.authority.append(self._soa())
+        return response
+
+    def _refer(self, response, qname: str) -> bool:
+        """Add the referral to the child zone of qname, if it is delegated"""
+        for child, servers in self.referrals.items():
+            if qname == child or qname.endswith("." + child):
+                response.flags &= ~dns.flags.AA
+                response.authority.append(dns.rrset.from_text(child, self.referral_ttl, "IN", "NS",
+                                                              *[name for name, _ in servers]))
+                for name, glue in servers:
+                    if glue is not None:
+                        response.additional.append(dns.rrset.from_text(name, TTL, "IN", "A", glue))
+                return True
+        return False
+
+    def _answer(self, query, response, qname: str, rdtype: str) -> bool:
+        """Add the answer of the type or the CNAME of qname, with their RRSIG when DNSSEC records are asked"""
+        rdtype = rdtype if (qname, rdtype) in self.answers else "CNAME"
+        if (qname, rdtype) not in self.answers:
+            return False
+        response.answer.extend(self._rrsets(qname, rdtype))
+        if query.ednsflags & dns.flags.DO:
+            response.answer.extend(rrsig for rrsig in self._rrsets(qname, "RRSIG")
+                                   if dns.rdatatype.to_text(rrsig.covers) == rdtype)
+        return True
+
+    def transfer(self, query) -> List[dns.message.Message]:
+        """Messages of an AXFR: the SOA, every answer but the SOA, then the SOA again"""
+        rrsets = [self._soa()] + [rrset for name, rdtype in self.answers if (name, rdtype) != (self.origin, "SOA")
+                                  for rrset in self._rrsets(name, rdtype)] + [self._soa()]
+        messages = []
+        for offset in range(0, len(rrsets), AXFR_CHUNK):
+            message = dns.message.make_response(query)
+            message.flags |= dns.flags.AA
+            message.answer = rrsets[offset:offset + AXFR_CHUNK]
+            messages.append(message)
+        return messages
+
+    def _soa(self) -> dns.rrset.RRset:
+        default = "ns.{} hostmaster.{} 1 3600 600 86400 60".format(self.origin, self.origin)
+        return dns.rrset.from_text(self.origin, TTL, "IN", "SOA", *self.answers.get((self.origin, "SOA"), [default]))
+
+    def _rrsets(self, name: str, rdtype: str) -> List[dns.rrset.RRset]:
+        """RRSET of an answer, RRSIG answers are split by the type they cover"""
+        if rdtype != "RRSIG":
+            return [dns.rrset.from_text(name, TTL, "IN", rdtype, *self.answers[(name, rdtype)])]
+        by_covered: Dict[str, List[str]] = {}
+        for text in self.answers.get((name, rdtype), []):
+            by_covered.setdefault(text.split()[0], []).append(text)
+        return [dns.rrset.from_text(name, TTL, "IN", rdtype, *texts) for texts in by_covered.values()]
+
+
+class Hierarchy:
+    """
+    Stand-in servers by loopback address, all listening on the same free port, queries are counted by server.
+    With tcp, they also answer queries and zone transfers over TCP.
+    """
+
+    def __init__(self, servers: Dict[str, Zone], tcp: bool = False):
+        self.servers = servers
+        self.tcp = tcp
+        self.queries: Dict[str, int] = {ip_addr: 0 for ip_addr in servers}
+        self.port = 0
+        self._sockets: List[socket.socket] = []
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> 'Hierarchy':
+        """Bind every server then serve them in background threads"""
+        for ip_addr in self.servers:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((ip_addr, self.port))
+            sock.settimeout(0.1)
+            self.port = sock.getsockname()[1]
+            self._sockets.append(sock)
+            self._spawn(self._serve, ip_addr, sock)
+            if self.tcp:
+                listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                listener.bind((ip_addr, self.port))
+                listener.listen()
+                listener.settimeout(0.1)
+                self._sockets.append(listener)
+                self._spawn(self._serve_tcp, ip_addr, listener)
+        return self
+
+    def _spawn(self, target, ip_addr: str, sock: socket.socket):
+        thread = threading.Thread(target=target, args=(ip_addr, sock), daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _serve(self, ip_addr: str, sock: socket.socket):
+        while True:
+            try:
+                wire, address = sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            self.queries[ip_addr] += 1
+            sock.sendto(self.servers[ip_addr].respond(dns.message.from_wire(wire)).to_wire(), address)
+
+    def _serve_tcp(self, ip_addr: str, listener: socket.socket):
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._serve_connection, args=(ip_addr, conn), daemon=True).start()
+
+    def _serve_connection(self, ip_addr: str, conn: socket.socket):
+        """Answer the length prefixed queries of a connection until the client closes it"""
+        with conn:
+            while True:
+                wire = read_message(conn)
+                if wire is None:
+                    return
+                self.queries[ip_addr] += 1
+                query = dns.message.from_wire(wire)
+                zone = self.servers[ip_addr]
+                responses = zone.transfer(query) if query.question[0].rdtype == dns.rdatatype.AXFR \
+                    else [zone.respond(query)]
+                for response in responses:
+                    conn.sendall(frame(response.to_wire()))
+
+    def stop(self):
+        """Close the servers"""
+        for sock in self._sockets:
+            sock.close()
+        for thread in self._threads:
+            thread.join()
+
+
+class TlsServer:
+    """
+    Stand-in DNS over TLS server on 127.0.0.1, or DNS over HTTPS server with doh, answering from a zone.
+    Connections and queries are counted, open connections can be closed by the server between queries.
+    """
+
+    def __init__(self, zone: Zone, certfile: str, doh: bool = False):
+        self.zone = zone
+        self.doh = doh
+        self.connections = 0
+        self.queries = 0
+        self.port = 0
+        self._context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self._context.load_cert_chain(certfile)
+        self._listener: Optional[socket.socket] = None
+        self._open: List[ssl.SSLSocket] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'TlsServer':
+        """Listen on a free port and accept connections in a background thread"""
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen()
+        self._listener.settimeout(0.1)
+        self.port = self._listener.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+        return self
+
+    def _accept(self):
+        while True:
+            try:
+                conn, address = self._listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve_connection, args=(conn, address), daemon=True).start()
+
+    def _serve_connection(self, conn: socket.socket, address):
+        try:
+            tls_conn = self._context.wrap_socket(conn, server_side=True)
+        except (ssl.SSLError, OSError):
+            conn.close()
+            return
+        self._open.append(tls_conn)
+        with tls_conn:
+            if self.doh:
+                DohHandler(tls_conn, address, self)
+                return
+            while True:
+                wire = read_message(tls_conn)
+                if wire is None:
+                    return
+                tls_conn.sendall(frame(self.answer(wire)))
+
+    def answer(self, wire: bytes) -> bytes:
+        """Response to a query in wire format"""
+        self.queries += 1
+        return self.zone.respond(dns.message.from_wire(wire)).to_wire()
+
+    def close_connections(self):
+        """Close the open connections, as a server does with idle connections"""
+        for conn in self._open:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._open.clear()
+
+    def stop(self):
+        """Close the server and its connections"""
+        self._listener.close()
+        self._thread.join()
+        self.close_connections()
+
+
+class DohHandler(http.server.BaseHTTPRequestHandler):
+    """DNS over HTTPS POST requests of a keep-alive connection, answered by the TlsServer"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a query in the body"""
+        wire = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path != "/dns-query" or self.headers["Content-Type"] != "application/dns-message":
+            self.send_error(415)
+            return
+        body = self.server.answer(wire)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/dns-message")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+def self_signed_certificate(path: str) -> str:
+    """Write a key and a certificate for 127.0.0.1 to path, to serve TLS and to be trusted by the client"""
+    pkey = EVP.PKey()
+    pkey.assign_rsa(RSA.gen_key(2048, 65537, callback=lambda *args: None))
+    cert = _certificate("127.0.0.1")
+    cert.set_pubkey(pkey)
+    cert.sign(pkey, "sha256")
+    with open(path, "wb") as pem:
+        pem.write(pkey.as_pem(cipher=None) + cert.as_pem())
+    return path
+
+
+def _certificate(ip_addr: str) -> X509.X509:
+    """Unsigned certificate of an IP address, valid for an hour"""
+    name = X509.X509_Name()
+    name.CN = ip_addr
+    cert = X509.X509()
+    cert.set_version(2)
+    cert.set_serial_number(1)
+    cert.set_subject(name)
+    cert.set_issuer(name)
+    for setter, offset in ((cert.set_not_before, -60), (cert.set_not_after, 3600)):
+        validity = ASN1.ASN1_UTCTIME()
+        validity.set_time(int(time.time()) + offset)
+        setter(validity)
+    cert.add_ext(X509.new_extension("subjectAltName", "IP:" + ip_addr))
+    return cert
+
+
+def frame(wire: bytes) -> bytes:
+    """DNS message prefixed by its length, as sent over TCP and TLS"""
+    return struct.pack("!H", len(wire)) + wire
+
+
+def read_message(conn) -> Optional[bytes]:
+    """Length prefixed DNS message read from a TCP or TLS connection, None when it is closed"""
+    try:
+        header = _read_exactly(conn, 2)
+        return _read_exactly(conn, struct.unpack("!H", header)[0])
+    except (EOFError, OSError):
+        return None
+
+
+def _read_exactly(conn, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise EOFError("connection closed")
+        data += chunk
+    return data
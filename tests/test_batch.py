@@ -0,0 +1,63 @@
+"""Batch mode keeps a bounded number of results in memory"""
+import gc
+import io
+import json
+import weakref
+
+from dns_debugger import batch
+from dns_debugger.executors import testsuite
+
+WORKERS = 2
+
+
+def _fake_run_tests(qname, plan):  # pylint: disable=unused-argument
+    suite = testsuite.TestSuite()
+    suite.add_testcase(testsuite.TestCase(description=qname, result="x" * 1000, success=True))
+    return suite
+
+
+def test_results_are_released_once_yielded(monkeypatch):
+    """Results already yielded are not kept by the batch"""
+    monkeypatch.setattr(batch, "run_tests", _fake_run_tests)
+    qnames = ["zone{}.test.".format(index) for index in range(40)]
+    yielded = []
+    alive = []
+    for qname, suite in batch.run_batch(qnames=qnames, workers=WORKERS):
+        yielded.append(qname)
+        alive.append(weakref.ref(suite))
+        del suite
+        gc.collect()
+        assert sum(ref() is not None for ref in alive) <= 1
+    assert yielded == qnames
+
+
+def test_testcases_are_stored_once():
+    """Failures and successes are computed from the single list of testcases"""
+    suite = testsuite.TestSuite()
+    suite.add_testcases([testsuite.TestCase(description="a", result="", success=True),
+                         testsuite.TestCase(description="b", result="", success=False)])
+    assert [case.description for case in suite.get_success()] == ["a"]
+    assert [case.description for case in suite.get_failures()] == ["b"]
+    assert (suite.success, suite.failures) == (1, 1)
+
+
+def test_json_is_serialized_one_testcase_at_a_time(monkeypatch):
+    """Testcases are serialized like the lines of a streaming testsuite, without building lists of them"""
+    suite = testsuite.TestSuite()
+    suite.add_testcases([testsuite.TestCase(description="a", result="", success=True),
+                         testsuite.TestCase(description="b", result="line\nbreak", success=False)])
+    monkeypatch.setattr(suite, "get_success", None)
+    monkeypatch.setattr(suite, "get_failures", None)
+    assert json.loads(suite.to_json()) == {"success": 1, "failures": 1, "testcases": {
+        "failures": [{"description": "b", "result": "line\nbreak", "success": False}],
+        "success": [{"description": "a", "result": "", "success": True}]}}
+    line = "".join(suite.iter_json(display_all=False, multiline=False, qname="example."))
+    assert "\n" not in line
+    assert json.loads(line) == {"qname": "example.", "success": 1, "failures": 1, "testcases": {
+        "failures": [{"description": "b", "result": "line\nbreak", "success": False}]}}
+
+    sink = io.StringIO()
+    streaming = testsuite.StreamingTestSuite(sink=sink, keep_failures=True)
+    streaming.add_testcases(suite.testcases)
+    assert sink.getvalue().splitlines() == [testsuite.testcase_json(case) for case in suite.testcases]
+    assert json.loads(streaming.to_json()) == json.loads("".join(suite.iter_json(display_all=False)))
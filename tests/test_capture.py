@@ -0,0 +1,105 @@
+"""Capture of exchanges with a stand-in server and their replay with the network disabled"""
+import os
+import socket
+
+import dns.message
+import pytest
+
+from dns_debugger import capture, query
+from dns_debugger.capture import Recorder, Replay, endpoint
+from dns_debugger.exceptions import QueryTimeException
+from dns_debugger.query import run_query
+from dns_debugger.records_models import DataType
+from tests.standin import Hierarchy, Zone
+
+SERVER = "127.0.0.1"
+UNREACHABLE = "127.0.0.9"
+ZONE = Zone(origin="example.", answers={("www.example.", "A"): ["192.0.2.1"],
+                                        ("www.example.", "AAAA"): ["2001:db8::1"]})
+
+
+@pytest.fixture(name="capture_path")
+def capture_path_fixture(tmp_path):
+    yield str(tmp_path / "exchanges.cap")
+    capture.configure()
+
+
+def _disable_network(monkeypatch):
+    def no_socket(*args, **kwargs):
+        raise AssertionError("network used during replay")
+
+    monkeypatch.setattr(socket, "socket", no_socket)
+
+
+def _answers(response):
+    return [rdata.to_text() for rrset in response.answer for rdata in rrset]
+
+
+def _run_queries(port, **kwargs):
+    return [_answers(run_query(SERVER, "www.example.", rdtype, want_dnssec=False, port=port, use_cache=False,
+                               **kwargs)) for rdtype in (DataType.A, DataType.AAAA)]
+
+
+def _record_run_queries(monkeypatch, capture_path):
+    """Record answers of a stand-in server and a timeout, then replay the capture with the network disabled"""
+    monkeypatch.setattr(query, "DEFAULT_TIMEOUT", 0.5)
+    hierarchy = Hierarchy({SERVER: ZONE}).start()
+    capture.configure(record=capture_path)
+    try:
+        recorded = _run_queries(hierarchy.port)
+        with pytest.raises(QueryTimeException):
+            run_query(UNREACHABLE, "www.example.", DataType.A, want_dnssec=False, port=hierarchy.port,
+                      use_cache=False)
+    finally:
+        hierarchy.stop()
+    capture.configure(replay=capture_path)
+    _disable_network(monkeypatch)
+    return hierarchy.port, recorded
+
+
+def test_run_query_responses_are_replayed_without_network(monkeypatch, capture_path):
+    port, recorded = _record_run_queries(monkeypatch, capture_path)
+    assert recorded == [["192.0.2.1"], ["2001:db8::1"]]
+    assert _run_queries(port) == recorded
+    with pytest.raises(QueryTimeException, match="Timeout recorded"):
+        run_query(UNREACHABLE, "www.example.", DataType.A, want_dnssec=False, port=port, use_cache=False)
+
+
+def test_replayed_exchanges_are_keyed_by_port_and_transport(monkeypatch, capture_path):
+    port, _ = _record_run_queries(monkeypatch, capture_path)
+    with pytest.raises(QueryTimeException, match="No response recorded"):
+        _run_queries(port + 1)
+    with pytest.raises(QueryTimeException, match="No response recorded"):
+        _run_queries(port, transport="tls")
+
+
+def _record(path, qnames):
+    recorder = Recorder(path)
+    for qname in qnames:
+        query = dns.message.make_query(qname, "A")
+        response = ZONE.respond(query)
+        recorder.record(endpoint("udp", SERVER, 53), query.to_wire(), response.to_wire(), rtt=0.01)
+    recorder.close()
+
+
+def test_replayed_response_gets_the_id_of_the_query(capture_path):
+    _record(capture_path, ["www.example."])
+    replay = Replay(capture_path)
+    query = dns.message.make_query("www.example.", "A")
+    query.id = 4242
+    response = replay.exchange(endpoint("udp", SERVER, 53), query)
+    assert response.id == 4242
+    assert query.is_response(response)
+    assert _answers(response) == ["192.0.2.1"]
+    replay.close()
+
+
+def test_truncated_tail_record_is_ignored(capture_path):
+    _record(capture_path, ["www.example.", "other.example."])
+    os.truncate(capture_path, os.path.getsize(capture_path) - 5)
+    replay = Replay(capture_path)
+    server = endpoint("udp", SERVER, 53)
+    assert _answers(replay.exchange(server, dns.message.make_query("www.example.", "A"))) == ["192.0.2.1"]
+    with pytest.raises(QueryTimeException, match="No response recorded"):
+        replay.exchange(server, dns.message.make_query("other.example.", "A"))
+    replay.close()
@@ -0,0 +1,146 @@
+"""NSEC and NSEC3 proofs that a delegation has no DS record"""
+import pytest
+
+from dns_debugger.dnssec import denial
+from dns_debugger.dnssec.denial import Nsec3Chain, nsec3_hash
+from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.models import ChainOfTrust
+from dns_debugger.query import records_from_text
+from dns_debugger.records_models import DataType, RRSet
+from tests.signing import ZoneSigner
+
+SALT = "aabbccdd"
+ITERATIONS = 12
+LAST_HASH = "V" * 32
+
+
+def _rrset(name, rdtype, texts, signer="example."):
+    rrset = RRSet(rdata=None, records=records_from_text(rdtype.value, texts), name=name, rdtype=rdtype.value,
+                  rdclass=1, ttl=3600)
+    rrset.rrsig = records_from_text(DataType.RRSIG.value, [
+        "{} 8 2 3600 20300101000000 20200101000000 12345 {} AAAA".format(rdtype.name, signer)])
+    return rrset
+
+
+def _nsec3(owner_hash, next_hash, types, flags=0, salt=SALT):
+    return _rrset("{}.example.".format(owner_hash), DataType.NSEC3,
+                  ["1 {} {} {} {} {}".format(flags, ITERATIONS, salt, next_hash, types)])
+
+
+def _hash(name, salt=SALT):
+    return nsec3_hash(name, salt=bytes.fromhex(salt), iterations=ITERATIONS)
+
+
+def _successor(name_hash):
+    return name_hash[:-1] + "0123456789ABCDEFGHIJKLMNOPQRSTUV"[int(name_hash[-1], 32) + 1]
+
+
+def _apex():
+    """NSEC3 record of the zone apex, its span is too narrow to cover any other name"""
+    apex_hash = _hash("example.")
+    return _nsec3(apex_hash, _successor(apex_hash), "NS SOA RRSIG DNSKEY NSEC3PARAM")
+
+
+def _rest_of_zone(flags=0):
+    """NSEC3 record spanning from the apex successor around to the apex, it covers every other name"""
+    apex_hash = _hash("example.")
+    return _nsec3(_successor(apex_hash), apex_hash, "", flags=flags)
+
+
+def test_nsec_proves_insecure_delegation():
+    proof = [_rrset("sub.example.", DataType.NSEC, ["z.example. NS RRSIG NSEC"])]
+    assert denial._check_nsec("sub.example.", proof) == "NSEC proves sub.example. is an insecure delegation"
+
+
+@pytest.mark.parametrize("types, message", [
+    ("NS DS RRSIG NSEC", "lists a DS record"),
+    ("NS SOA RRSIG NSEC", "comes from the child zone"),
+    ("A RRSIG NSEC", "it is not a delegation"),
+])
+def test_nsec_matching_types_must_be_a_delegation_without_ds(types, message):
+    proof = [_rrset("sub.example.", DataType.NSEC, ["z.example. " + types])]
+    with pytest.raises(DnsDebuggerException, match=message):
+        denial._check_nsec("sub.example.", proof)
+
+
+def test_nsec_covering_contradicts_noerror_answer():
+    proof = [_rrset("a.example.", DataType.NSEC, ["z.example. A RRSIG NSEC"])]
+    with pytest.raises(DnsDebuggerException, match="contradicts the NOERROR answer"):
+        denial._check_nsec("sub.example.", proof)
+
+
+def test_nsec3_matching_proves_insecure_delegation():
+    proof = [_nsec3(_hash("sub.example."), LAST_HASH, "NS")]
+    assert denial._check_nsec3("sub.example.", proof) == "NSEC3 proves sub.example. is an insecure delegation"
+
+
+def test_nsec3_opt_out_covering_proves_insecure_delegation():
+    proof = [_apex(),
+             _rest_of_zone(flags=1)]
+    assert denial._check_nsec3("sub.example.", proof) == "NSEC3 opt-out proves sub.example. is an insecure delegation"
+
+
+def test_nsec3_covering_without_opt_out_contradicts_noerror_answer():
+    proof = [_apex(),
+             _rest_of_zone()]
+    with pytest.raises(DnsDebuggerException, match="contradicts the NOERROR answer"):
+        denial._check_nsec3("sub.example.", proof)
+
+
+def test_nsec3_proof_only_uses_records_of_the_response():
+    # an earlier response left a matching record for sub.example. in the shared chain
+    denial._check_nsec3("sub.example.", [_nsec3(_hash("sub.example."), LAST_HASH, "NS")])
+    proof = [_apex()]
+    with pytest.raises(DnsDebuggerException, match="do not prove"):
+        denial._check_nsec3("sub.example.", proof)
+
+
+def test_nsec3_records_with_other_hash_parameters_are_ignored():
+    proof = [_apex(), _nsec3(_hash("sub.example.", salt="01"), LAST_HASH, "NS", salt="01")]
+    with pytest.raises(DnsDebuggerException, match="do not prove"):
+        denial._check_nsec3("sub.example.", proof)
+
+
+def test_nsec3_proof_is_looked_up_in_the_chain(monkeypatch):
+    monkeypatch.setattr(Nsec3Chain, "covering", lambda self, name_hash: None)
+    proof = [_apex(), _rest_of_zone(flags=1)]
+    with pytest.raises(DnsDebuggerException, match="do not prove"):
+        denial._check_nsec3("sub.example.", proof)
+
+
+def test_chain_lookups():
+    chain = Nsec3Chain()
+    records = {owner_hash: records_from_text(DataType.NSEC3.value, ["1 0 0 - {} NS".format(next_hash * 32)])[0]
+               for owner_hash, next_hash in (("2", "5"), ("5", "8"), ("8", "2"))}
+    for owner_hash, record in records.items():
+        chain.add(owner_hash * 32, record)
+    assert len(chain) == 3
+    assert chain.matching("2" * 32) is records["2"]
+    assert chain.matching("3" * 32) is None
+    assert chain.covering("3" * 32) is records["2"]
+    assert chain.covering("6" * 32) is records["5"]
+    assert chain.covering("9" * 32) is records["8"]
+    assert chain.covering("1" * 32) is records["8"]
+
+
+def test_chain_with_gaps_covers_only_received_spans():
+    chain = Nsec3Chain()
+    chain.add("2" * 32, records_from_text(DataType.NSEC3.value, ["1 0 0 - {} NS".format("4" * 32)])[0])
+    assert chain.covering("3" * 32) is not None
+    assert chain.covering("5" * 32) is None
+    assert chain.covering("1" * 32) is None
+
+
+def test_denial_with_invalid_signature_is_rejected():
+    signer = ZoneSigner("example.")
+    chain_of_trust = ChainOfTrust()
+    chain_of_trust.add_dnskey(records_from_text(DataType.DNSKEY.value, [signer.dnskey])[0])
+    proof = _rrset("sub.example.", DataType.NSEC, ["z.example. NS RRSIG NSEC"])
+    proof.rrsig = records_from_text(DataType.RRSIG.value, [signer.sign("sub.example.", "NSEC",
+                                                                       ["z.example. NS DS RRSIG NSEC"])])
+    with pytest.raises(DnsDebuggerException, match="is not validated by its RRSIG"):
+        denial.validate_ds_denial("sub.example.", [proof], chain_of_trust)
+    proof.rrsig = records_from_text(DataType.RRSIG.value, [signer.sign("sub.example.", "NSEC",
+                                                                       ["z.example. NS RRSIG NSEC"])])
+    assert denial.validate_ds_denial("sub.example.", [proof], chain_of_trust) == \
+        "NSEC proves sub.example. is an insecure delegation"
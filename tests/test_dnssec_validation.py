@@ -0,0 +1,76 @@
+"""DNSSEC executor: the answer of the qname is validated with the keys of the chain of trust"""
+import typing
+
+import pytest
+
+from dns_debugger.executors import dnssec_validation
+from dns_debugger.executors.intermediates import Resolution
+from dns_debugger.query import Resolver, records_from_text
+from dns_debugger.records_models import DataType, RRSet
+from tests.signing import ZoneSigner
+
+QNAME = "www.example."
+SERVER = Resolver(ip_addr="192.0.2.53", qname="ns.example.")
+CUTS = [(".", [SERVER]), ("example.", [SERVER])]
+
+FakeContext = typing.NamedTuple("FakeContext", [("qname", str), ("resolution", Resolution)])
+
+
+class Context(FakeContext):
+    """Context of a run whose resolution is already known"""
+
+    def get(self, name):
+        assert name == "resolution"
+        return self.resolution
+
+
+@pytest.fixture(name="signer", scope="module")
+def signer_fixture():
+    return ZoneSigner("example.")
+
+
+class SignedZone:
+    """Every zone is signed by the signer key, the answer of QNAME carries the signature of 192.0.2.1"""
+
+    def __init__(self, signer: ZoneSigner):
+        self.signer = signer
+        self.addresses = ["192.0.2.1"]
+        self.queried = []
+
+    def validate_zone_keys(self, qname, chain_of_trust, origin):  # pylint: disable=unused-argument
+        chain_of_trust.add_dnskey(records_from_text(DataType.DNSKEY.value, [self.signer.dnskey])[0])
+        return True
+
+    def dns_query(self, qname, rdtype, want_dnssec=False):  # pylint: disable=unused-argument
+        self.queried.append((qname, rdtype))
+        rrset = RRSet(rdata=None, records=records_from_text(rdtype.value, self.addresses), name=qname,
+                      rdtype=rdtype.value, rdclass=1, ttl=300)
+        rrset.rrsig = records_from_text(DataType.RRSIG.value, [self.signer.sign(QNAME, "A", ["192.0.2.1"])])
+        return rrset
+
+
+@pytest.fixture(name="zone")
+def zone_fixture(monkeypatch, signer):
+    zone = SignedZone(signer)
+    monkeypatch.setattr(dnssec_validation, "validate_zone_keys", zone.validate_zone_keys)
+    monkeypatch.setattr(dnssec_validation, "dns_query", zone.dns_query)
+    return zone
+
+
+def _run():
+    testcase, = dnssec_validation.run_tests(Context(qname=QNAME, resolution=Resolution(trace=[], cuts=CUTS,
+                                                                                       error=None)))
+    return testcase
+
+
+def test_answer_is_validated(zone):
+    testcase = _run()
+    assert (testcase.result, testcase.success) == ("DNSSEC validation is OK", True)
+    assert zone.queried == [(QNAME, DataType.A)]
+
+
+def test_answer_with_invalid_signature_fails(zone):
+    zone.addresses = ["192.0.2.99"]
+    testcase = _run()
+    assert (testcase.result, testcase.success) == ("A RRSET of www.example. is not validated by its RRSIG", False)
+    assert zone.queried == [(QNAME, DataType.A)]
@@ -0,0 +1,44 @@
+"""EDNS buffer size of servers with an injected clock"""
+from dns_debugger.edns import DOWNGRADE_TTL, EDNS_PAYLOADS, PROBE_TIMEOUT, EdnsCapabilities
+from tests.standin import Clock
+
+SERVER = "192.0.2.53"
+LARGEST, SMALLEST = EDNS_PAYLOADS[0], EDNS_PAYLOADS[-1]
+
+
+def test_unknown_server_is_probed_with_the_largest_size_and_a_short_timeout():
+    capabilities = EdnsCapabilities(clock=Clock(now=1000.0))
+    assert capabilities.get(SERVER) == LARGEST
+    assert capabilities.timeout(SERVER, 10) == PROBE_TIMEOUT
+    assert capabilities.timeout(SERVER, 1) == 1
+
+
+def test_server_is_downgraded_after_a_timeout():
+    capabilities = EdnsCapabilities(clock=Clock(now=1000.0))
+    assert capabilities.downgrade(SERVER, LARGEST) == SMALLEST
+    assert capabilities.get(SERVER) == SMALLEST
+    # the smallest size cannot be downgraded, the timeout is not shortened anymore
+    assert capabilities.timeout(SERVER, 10) == 10
+    assert capabilities.downgrade(SERVER, SMALLEST) is None
+    assert capabilities.get("192.0.2.54") == LARGEST
+
+
+def test_downgrade_expires_after_an_hour():
+    clock = Clock(now=1000.0)
+    capabilities = EdnsCapabilities(clock=clock)
+    capabilities.downgrade(SERVER, LARGEST)
+    capabilities.confirm(SERVER, SMALLEST)
+    clock.now += DOWNGRADE_TTL - 1
+    assert capabilities.get(SERVER) == SMALLEST
+    clock.now += 1
+    assert capabilities.get(SERVER) == LARGEST
+    assert capabilities.timeout(SERVER, 10) == PROBE_TIMEOUT
+
+
+def test_confirmed_size_is_not_downgraded():
+    capabilities = EdnsCapabilities(clock=Clock(now=1000.0))
+    capabilities.confirm(SERVER, LARGEST)
+    assert capabilities.timeout(SERVER, 10) == 10
+    # the server answered with this size before, the timeout is not caused by the buffer size
+    assert capabilities.downgrade(SERVER, LARGEST) is None
+    assert capabilities.get(SERVER) == LARGEST
@@ -0,0 +1,107 @@
+"""Iterative resolution against a stand-in hierarchy: root, fr. and org. TLDs, a.fr. served by a glueless NS"""
+import threading
+import time
+
+import dns.rcode
+import pytest
+
+from dns_debugger import query
+from dns_debugger.exceptions import QueryErrException
+from dns_debugger.query import ITERATIVE_WORKERS, IterativeResolver
+from dns_debugger.records_models import DataType
+from tests.standin import Hierarchy, Zone
+
+ROOT, FR, ORG, A_FR = "127.0.0.1", "127.0.0.2", "127.0.0.4", "127.0.0.3"
+BROKEN_FR = "127.0.0.5"
+
+
+def make_hierarchy(fr_ttl=300):
+    """Root delegates fr. with a TTL of fr_ttl, a.fr. nameserver is only reachable through org."""
+    return Hierarchy({
+        ROOT: Zone(origin=".", referrals={"fr.": [("ns.nic.fr.", FR)], "org.": [("ns.org.", ORG)]},
+                   referral_ttl=fr_ttl),
+        FR: Zone(origin="fr.", referrals={"a.fr.": [("ns.b.org.", None)]}),
+        ORG: Zone(origin="org.", answers={("ns.b.org.", "A"): [A_FR]}),
+        A_FR: Zone(origin="a.fr.", answers={("a.fr.", "NS"): ["ns.b.org."], ("www.a.fr.", "A"): ["192.0.2.1"],
+                                            ("alias.a.fr.", "CNAME"): ["www.a.fr."]}),
+    }).start()
+
+
+@pytest.fixture(name="hierarchy")
+def hierarchy_fixture():
+    hierarchy = make_hierarchy()
+    yield hierarchy
+    hierarchy.stop()
+
+
+def _resolver(hierarchy):
+    return IterativeResolver(hints=[("root.", ROOT)], port=hierarchy.port)
+
+
+def test_resolve_follows_glueless_referrals(hierarchy):
+    trace = []
+    rrset = _resolver(hierarchy).resolve("www.a.fr.", DataType.A, trace=trace)
+    assert [record.address for record in rrset.records] == ["192.0.2.1"]
+    assert any("Referral to a.fr." in testcase.result for testcase in trace)
+
+
+def test_resolve_follows_cname(hierarchy):
+    rrset = _resolver(hierarchy).resolve("alias.a.fr.", DataType.A)
+    assert rrset.name == "www.a.fr."
+
+
+def test_delegation_returns_every_cut(hierarchy):
+    cuts = _resolver(hierarchy).delegation("a.fr.")
+    assert [zone for zone, _ in cuts] == [".", "fr.", "a.fr."]
+    assert [server.ip_addr for server in cuts[-1][1]] == [A_FR]
+
+
+def test_glueless_nameserver_ipv6_address_is_resolved(monkeypatch, hierarchy):
+    # the IPv6 address is not served, it is raced with the IPv4 one and times out quickly
+    monkeypatch.setattr(query, "DEFAULT_TIMEOUT", 0.5)
+    hierarchy.servers[ORG].answers[("ns.b.org.", "AAAA")] = ["2001:db8::53"]
+    cuts = _resolver(hierarchy).delegation("a.fr.")
+    assert [server.ip_addr for server in cuts[-1][1]] == [A_FR, "2001:db8::53"]
+
+
+def test_resolvers_share_one_query_pool(hierarchy):
+    threads = threading.active_count()
+    resolvers = [_resolver(hierarchy) for _ in range(ITERATIVE_WORKERS + 1)]
+    for resolver in resolvers:
+        resolver.resolve("www.a.fr.", DataType.A)
+    assert threading.active_count() - threads <= ITERATIVE_WORKERS
+
+
+def test_delegation_resolves_expired_intermediate_cut_again():
+    hierarchy = make_hierarchy(fr_ttl=1)
+    try:
+        resolver = _resolver(hierarchy)
+        resolver.delegation("a.fr.")
+        root_queries = hierarchy.queries[ROOT]
+        time.sleep(1.1)
+        assert [zone for zone, _ in resolver.delegation("a.fr.")] == [".", "fr.", "a.fr."]
+        assert hierarchy.queries[ROOT] > root_queries
+    finally:
+        hierarchy.stop()
+
+
+@pytest.fixture(name="broken_hierarchy")
+def broken_hierarchy_fixture():
+    """fr. is served by a broken server answering SERVFAIL and by a working one"""
+    hierarchy = Hierarchy({
+        ROOT: Zone(origin=".", referrals={"fr.": [("a.nic.fr.", BROKEN_FR), ("b.nic.fr.", FR)]}),
+        BROKEN_FR: Zone(origin="fr.", rcode=dns.rcode.SERVFAIL),
+        FR: Zone(origin="fr.", answers={("www.fr.", "A"): ["192.0.2.2"]}),
+    }).start()
+    yield hierarchy
+    hierarchy.stop()
+
+
+def test_resolve_fails_over_servfail(broken_hierarchy):
+    rrset = _resolver(broken_hierarchy).resolve("www.fr.", DataType.A)
+    assert [record.address for record in rrset.records] == ["192.0.2.2"]
+
+
+def test_authoritative_nxdomain_is_final(broken_hierarchy):
+    with pytest.raises(QueryErrException, match="answered NXDOMAIN for nope.fr."):
+        _resolver(broken_hierarchy).resolve("nope.fr.", DataType.A)
@@ -0,0 +1,45 @@
+"""Short load tests against a stand-in server, and against a socket which never answers"""
+import socket
+
+from dns_debugger import loadtest
+from dns_debugger.loadtest import LoadTest
+from dns_debugger.query import Resolver
+from dns_debugger.records_models import DataType
+from tests.standin import Hierarchy, Zone
+
+SERVER = "127.0.0.1"
+QUERIES = [("www.example.", DataType.A), ("missing.example.", DataType.A)]
+
+
+def _run(port, qps, duration, timeout=loadtest.LOAD_TIMEOUT):
+    """Interval reports then the summary of a load test"""
+    load = LoadTest(Resolver(ip_addr=SERVER, qname="standin.", port=port), QUERIES, qps=qps, duration=duration,
+                    timeout=timeout)
+    *reports, summary = load.run()
+    return reports, summary["summary"]
+
+
+def test_responses_are_counted_by_rcode():
+    hierarchy = Hierarchy({SERVER: Zone(origin="example.", answers={("www.example.", "A"): ["192.0.2.1"]})}).start()
+    try:
+        _, summary = _run(hierarchy.port, qps=200, duration=0.2)
+    finally:
+        hierarchy.stop()
+    assert (summary["sent"], summary["received"], summary["timeout_rate"]) == (40, 40, 0)
+    assert summary["rcodes"] == {"NOERROR": 20, "NXDOMAIN": 20}
+    assert summary["error_rate"] == 0
+    assert 0 < summary["latency_ms"]["p50"] <= summary["latency_ms"]["p99"]
+    assert hierarchy.queries[SERVER] == 40
+
+
+def test_query_ids_reused_in_flight_are_counted_as_timeouts(monkeypatch):
+    monkeypatch.setattr(loadtest, "SOCKETS", 1)
+    monkeypatch.setattr(loadtest, "QUERY_IDS", 4)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent:
+        silent.bind((SERVER, 0))
+        reports, summary = _run(silent.getsockname()[1], qps=200, duration=0.1, timeout=1.5)
+    # 20 queries on 4 IDs: 16 are replaced by the reuse of their ID, then the last 4 expire
+    assert [(report["sent"], report["timeouts"], report["in_flight"]) for report in reports] == [(20, 16, 4),
+                                                                                               (0, 4, 0)]
+    assert (summary["sent"], summary["received"], summary["timeout_rate"]) == (20, 0, 1.0)
+    assert summary["latency_ms"] == {"p50": None, "p95": None, "p99": None}
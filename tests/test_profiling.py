@@ -0,0 +1,34 @@
+"""Profiling is scoped to the profiled run and the functions it submits to pools"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dns_debugger import profiling
+
+
+def _busy_unprofiled_work(stop: threading.Event):
+    while not stop.is_set():
+        with profiling.stage("other_run"):
+            time.sleep(0.001)
+
+
+def _profiled_work():
+    with profiling.stage("pool_work"):
+        time.sleep(0.02)
+
+
+def test_profile_only_sees_its_own_run():
+    stop = threading.Event()
+    other = threading.Thread(target=_busy_unprofiled_work, args=(stop,))
+    other.start()
+    try:
+        with profiling.profile() as profiler, ThreadPoolExecutor(max_workers=2) as pool:
+            pool.submit(profiling.propagate(_profiled_work)).result()
+            pool.submit(_profiled_work).result()
+    finally:
+        stop.set()
+        other.join()
+    assert profiler.calls == {"pool_work": 1}
+    assert not any("_busy_unprofiled_work" in stack for stack in profiler.stacks)
+    assert any("_profiled_work" in stack for stack in profiler.stacks)
+    assert profiling.current() is None
@@ -0,0 +1,21 @@
+"""Forward-confirmed reverse DNS against a stand-in server"""
+from dns_debugger.ptr_sweep import check_address
+from dns_debugger.query import Resolver
+from tests.standin import Hierarchy, Zone
+
+SERVER = "127.0.0.1"
+
+
+def test_check_address_follows_cnames():
+    """PTR of a classless delegation (RFC 2317) and forward name are both behind a CNAME"""
+    hierarchy = Hierarchy({SERVER: Zone(origin=".", answers={
+        ("7.2.0.192.in-addr.arpa.", "CNAME"): ["7.0/25.2.0.192.in-addr.arpa."],
+        ("7.0/25.2.0.192.in-addr.arpa.", "PTR"): ["host.example."],
+        ("host.example.", "CNAME"): ["real.example."],
+        ("real.example.", "A"): ["192.0.2.7"],
+    })}).start()
+    try:
+        testcase = check_address("192.0.2.7", resolver=Resolver(ip_addr=SERVER, qname="standin.", port=hierarchy.port))
+    finally:
+        hierarchy.stop()
+    assert testcase.success, testcase.result
@@ -0,0 +1,66 @@
+"""Errors of the network layer are reported as query errors, so that one unreachable server does not stop a check"""
+import errno
+import socket
+
+import pytest
+
+from dns_debugger import profiling
+from dns_debugger.exceptions import QueryTimeException
+from dns_debugger.ptr_sweep import check_address
+from dns_debugger.query import IterativeResolver, Resolver, run_query
+from dns_debugger.records_models import DataType
+from tests.standin import Hierarchy, Zone
+
+SERVER = "127.0.0.1"
+UNREACHABLE = "2001:db8::1"
+
+
+@pytest.fixture(name="no_ipv6")
+def no_ipv6_fixture(monkeypatch):
+    """Queries to IPv6 addresses fail as on a host without IPv6 connectivity"""
+    class NoIpv6Socket(socket.socket):
+        """Socket failing to connect to IPv6 addresses"""
+
+        def connect(self, address):  # pylint: disable=arguments-differ
+            if self.family == socket.AF_INET6:
+                raise OSError(errno.ENETUNREACH, "Network is unreachable")
+            super(NoIpv6Socket, self).connect(address)
+
+    monkeypatch.setattr(socket, "socket", NoIpv6Socket)
+
+
+@pytest.fixture(name="hierarchy")
+def hierarchy_fixture():
+    hierarchy = Hierarchy({SERVER: Zone(origin=".", answers={("www.fr.", "A"): ["192.0.2.1"]})}).start()
+    yield hierarchy
+    hierarchy.stop()
+
+
+@pytest.mark.usefixtures("no_ipv6")
+def test_unreachable_network_is_a_query_error():
+    with pytest.raises(QueryTimeException, match="Network is unreachable"):
+        run_query(UNREACHABLE, "www.fr.", DataType.A, want_dnssec=False, use_cache=False)
+
+
+@pytest.mark.usefixtures("no_ipv6")
+def test_iterative_resolver_skips_unreachable_server(hierarchy):
+    resolver = IterativeResolver(hints=[("root.", SERVER)], port=hierarchy.port)
+    servers = [Resolver(ip_addr=UNREACHABLE, qname="a.root."), Resolver(ip_addr=SERVER, qname="b.root.")]
+    server, response = resolver._query_servers(servers, "www.fr.", DataType.A,  # pylint: disable=protected-access
+                                               want_dnssec=False)
+    assert server.ip_addr == SERVER
+    assert response.answer[0].to_text() == "www.fr. 300 IN A 192.0.2.1"
+
+
+@pytest.mark.usefixtures("no_ipv6")
+def test_ptr_sweep_reports_unreachable_resolver():
+    testcase = check_address("192.0.2.7", Resolver(ip_addr=UNREACHABLE, qname="resolver."))
+    assert not testcase.success
+    assert "Network is unreachable" in testcase.result
+
+
+def test_network_response_is_parsed_in_the_parse_stage(hierarchy):
+    with profiling.profile() as profiler:
+        run_query(SERVER, "www.fr.", DataType.A, want_dnssec=False, port=hierarchy.port, use_cache=False)
+    assert profiler.calls["network"] == 1
+    assert profiler.calls["parse"] == 1
@@ -0,0 +1,98 @@
+"""Rate limiter: token buckets per IP and provider, queries in flight, with an injected clock"""
+import contextlib
+import threading
+import time
+
+from dns_debugger.ratelimit import EVICTION_INTERVAL, RateLimiter, TokenBuckets
+from tests.standin import Clock
+
+WAIT = 5
+
+
+def _acquire_in_thread(limiter: RateLimiter, ip_addr: str):
+    """Enter limit(ip_addr) in a thread, return the granted event and the event releasing the query"""
+    granted, release = threading.Event(), threading.Event()
+
+    def query():
+        with limiter.limit(ip_addr):
+            granted.set()
+            release.wait(WAIT)
+
+    thread = threading.Thread(target=query, daemon=True)
+    thread.start()
+    return granted, release, thread
+
+
+def test_throttled_ip_does_not_block_other_ips_of_its_provider():
+    clock = Clock()
+    limiter = RateLimiter(ip_rate=1, clock=clock)
+    with limiter.limit("192.0.2.1"):
+        pass
+    throttled, release, thread = _acquire_in_thread(limiter, "192.0.2.1")
+    assert not throttled.wait(0.2)
+    with limiter.limit("192.0.2.2"):
+        assert not throttled.is_set()
+        clock.now = 1.0
+    assert throttled.wait(WAIT)
+    release.set()
+    thread.join()
+
+
+def test_queries_in_flight_are_bounded():
+    limiter = RateLimiter(ip_rate=1000, max_in_flight=2, clock=Clock())
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(limiter.limit("192.0.2.1"))
+        stack.enter_context(limiter.limit("198.51.100.1"))
+        granted, release, thread = _acquire_in_thread(limiter, "203.0.113.1")
+        assert not granted.wait(0.2)
+    assert granted.wait(WAIT)
+    release.set()
+    thread.join()
+
+
+def test_idle_buckets_are_evicted():
+    buckets = TokenBuckets(rate=1)
+    assert buckets.wait_time("192.0.2.1", now=0.0) == 0
+    buckets.take("192.0.2.1")
+    assert buckets.wait_time("192.0.2.2", now=0.5) == 0
+    assert len(buckets) == 2
+    assert buckets.wait_time("192.0.2.3", now=EVICTION_INTERVAL) == 0
+    assert len(buckets) == 1
+
+
+def test_no_rate_has_no_bucket():
+    buckets = TokenBuckets(rate=None)
+    assert buckets.wait_time("192.0.2.1", now=0.0) == 0
+    buckets.take("192.0.2.1")
+    assert len(buckets) == 0
+
+
+def test_waiting_queries_are_granted_round_robin_across_providers():
+    limiter = RateLimiter(ip_rate=1000, max_in_flight=1, clock=Clock())
+    granted = []
+
+    def query(ip_addr):
+        with limiter.limit(ip_addr):
+            granted.append(ip_addr)
+
+    threads = []
+    with limiter.limit("203.0.113.1"):
+        for ip_addr in ("192.0.2.1", "192.0.2.2", "198.51.100.1"):
+            threads.append(threading.Thread(target=query, args=(ip_addr,), daemon=True))
+            threads[-1].start()
+            _wait_until(lambda: _waiting(limiter) == len(threads))
+    for thread in threads:
+        thread.join(WAIT)
+    assert granted == ["192.0.2.1", "198.51.100.1", "192.0.2.2"]
+
+
+def _waiting(limiter: RateLimiter) -> int:
+    with limiter._lock:  # pylint: disable=protected-access
+        return sum(len(queue) for queue in limiter._waiting.values())  # pylint: disable=protected-access
+
+
+def _wait_until(condition):
+    deadline = time.monotonic() + WAIT
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
@@ -0,0 +1,87 @@
+"""Trust refresher scheduling with an injected clock, refreshes are recorded instead of queried"""
+import time
+
+from dns_debugger.dnssec import refresher, utils
+from dns_debugger.dnssec.refresher import TrustRefresher
+from dns_debugger.dnssec.utils import ValidatedRRSets, store_validated_rrset
+from dns_debugger.query import records_from_text
+from dns_debugger.records_models import DataType, RRSet
+from tests.standin import Clock
+
+LIFETIME = 100
+
+
+def _refresher(clock, refreshed, failing=(), lifetime=LIFETIME):
+    store = ValidatedRRSets(clock=clock)
+    trust_refresher = TrustRefresher(zones=["fr"], store=store, clock=clock)
+
+    def refresh_zone(zone):
+        refreshed.append(zone)
+        if zone in failing:
+            trust_refresher._failed[zone] = clock() + refresher.RETRY_DELAY  # pylint: disable=protected-access
+            return False
+        store.set(zone=zone, rdtype=DataType.DNSKEY.value, records=[], expires=clock() + lifetime)
+        return True
+
+    trust_refresher.refresh_zone = refresh_zone
+    return trust_refresher, store
+
+
+def test_zones_are_refreshed_at_prefetch_ratio_of_their_lifetime():
+    clock, refreshed = Clock(now=1000.0), []
+    trust_refresher, _ = _refresher(clock, refreshed)
+    trust_refresher.warm()
+    assert refreshed == [".", "fr."]
+    assert trust_refresher.due() == {".": 1000 + LIFETIME * refresher.PREFETCH_RATIO,
+                                     "fr.": 1000 + LIFETIME * refresher.PREFETCH_RATIO}
+    assert trust_refresher.run_once() == refresher.MAX_SLEEP
+    clock.now += LIFETIME * refresher.PREFETCH_RATIO
+    refreshed.clear()
+    trust_refresher.run_once()
+    assert refreshed == [".", "fr."]
+
+
+def test_unused_zones_are_not_refreshed():
+    clock, refreshed = Clock(now=1000.0), []
+    trust_refresher, store = _refresher(clock, refreshed)
+    trust_refresher.warm()
+    store.set(zone="example.", rdtype=DataType.DNSKEY.value, records=[], expires=clock() + LIFETIME)
+    clock.now += LIFETIME * refresher.PREFETCH_RATIO
+    refreshed.clear()
+    trust_refresher.run_once()
+    assert "example." not in refreshed
+    store.get(zone="example.", rdtype=DataType.DNSKEY.value)
+    trust_refresher.run_once()
+    assert "example." in refreshed
+
+
+def test_failed_zone_is_retried_after_retry_delay():
+    clock, refreshed = Clock(now=1000.0), []
+    trust_refresher, _ = _refresher(clock, refreshed, failing=("fr.",))
+    trust_refresher.warm()
+    assert trust_refresher.run_once() == refresher.RETRY_DELAY
+    clock.now += refresher.RETRY_DELAY
+    refreshed.clear()
+    trust_refresher.run_once()
+    assert refreshed == ["fr."]
+
+
+def test_aged_rrset_is_refreshed_when_it_expires():
+    clock, refreshed = Clock(now=1000.0), []
+    trust_refresher, _ = _refresher(clock, refreshed, lifetime=refresher.MIN_PREFETCH_LIFETIME - 10)
+    trust_refresher.warm()
+    assert trust_refresher.due()["fr."] == 1000 + refresher.MIN_PREFETCH_LIFETIME - 10
+
+
+def test_validated_rrset_is_stored_for_the_ttl_received(monkeypatch):
+    store = ValidatedRRSets()
+    monkeypatch.setattr(utils, "VALIDATED_RRSETS", store)
+    rrset = RRSet(rdata=None, records=records_from_text(DataType.DS.value, ["12345 13 2 " + "ab" * 32]),
+                  name="fr.", rdtype=DataType.DS.value, rdclass=1, ttl=100)
+    # the resolver served it 3500 seconds after it cached it
+    rrset.rrsig = records_from_text(DataType.RRSIG.value, [
+        "DS 13 1 3600 20300101000000 20200101000000 12345 . AAAA"])
+    store_validated_rrset(rrset)
+    (_, _, stored, expires, _), = store.entries()
+    assert stored <= time.time()
+    assert expires - stored <= 100
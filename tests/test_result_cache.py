@@ -0,0 +1,33 @@
+"""Result cache of the server with an injected clock"""
+from dns_debugger.ui.result_cache import ResultCache
+from tests.standin import Clock
+
+
+def test_results_expire_with_their_ttl_bounded_by_max_ttl():
+    clock = Clock(now=1000.0)
+    cache = ResultCache(max_ttl=60, clock=clock)
+    short = cache.set(("a.",), body="{}", ttl=10)
+    cache.set(("b.",), body="{}", ttl=3600)
+    assert cache.max_age(short) == 10
+    clock.now += 10
+    assert cache.get(("a.",)) is None
+    assert cache.max_age(cache.get(("b.",))) == 50
+    clock.now += 50
+    assert cache.get(("b.",)) is None
+
+
+def test_result_without_ttl_is_not_stored():
+    cache = ResultCache(clock=Clock(now=1000.0))
+    result = cache.set(("a.",), body="{}", ttl=None)
+    assert result.etag
+    assert cache.get(("a.",)) is None
+
+
+def test_least_recently_used_result_is_evicted():
+    cache = ResultCache(max_entries=2, clock=Clock(now=1000.0))
+    cache.set(("a.",), body="a", ttl=60)
+    cache.set(("b.",), body="b", ttl=60)
+    cache.get(("a.",))
+    cache.set(("c.",), body="c", ttl=60)
+    assert cache.get(("b.",)) is None
+    assert cache.get(("a.",)).body == "a"
@@ -0,0 +1,31 @@
+"""POST /batch runs zones on the shared pool and stops at the batch timeout"""
+import json
+import threading
+import time
+
+from dns_debugger.executors import testsuite
+from dns_debugger.ui import server
+
+CHECK_DURATION = 0.5
+
+
+def test_zones_are_not_started_after_the_timeout(monkeypatch):
+    started = []
+    lock = threading.Lock()
+
+    def slow_run_tests(qname, plan):  # pylint: disable=unused-argument
+        with lock:
+            started.append(qname)
+        time.sleep(CHECK_DURATION)
+        return testsuite.TestSuite()
+
+    monkeypatch.setattr(server, "run_tests", slow_run_tests)
+    monkeypatch.setitem(server.APP.config, "BATCH_TIMEOUT", CHECK_DURATION * 1.6)
+    monkeypatch.setattr(server.TRUST_REFRESHER, "start", lambda: None)
+    qnames = ["zone{}.test.".format(index) for index in range(server.BATCH_WORKERS * 3)]
+    response = server.APP.test_client().post("/batch", json={"qnames": qnames, "tests": ["simple_query"]})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[-1] == {"summary": {"zones": len(qnames), "done": server.BATCH_WORKERS}}
+    assert sum(line.get("error") == "Batch timeout reached" for line in lines) == len(qnames) - server.BATCH_WORKERS
+    time.sleep(CHECK_DURATION * 2)
+    assert len(started) == server.BATCH_WORKERS * 2
@@ -0,0 +1,67 @@
+"""GET /<qname> results are cached for the TTL of the zone, results with failures only briefly"""
+import contextlib
+import types
+
+import pytest
+
+from dns_debugger.executors import testsuite
+from dns_debugger.ui import server
+from dns_debugger.ui.result_cache import ResultCache
+from tests.standin import Clock
+
+ZONE_TTL = 300
+
+
+@pytest.fixture(name="checks")
+def checks_fixture(monkeypatch):
+    """Checks run by the server, each one fails if its zone is in failing, the zone TTL is ZONE_TTL"""
+    clock = Clock(now=1000.0)
+    checks = {"clock": clock, "run": [], "failing": set()}
+
+    def fake_run_tests(qname, plan):  # pylint: disable=unused-argument
+        checks["run"].append(qname)
+        suite = testsuite.TestSuite()
+        suite.add_testcase(testsuite.TestCase(description=qname, result="", success=qname not in checks["failing"]))
+        return suite
+
+    @contextlib.contextmanager
+    def fake_observe_ttls(qname):  # pylint: disable=unused-argument
+        yield types.SimpleNamespace(min_ttl=ZONE_TTL)
+
+    monkeypatch.setattr(server, "run_tests", fake_run_tests)
+    monkeypatch.setattr(server, "observe_ttls", fake_observe_ttls)
+    monkeypatch.setattr(server, "RESULT_CACHE", ResultCache(clock=clock))
+    monkeypatch.setattr(server.TRUST_REFRESHER, "start", lambda: None)
+    return checks
+
+
+def _get(qname):
+    response = server.APP.test_client().get("/" + qname)
+    assert response.status_code == 200
+    return response.headers["Cache-Control"]
+
+
+def test_successful_result_is_cached_for_the_zone_ttl(checks):
+    assert _get("example.fr") == "max-age={}".format(ZONE_TTL)
+    checks["clock"].now += ZONE_TTL - 1
+    _get("example.fr")
+    assert checks["run"] == ["example.fr"]
+
+
+def test_failing_result_is_cached_briefly(checks):
+    checks["failing"].add("broken.fr")
+    failure_ttl = server.APP.config["RESULT_FAILURE_TTL"]
+    assert _get("broken.fr") == "max-age={}".format(failure_ttl)
+    _get("broken.fr")
+    assert checks["run"] == ["broken.fr"]
+    checks["clock"].now += failure_ttl
+    _get("broken.fr")
+    assert checks["run"] == ["broken.fr", "broken.fr"]
+
+
+def test_failing_result_is_not_cached_without_failure_ttl(monkeypatch, checks):
+    monkeypatch.setitem(server.APP.config, "RESULT_FAILURE_TTL", 0)
+    checks["failing"].add("broken.fr")
+    assert _get("broken.fr") == "max-age=0"
+    _get("broken.fr")
+    assert checks["run"] == ["broken.fr", "broken.fr"]
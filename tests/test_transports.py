@@ -0,0 +1,71 @@
+"""Pooled DNS over TLS and DNS over HTTPS connections against local stand-in servers with a self-signed certificate"""
+import ssl
+
+import dns.message
+import pytest
+
+from dns_debugger.transports import HTTPS, TLS, Transports
+from tests.standin import TlsServer, Zone, self_signed_certificate
+
+ZONE = Zone(origin="example.", answers={("www.example.", "A"): ["192.0.2.1"]})
+
+
+@pytest.fixture(name="certfile", scope="module")
+def certfile_fixture(tmp_path_factory):
+    return self_signed_certificate(str(tmp_path_factory.mktemp("tls") / "server.pem"))
+
+
+@pytest.fixture(name="transports")
+def transports_fixture(certfile):
+    transports = Transports(context=ssl.create_default_context(cafile=certfile))
+    yield transports
+    transports.close()
+
+
+def _serve(certfile, doh=False):
+    return TlsServer(ZONE, certfile, doh=doh).start()
+
+
+def _query(transports, transport, server):
+    query = dns.message.make_query("www.example.", "A")
+    wire = transports.exchange(transport, ("127.0.0.1", server.port), query.to_wire(), timeout=2)
+    response = dns.message.from_wire(wire)
+    assert query.is_response(response)
+    return [rdata.to_text() for rdata in response.answer[0]]
+
+
+def test_tls_connection_is_reused_across_queries(certfile, transports):
+    server = _serve(certfile)
+    try:
+        for _ in range(3):
+            assert _query(transports, TLS, server) == ["192.0.2.1"]
+        assert server.queries == 3
+        assert server.connections == 1
+    finally:
+        server.stop()
+
+
+def test_tls_query_reconnects_after_server_closed_the_connection(certfile, transports):
+    server = _serve(certfile)
+    try:
+        assert _query(transports, TLS, server) == ["192.0.2.1"]
+        server.close_connections()
+        assert _query(transports, TLS, server) == ["192.0.2.1"]
+        assert server.connections == 2
+        assert server.queries == 2
+        # the new connection resumed the TLS session of the closed one
+        (connection,) = transports._idle[(TLS, ("127.0.0.1", server.port))]  # pylint: disable=protected-access
+        assert connection.sock.session_reused
+    finally:
+        server.stop()
+
+
+def test_doh_post_round_trip_on_a_kept_alive_connection(certfile, transports):
+    server = _serve(certfile, doh=True)
+    try:
+        assert _query(transports, HTTPS, server) == ["192.0.2.1"]
+        assert _query(transports, HTTPS, server) == ["192.0.2.1"]
+        assert server.queries == 2
+        assert server.connections == 1
+    finally:
+        server.stop()
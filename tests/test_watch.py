@@ -0,0 +1,63 @@
+"""Watcher scheduling with an injected clock and sleep, queries are answered by a fake dns_query"""
+from dns_debugger import watch
+from dns_debugger.exceptions import DnsDebuggerException
+from dns_debugger.query import Resolver, records_from_text
+from dns_debugger.records_models import DataType, RRSet
+
+RESOLVER = Resolver(ip_addr="192.0.2.53", qname="resolver.test.")
+TTLS = {DataType.SOA: 300, DataType.NS: 3600}
+
+
+class FakeTime:
+    """Clock advanced by sleep"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+def _rrset(rdtype: DataType, serial: int = 1) -> RRSet:
+    texts = {DataType.SOA: ["ns.example. hostmaster.example. {} 3600 600 86400 60".format(serial)],
+             DataType.NS: ["ns.example."]}[rdtype]
+    return RRSet(rdata=None, records=records_from_text(rdtype.value, texts), name="example.", rdtype=rdtype.value,
+                 rdclass=1, ttl=TTLS[rdtype])
+
+
+def _watcher(monkeypatch, fake_time, queried, serials=None):
+    """Watcher of example., DNSKEY queries fail, the SOA serial is taken from serials"""
+    def fake_dns_query(qname, rdtype, want_dnssec=False, resolver=None):  # pylint: disable=unused-argument
+        queried.setdefault(rdtype, []).append(fake_time.now)
+        if rdtype == DataType.DNSKEY:
+            raise DnsDebuggerException(message="No DNSKEY")
+        return _rrset(rdtype, serial=serials.pop(0) if serials and rdtype == DataType.SOA else 1)
+
+    monkeypatch.setattr(watch, "dns_query", fake_dns_query)
+    return watch.Watcher(qnames=["example"], resolver=RESOLVER, clock=fake_time.clock, sleep=fake_time.sleep)
+
+
+def test_entries_are_checked_again_when_due(monkeypatch):
+    fake_time, queried = FakeTime(), {}
+    watcher = _watcher(monkeypatch, fake_time, queried)
+    testcases = list(watcher.run(iterations=11))
+    assert fake_time.now == 1600
+    assert queried[DataType.SOA] == [1000, 1300, 1600]
+    assert queried[DataType.NS] == [1000]
+    assert queried[DataType.DNSKEY] == [1000 + step * watch.RETRY_INTERVAL for step in range(11)]
+    assert set(fake_time.sleeps) == {watch.RETRY_INTERVAL}
+    # a failure is reported once, not at each retry
+    assert [testcase.result for testcase in testcases] == ["No DNSKEY"]
+
+
+def test_serial_change_is_reported(monkeypatch):
+    fake_time, queried = FakeTime(), {}
+    watcher = _watcher(monkeypatch, fake_time, queried, serials=[1, 2])
+    testcases = [testcase for testcase in watcher.run(iterations=6) if testcase.success]
+    assert queried[DataType.SOA] == [1000, 1300]
+    assert [testcase.result for testcase in testcases] == ["SOA serial changed from 1 to 2"]
@@ -0,0 +1,122 @@
+"""Zone audit: grouping of the AXFR records into RRSETs, delegation points, and audit of a stand-in zone"""
+import datetime
+
+import dns.rrset
+import pytest
+
+from dns_debugger.records_models import DataType
+from dns_debugger.zone_audit import RRSetData, SplitOwner, _Delegations, _OwnerGrouping, audit_zone, verify_batch
+from tests.signing import ZoneSigner
+from tests.standin import Hierarchy, Zone
+
+PRIMARY = "127.0.0.1"
+
+
+def _group(rrsets):
+    grouping = _OwnerGrouping()
+    grouped = []
+    for rrset in rrsets:
+        grouped.extend(grouping.add(rrset))
+    return grouped + list(grouping.flush())
+
+
+def test_owner_name_split_in_the_transfer_is_reported_each_time_it_appears_again():
+    grouped = _group([
+        dns.rrset.from_text("a.example.", 300, "IN", "A", "192.0.2.1"),
+        dns.rrset.from_text("b.example.", 300, "IN", "A", "192.0.2.2"),
+        dns.rrset.from_text("a.example.", 300, "IN", "RRSIG",
+                            "A 8 2 300 20300101000000 20200101000000 12345 example. AAAA"),
+        dns.rrset.from_text("b.example.", 300, "IN", "TXT", "x"),
+        dns.rrset.from_text("a.example.", 300, "IN", "TXT", "y"),
+    ])
+    assert [data.name for data in grouped if isinstance(data, RRSetData)] == ["a.example.", "b.example."]
+    assert [data for data in grouped if isinstance(data, SplitOwner)] == [SplitOwner(name="a.example."),
+                                                                         SplitOwner(name="b.example."),
+                                                                         SplitOwner(name="a.example.")]
+
+
+def test_owner_names_in_canonical_order_are_not_split():
+    grouped = _group([
+        dns.rrset.from_text("example.", 300, "IN", "NS", "ns.example."),
+        dns.rrset.from_text("sub.example.", 300, "IN", "NS", "ns.sub.example."),
+        dns.rrset.from_text("ns.sub.example.", 300, "IN", "A", "192.0.2.1"),
+        dns.rrset.from_text("WWW.example.", 300, "IN", "A", "192.0.2.2"),
+        dns.rrset.from_text("www.example.", 300, "IN", "TXT", "x"),
+    ])
+    assert [(data.name, data.rdtype) for data in grouped] == [
+        ("example.", DataType.NS.value), ("sub.example.", DataType.NS.value), ("ns.sub.example.", DataType.A.value),
+        ("WWW.example.", DataType.A.value), ("WWW.example.", DataType.TXT.value)]
+
+
+def _data(name, rdtype):
+    return RRSetData(name=name, rdtype=rdtype.value, ttl=300, records=[], rrsig=[])
+
+
+def test_delegation_point_ds_and_nsec_are_signed():
+    delegations = _Delegations("example.")
+    assert delegations.is_unsigned(_data("sub.example.", DataType.NS))
+    assert not delegations.is_unsigned(_data("sub.example.", DataType.DS))
+    assert not delegations.is_unsigned(_data("sub.example.", DataType.NSEC))
+    assert delegations.is_unsigned(_data("ns.sub.example.", DataType.A))
+    assert delegations.is_unsigned(_data("ns.sub.example.", DataType.NSEC))
+    assert not delegations.is_unsigned(_data("example.", DataType.NS))
+
+
+@pytest.fixture(name="signer", scope="module")
+def signer_fixture():
+    return ZoneSigner("example.")
+
+
+def _primary(signer, answers, unsigned=()):
+    answers = {("example.", "SOA"): ["ns.example. hostmaster.example. 1 3600 600 86400 60"],
+               ("example.", "NS"): ["ns.example."],
+               ("example.", "DNSKEY"): [signer.dnskey], **answers}
+    return Hierarchy({PRIMARY: Zone(origin="example.", answers=signer.sign_answers(answers, unsigned))},
+                     tcp=True).start()
+
+
+def _audit(hierarchy):
+    try:
+        return list(audit_zone("example.", PRIMARY, port=hierarchy.port, workers=1))
+    finally:
+        hierarchy.stop()
+
+
+def test_audit_of_a_signed_zone(signer):
+    testcases = _audit(_primary(signer, {
+        ("sub.example.", "NS"): ["ns.sub.example."],
+        ("ns.sub.example.", "A"): ["192.0.2.53"],
+        ("www.example.", "A"): ["192.0.2.1"],
+        ("www.example.", "TXT"): ["text"],
+    }, unsigned=[("sub.example.", "NS"), ("ns.sub.example.", "A")]))
+    assert [(testcase.result, testcase.success) for testcase in testcases] == [("5 RRSETs checked, 0 problems", True)]
+
+
+def test_audit_reports_each_problem(signer):
+    hierarchy = _primary(signer, {
+        ("expiring.example.", "A"): ["192.0.2.2"],
+        ("unsigned.example.", "A"): ["192.0.2.3"],
+        ("www.example.", "A"): ["192.0.2.1"],
+        ("a.example.", "TXT"): ["out of order"],
+    }, unsigned=[("unsigned.example.", "A")])
+    zone = hierarchy.servers[PRIMARY]
+    soon = datetime.datetime.utcnow() + datetime.timedelta(days=2)
+    zone.answers[("expiring.example.", "RRSIG")] = [signer.sign("expiring.example.", "A", ["192.0.2.2"], soon)]
+    zone.answers[("www.example.", "A")] = ["192.0.2.99"]
+    results = {testcase.description: testcase.result for testcase in _audit(hierarchy)}
+    assert results["Checking RRSIG of expiring.example. A"].endswith("expires in 47 hours")
+    assert results["Checking RRSIG of unsigned.example. A"] == "RRSET is not signed"
+    assert results["Checking RRSIG of www.example. A"] == "RRSIG {} is not valid".format(signer.key_tag)
+    assert results["Checking RRSETs of a.example."].startswith("Owner name is not in canonical order")
+    assert results["Auditing DNSSEC of every RRSET of example."] == "5 RRSETs checked, 4 problems"
+
+
+def test_invalid_record_is_reported_without_stopping_the_batch(signer):
+    rrsig = signer.sign("www.example.", "A", ["192.0.2.1"])
+    batch = [RRSetData(name="bad.example.", rdtype=DataType.A.value, ttl=300, records=["not-an-address"],
+                       rrsig=[rrsig]),
+             RRSetData(name="www.example.", rdtype=DataType.A.value, ttl=300, records=["192.0.2.1"], rrsig=[rrsig])]
+    verified, problems = verify_batch((signer.dnskey,), batch, now=datetime.datetime(2025, 1, 1).timestamp())
+    assert verified == 2
+    assert [(problem.description, problem.result.startswith("Invalid RRSET")) for problem in problems] == [
+        ("Checking RRSIG of bad.example. A", True)]